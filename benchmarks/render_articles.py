@@ -0,0 +1,64 @@
+"""
+Benchmark the rendering of articles to formatted Markdown: the specialized
+converter of `catleg.legi_markdown` against markdownify and mdformat, on the
+test fixtures.
+
+    python benchmarks/render_articles.py [repetitions]
+"""
+
+import json
+import sys
+import timeit
+from pathlib import Path
+
+import mdformat
+from catleg.render import _format_batch, MDFORMAT_OPTIONS
+from markdownify import markdownify as md  # type: ignore
+
+FIXTURES = Path(__file__).parent.parent / "tests"
+
+
+def load_articles() -> list[tuple[str, str]]:
+    articles = []
+    for path in sorted(FIXTURES.glob("*.json")):
+        reply = json.loads(path.read_text())
+        article = reply.get("article") or reply["text"]
+        articles.append((article["texteHtml"], article.get("notaHtml") or ""))
+    return articles
+
+
+def render_with_libraries(articles: list[tuple[str, str]]) -> list[str]:
+    rendered = []
+    for text_html, nota_html in articles:
+        text_md = md(text_html, strip=["a"]).strip()
+        if len(nota_html):
+            nota_md = md(nota_html, strip=["a"]).strip()
+            text_md += f"\n\nNOTA :\n\n{nota_md}"
+        rendered.append(mdformat.text(text_md, options=MDFORMAT_OPTIONS))
+    return rendered
+
+
+def render_specialized(articles: list[tuple[str, str]]) -> list[str]:
+    return [formatted for formatted, _, _ in _format_batch(articles)]
+
+
+def main():
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    articles = load_articles()
+    assert render_specialized(articles) == render_with_libraries(articles)
+    timings = {}
+    for name, render in [
+        ("markdownify + mdformat", render_with_libraries),
+        ("legi_markdown", render_specialized),
+    ]:
+        seconds = min(
+            timeit.repeat(lambda: render(articles), number=repetitions, repeat=3)
+        )
+        timings[name] = seconds / (repetitions * len(articles))
+        print(f"{name:>24}: {timings[name] * 1000:.3f} ms per article")
+    speedup = timings["markdownify + mdformat"] / timings["legi_markdown"]
+    print(f"{'speedup':>24}: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Persistent (SQLite-backed) cache for raw Legifrance article replies.
+
+Entries are keyed by normalized article identifier and store the JSON
+reply as returned by the API. Each entry either expires after a configurable
+time-to-live or never expires (for article versions that cannot change
+anymore, see `LegifranceBackend`). When the cache grows beyond its size
+limit, least recently used entries are evicted.
+"""
+
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+
+from catleg.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id TEXT PRIMARY KEY,
+    reply TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    expires_at REAL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS articles_last_access ON articles(last_access);
+"""
+
+
+class ArticleCache:
+    """
+    Article reply cache stored in a SQLite database.
+
+    Parameters
+    ----------
+    path: Path
+       Location of the SQLite database (created if needed)
+    ttl: float
+       Lifetime, in seconds, of entries that are not permanent
+    max_size: int
+       Maximum total size (in bytes) of cached replies; least recently
+       used entries are evicted beyond that size
+    """
+
+    def __init__(self, path: Path, *, ttl: float, max_size: int):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.executescript(_SCHEMA)
+
+    def get(self, article_id: str) -> dict | None:
+        """
+        Return the cached reply for `article_id`, or None if it is
+        missing or stale.
+        """
+        now = time.time()
+        row = self._db.execute(
+            "SELECT reply, expires_at FROM articles WHERE id = ?",
+            (article_id.upper(),),
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache="article", result="miss")
+            return None
+        with self._db:
+            self._db.execute(
+                "UPDATE articles SET last_access = ? WHERE id = ?",
+                (now, article_id.upper()),
+            )
+        self.hits += 1
+        CACHE_LOOKUPS.inc(cache="article", result="hit")
+        return json.loads(row[0])
+
+    def put(self, article_id: str, reply: dict, *, permanent: bool = False):
+        """
+        Store a reply. Permanent entries never expire (they may still be
+        evicted when the cache is full).
+        """
+        now = time.time()
+        payload = json.dumps(reply, ensure_ascii=False)
+        expires_at = None if permanent else now + self.ttl
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO articles "
+                "(id, reply, size, fetched_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (article_id.upper(), payload, len(payload), now, expires_at, now),
+            )
+        self._evict()
+
+    def clear(self):
+        with self._db:
+            self._db.execute("DELETE FROM articles")
+
+    def close(self):
+        self._db.close()
+
+    def _evict(self):
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM articles"
+        ).fetchone()
+        if total <= self.max_size:
+            return
+        excess = total - self.max_size
+        evicted = []
+        for article_id, size in self._db.execute(
+            "SELECT id, size FROM articles ORDER BY last_access"
+        ):
+            if excess <= 0:
+                break
+            evicted.append((article_id,))
+            excess -= size
+        with self._db:
+            self._db.executemany("DELETE FROM articles WHERE id = ?", evicted)
+        logger.debug("Evicted %d entries from article cache", len(evicted))
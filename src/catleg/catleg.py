@@ -1,18 +1,28 @@
 import asyncio
 import json
+import sys
+from collections.abc import AsyncIterator, Awaitable, Coroutine
 from pathlib import Path
-from typing import Annotated
+from typing import Annotated, TypeVar
 
 import typer
 
-from catleg.check_expiry import check_expiry as expiry
-from catleg.cli_util import article_id_or_url, parse_legifrance_url, set_basic_loglevel
-from catleg.find_changes import find_changes
-from catleg.query import get_backend
+from catleg.check_expiry import check_expiry_in_files, watch_expiry
+from catleg.cli_util import (
+    article_id_or_url,
+    catala_files,
+    configure_article_cache,
+    configure_diff_engine,
+    parse_legifrance_url,
+    set_basic_loglevel,
+)
+from catleg.find_changes import find_changes_in_files, watch_changes
+from catleg.legi_dump import LegiDump
+from catleg.query import aclose_backends, get_backend, local_db_path, UnsupportedRequest
 from catleg.skeleton import (
     article_skeleton as askel,
-    jorf_markdown_skeleton,
-    markdown_skeleton,
+    iter_jorf_markdown_skeleton,
+    iter_markdown_skeleton,
 )
 
 app = typer.Typer(
@@ -24,6 +34,24 @@ app = typer.Typer(
 # raw JSON)
 lf = typer.Typer()
 app.add_typer(lf, name="lf", help="Commands for querying the raw Legifrance API")
+# commands for managing the local (offline) copy of LEGI/JORF dumps
+local = typer.Typer()
+app.add_typer(
+    local, name="local", help="Commands for managing a local copy of LEGI/JORF dumps"
+)
+
+
+T = TypeVar("T")
+
+
+async def _closing_backends(main: Awaitable[T]) -> T:
+    """
+    Await `main`, then close the backends shared in the event loop.
+    """
+    try:
+        return await main
+    finally:
+        await aclose_backends()
 
 
 def _article(aid_or_url: str, breadcrumbs: bool):
@@ -31,7 +59,7 @@ def _article(aid_or_url: str, breadcrumbs: bool):
     if article_id is None:
         raise ValueError(f"Sorry, I do not know how to process {aid_or_url}")
 
-    skel = asyncio.run(askel(article_id, breadcrumbs=breadcrumbs))
+    skel = asyncio.run(_closing_backends(askel(article_id, breadcrumbs=breadcrumbs)))
     return skel
 
 
@@ -59,41 +87,130 @@ def article(
     print(_article(aid_or_url, not nb))
 
 
+NoCacheOption = Annotated[
+    bool,
+    typer.Option(
+        "--no-cache", help="Do not use the persistent article cache (always fetch)."
+    ),
+]
+RefreshOption = Annotated[
+    bool,
+    typer.Option(
+        "--refresh", help="Ignore cached articles and refresh them from Legifrance."
+    ),
+]
+
+WatchOption = Annotated[
+    bool,
+    typer.Option(
+        "--watch",
+        help="Keep running, and check files again whenever they are modified.",
+    ),
+]
+
+
+FilesArgument = Annotated[
+    list[Path],
+    typer.Argument(
+        help="Catala files, directories (searched for Catala files) "
+        "or glob patterns.",
+        show_default=False,
+    ),
+]
+
+
+def _catala_files(args: list[Path]) -> list[Path]:
+    try:
+        return catala_files(args)
+    except FileNotFoundError as e:
+        raise typer.BadParameter(str(e), param_hint="FILES")
+
+
+def _watch(main: Coroutine):
+    try:
+        asyncio.run(main)
+    except KeyboardInterrupt:
+        pass
+
+
 @app.command()
-def diff(file: Path):
+def diff(
+    files: FilesArgument,
+    no_cache: NoCacheOption = False,
+    refresh: RefreshOption = False,
+    color: Annotated[
+        bool, typer.Option(help="Highlight changes with colors (as git).")
+    ] = True,
+    git: Annotated[
+        bool, typer.Option("--git", help="Compute diffs with git (requires git).")
+    ] = False,
+    full: Annotated[
+        bool,
+        typer.Option(
+            "--full",
+            help="Also diff articles that are unchanged since the previous run.",
+        ),
+    ] = False,
+    watch: WatchOption = False,
+):
     """
-    Show differences between each article in a catala file and
+    Show differences between each article in catala files and
     a reference version.
     """
-    with open(file) as f:
-        asyncio.run(find_changes(f, file_path=file))
+    configure_article_cache(no_cache=no_cache, refresh=refresh)
+    configure_diff_engine(git=git)
+    paths = _catala_files(files)
+    if watch:
+        _watch(watch_changes(paths, color=color, full=full))
+        return
+    retcode = asyncio.run(find_changes_in_files(paths, color=color, full=full))
+    raise typer.Exit(retcode)
 
 
 @app.command()
-def check_expiry(file: Path):
+def check_expiry(
+    files: FilesArgument,
+    no_cache: NoCacheOption = False,
+    refresh: RefreshOption = False,
+    watch: WatchOption = False,
+):
     """
-    Check articles in a catala file for expiry.
+    Check articles in catala files for expiry.
     """
-    with open(file) as f:
-        retcode = asyncio.run(expiry(f, file_path=file))
-        raise typer.Exit(retcode)
+    configure_article_cache(no_cache=no_cache, refresh=refresh)
+    paths = _catala_files(files)
+    if watch:
+        _watch(watch_expiry(paths))
+        return
+    retcode = asyncio.run(check_expiry_in_files(paths))
+    raise typer.Exit(retcode)
 
 
-def _skeleton(url_or_textid: str, sectionid: str | None = None):
+def _section_ids(url_or_textid: str, sectionid: str | None = None) -> tuple[str, str]:
     """
-    Output a given section of a law text.
+    Return the text and section identifiers of a section.
     """
     if sectionid is not None:
-        textid = url_or_textid
-    else:
-        res = parse_legifrance_url(url_or_textid)
-        match res:
-            case ["section", textid, sectionid]:
-                textid, sectionid = textid, sectionid
-            case _:
-                raise ValueError(f"Sorry, I do not know how to process {url_or_textid}")
-    skel = asyncio.run(markdown_skeleton(textid, sectionid))
-    return skel
+        return url_or_textid, sectionid
+    res = parse_legifrance_url(url_or_textid)
+    match res:
+        case ["section", textid, sectionid]:
+            return textid, sectionid
+        case _:
+            raise ValueError(f"Sorry, I do not know how to process {url_or_textid}")
+
+
+async def _print_parts(parts: AsyncIterator[str]):
+    """
+    Print skeleton parts as soon as they are generated,
+    separated by blank lines.
+    """
+    separator = ""
+    async for part in parts:
+        sys.stdout.write(separator + part)
+        sys.stdout.flush()
+        separator = "\n\n"
+    sys.stdout.write("\n")
 
 
 @app.command()
@@ -112,12 +229,22 @@ def skeleton(
             "a text ID and a section ID."
         ),
     ] = None,
+    bulk: Annotated[
+        bool,
+        typer.Option(
+            help="Retrieve the whole section in a single request "
+            "(articles missing from the reply are fetched individually)."
+        ),
+    ] = False,
 ):
     """
     Output a Markdown-formatted rendering of
     a section of a law text.
     """
-    print(_skeleton(url_or_textid, sectionid))
+    textid, sectionid = _section_ids(url_or_textid, sectionid)
+    _run_supported(
+        _print_parts(iter_markdown_skeleton(textid, sectionid, bulk=bulk or None))
+    )
 
 
 # TODO accept urls
@@ -126,7 +253,15 @@ def jorf(jorftextid: str):
     """
     Output a markdown-formatted Journal Officiel text (JORFTEXT)
     """
-    print(asyncio.run(jorf_markdown_skeleton(jorftextid)))
+    _run_supported(_print_parts(iter_jorf_markdown_skeleton(jorftextid)))
+
+
+def _run_supported(main: Coroutine):
+    try:
+        asyncio.run(_closing_backends(main))
+    except UnsupportedRequest as e:
+        typer.echo(f"Error: {e}", err=True)
+        raise typer.Exit(1)
 
 
 def _lf_article(aid_or_url: str):
@@ -134,8 +269,18 @@ def _lf_article(aid_or_url: str):
     if article_id is None:
         raise ValueError(f"Sorry, I do not know how to fetch {aid_or_url}")
 
-    back = get_backend("legifrance")
-    return asyncio.run(back.query_article_legi(article_id))
+    return _lf_query("query_article_legi", article_id)
+
+
+def _lf_query(method: str, *args):
+    """
+    Call `method` of the Legifrance backend.
+    """
+
+    async def query():
+        return await getattr(get_backend("legifrance"), method)(*args)
+
+    return asyncio.run(_closing_backends(query()))
 
 
 @lf.command("article")
@@ -166,8 +311,7 @@ def codes():
     """
     Retrieve a JSON list of available codes.
     """
-    back = get_backend("legifrance")
-    print(json.dumps(asyncio.run(back.list_codes()), indent=2, ensure_ascii=False))
+    print(json.dumps(_lf_query("list_codes"), indent=2, ensure_ascii=False))
 
 
 @lf.command()
@@ -175,8 +319,7 @@ def toc(code: str):
     """
     Retrieve the JSON table of contents for a given code.
     """
-    back = get_backend("legifrance")
-    print(json.dumps(asyncio.run(back.code_toc(code)), indent=2, ensure_ascii=False))
+    print(json.dumps(_lf_query("code_toc", code), indent=2, ensure_ascii=False))
 
 
 @lf.command("jorf")
@@ -185,8 +328,7 @@ def jorf_json(id: str):
     Retrieve the JSON contents of a JORF (Journal Officiel)
     text.
     """
-    back = get_backend("legifrance")
-    print(json.dumps(asyncio.run(back.jorf(id)), indent=2, ensure_ascii=False))
+    print(json.dumps(_lf_query("jorf", id), indent=2, ensure_ascii=False))
 
 
 @lf.command()
@@ -194,8 +336,36 @@ def legi(id: str):
     """
     Retrieve the JSON contents of a LEGI text
     """
-    back = get_backend("legifrance")
-    print(json.dumps(asyncio.run(back.legiPart(id)), indent=2, ensure_ascii=False))
+    print(json.dumps(_lf_query("legiPart", id), indent=2, ensure_ascii=False))
+
+
+@local.command()
+def ingest(
+    archives: Annotated[
+        list[Path],
+        typer.Argument(
+            help="DILA LEGI or JORF dump archives (`.tar.gz`), full or incremental. "
+            "Incremental archives must be ingested in chronological order."
+        ),
+    ],
+    db: Annotated[
+        Path | None,
+        typer.Option(
+            help="Database location (defaults to the `local_db_path` setting)"
+        ),
+    ] = None,
+):
+    """
+    Ingest DILA dump archives into the local database used by the `local`
+    backend.
+    """
+    dump = LegiDump(db or local_db_path())
+    try:
+        for archive in archives:
+            count = dump.ingest(archive)
+            print(f"{archive}: ingested {count} documents", file=sys.stderr)
+    finally:
+        dump.close()
 
 
 def main():
@@ -1,12 +1,15 @@
 import logging
 import sys
-import warnings
+from collections.abc import Sequence
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import TextIO
 
-from catleg.parse_catala_markdown import parse_catala_file
-from catleg.query import get_backend
+from catleg.find_changes import fetch_reference_articles, ReferenceArticles
+from catleg.law_text_fr import CatalaFileArticle
+from catleg.parse_cache import parse_catala_file_cached, parse_catala_files
+from catleg.query import aclose_backends
+from catleg.watch import watch_files
 
 
 logger = logging.getLogger(__name__)
@@ -14,16 +17,67 @@ logger = logging.getLogger(__name__)
 
 async def check_expiry(f: TextIO, *, file_path: Path | None = None):
     # parse articles from file
-    articles = parse_catala_file(f, file_path=file_path)
+    articles = parse_catala_file_cached(f, file_path=file_path)
 
-    back = get_backend("legifrance")
-    ref_articles = await back.articles([article.id.upper() for article in articles])
-    has_expired_articles = False
+    ref_articles = await fetch_reference_articles(articles)
+    return _report_expiry(articles, ref_articles)
+
+
+async def check_expiry_in_files(paths: Sequence[Path]):
+    """
+    Check articles of several Catala files for expiry. Files are parsed
+    first, then all the articles they reference are retrieved at once.
+    """
+    try:
+        return await _check_expiry_in_files(paths)
+    finally:
+        await aclose_backends()
+
+
+async def _check_expiry_in_files(paths: Sequence[Path]) -> int:
+    files_articles = parse_catala_files(paths)
+    ref_articles = await fetch_reference_articles(
+        [article for articles in files_articles for article in articles]
+    )
+    retcodes = [_report_expiry(articles, ref_articles) for articles in files_articles]
+    return max(retcodes, default=0)
+
+
+async def watch_expiry(paths: Sequence[Path], *, interval: float | None = None):
+    """
+    Check articles of several Catala files for expiry, then watch them:
+    when a file is modified, its articles are checked again.
+
+    Backends are kept open between checks, until the task is cancelled.
+    """
+    try:
+        await _check_expiry_in_files(paths)
+        print(
+            f"Watching {len(paths)} files for changes (press Ctrl-C to stop)",
+            file=sys.stderr,
+        )
+        async for modified in watch_files(paths, interval=interval):
+            await _check_expiry_in_files(modified)
+    finally:
+        await aclose_backends()
+
+
+def _report_expiry(
+    articles: Sequence[CatalaFileArticle],
+    ref_articles: ReferenceArticles,
+) -> int:
+    """
+    Report expired (or expiring) articles. Returns 1 if some articles have
+    expired or could not be retrieved because of an error, 0 otherwise.
+    """
+    has_expired_articles = has_errors = False
     now = datetime.now(timezone.utc)
 
-    for article, ref_article in zip(articles, ref_articles):
+    for article in articles:
+        ref_article = ref_articles[article.id.upper()]
         if ref_article is None:
-            warnings.warn(f"Could not retrieve article '{article.id}'")
+            ref_articles.warn_missing(article.id)
+            has_errors = has_errors or article.id.upper() in ref_articles.errors
             continue
 
         if article.is_archive:
@@ -62,4 +116,4 @@ async def check_expiry(f: TextIO, *, file_path: Path | None = None):
                     file=sys.stderr,
                 )
 
-    return 0 if not has_expired_articles else 1
+    return 0 if not (has_expired_articles or has_errors) else 1
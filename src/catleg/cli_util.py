@@ -1,3 +1,6 @@
+import glob
+from collections.abc import Iterable
+from pathlib import Path
 from typing import Literal
 from urllib.parse import urlparse
 
@@ -20,6 +23,56 @@ def set_basic_loglevel():
         logging.basicConfig(level=log_level.upper())
 
 
+def configure_article_cache(*, no_cache: bool = False, refresh: bool = False):
+    """
+    Override article cache settings from CLI options.
+
+    `no_cache` disables the persistent article cache altogether,
+    `refresh` bypasses cached replies (but updates the cache with fresh ones).
+    """
+    if no_cache:
+        settings.set("article_cache", False)
+    if refresh:
+        settings.set("article_cache_refresh", True)
+
+
+def configure_diff_engine(*, git: bool = False):
+    """
+    Override the diff engine setting from CLI options: `git` computes diffs
+    with git rather than in process.
+    """
+    if git:
+        settings.set("diff_engine", "git")
+
+
+def catala_files(args: Iterable[Path]) -> list[Path]:
+    """
+    Expand command-line arguments to a list of Catala files: files are kept
+    as is, directories are searched recursively for Catala files
+    (`*.catala_*`), and arguments that do not exist are expanded as
+    (possibly recursive, with `**`) glob patterns.
+    """
+    files: list[Path] = []
+    for arg in args:
+        if arg.is_dir():
+            files.extend(sorted(p for p in arg.rglob("*.catala_*") if p.is_file()))
+        elif arg.exists() or not any(c in str(arg) for c in "*?["):
+            files.append(arg)
+        else:
+            matches = sorted(glob.glob(str(arg), recursive=True))
+            if not matches:
+                raise FileNotFoundError(f"No file matches '{arg}'")
+            files.extend(Path(match) for match in matches)
+    # a file may be given (or matched) several times
+    seen = set()
+    unique_files = []
+    for path in files:
+        if path.resolve() not in seen:
+            seen.add(path.resolve())
+            unique_files.append(path)
+    return unique_files
+
+
 def article_id_or_url(candidate: str) -> str | None:
     match find_id_in_string(candidate, strict=True):
         case (_, article_id):
@@ -1,3 +1,6 @@
+import os
+from pathlib import Path
+
 from dynaconf import Dynaconf  # type:ignore
 
 settings = Dynaconf(
@@ -7,3 +10,18 @@ settings = Dynaconf(
 
 # `envvar_prefix` = export envvars with `export DYNACONF_FOO=bar`.
 # `settings_files` = Load these files in the order.
+
+
+def cache_dir() -> Path:
+    """
+    Directory where catleg keeps its persistent caches.
+
+    Set `cache_dir` in the configuration (or CATLEG_CACHE_DIR in the
+    environment) to override the default, which follows the XDG convention
+    (`~/.cache/catleg`).
+    """
+    configured = settings.get("cache_dir")
+    if configured:
+        return Path(configured).expanduser()
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(xdg_cache_home) / "catleg"
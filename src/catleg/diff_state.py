@@ -0,0 +1,94 @@
+"""
+State of previous `catleg diff` runs (SQLite-backed).
+
+For each article of a Catala file, the state records hashes of the texts
+that were last compared (the local text and the reference version), and
+whether they differed. Articles whose local text and reference version have
+not changed since are not diffed again.
+"""
+
+import hashlib
+import sqlite3
+from pathlib import Path
+
+from catleg.config import cache_dir, settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    file TEXT NOT NULL,
+    id TEXT NOT NULL,
+    local_hash TEXT NOT NULL,
+    ref_hash TEXT NOT NULL,
+    differs INTEGER NOT NULL,
+    PRIMARY KEY (file, id)
+);
+"""
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DiffState:
+    """
+    Diff state stored in a SQLite database at `path` (created if needed).
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.executescript(_SCHEMA)
+
+    def get(self, file: Path | None, article_id: str) -> tuple[str, str, bool] | None:
+        """
+        Return the (local text hash, reference text hash, whether they
+        differed) recorded for an article of Catala file `file`, or None.
+        """
+        row = self._db.execute(
+            "SELECT local_hash, ref_hash, differs FROM articles "
+            "WHERE file = ? AND id = ?",
+            (_file_key(file), article_id.upper()),
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], bool(row[2])
+
+    def put(
+        self,
+        file: Path | None,
+        article_id: str,
+        local_hash: str,
+        ref_hash: str,
+        differs: bool,
+    ):
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO articles "
+                "(file, id, local_hash, ref_hash, differs) VALUES (?, ?, ?, ?, ?)",
+                (_file_key(file), article_id.upper(), local_hash, ref_hash, differs),
+            )
+
+    def close(self):
+        self._db.close()
+
+
+def _file_key(file: Path | None) -> str:
+    return str(file.resolve()) if file is not None else ""
+
+
+_diff_state: DiffState | None = None
+
+
+def get_diff_state() -> DiffState | None:
+    """
+    Return the diff state configured in settings (`diff_state`, default
+    true, and `diff_state_path`), or None if it is disabled.
+    """
+    global _diff_state
+    if not settings.get("diff_state", True):
+        return None
+    path = Path(settings.get("diff_state_path") or cache_dir() / "diff_state.sqlite")
+    if _diff_state is None or _diff_state.path != path:
+        _diff_state = DiffState(path)
+    return _diff_state
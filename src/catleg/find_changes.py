@@ -1,39 +1,234 @@
 import sys
 import warnings
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
 from pathlib import Path
 from typing import TextIO
 
-from catleg.git_diff import wdiff
+from catleg.diff_state import DiffState, get_diff_state, text_hash
+from catleg.law_text_fr import CatalaFileArticle
 
-from catleg.parse_catala_markdown import parse_catala_file
-from catleg.query import get_backend
+from catleg.parse_cache import parse_catala_file_cached, parse_catala_files
+from catleg.query import aclose_backends, get_backend, LegifranceArticle
+from catleg.watch import watch_files
+from catleg.word_diff import wdiff
 
 
-async def find_changes(f: TextIO, *, file_path: Path | None = None):
+async def find_changes(
+    f: TextIO, *, file_path: Path | None = None, color: bool = True
+) -> int:
+    """
+    Show differences in a Catala file. Returns 1 if some articles could not
+    be retrieved because of an error, 0 otherwise.
+    """
     # parse articles from file
-    articles = parse_catala_file(f, file_path=file_path)
+    articles = parse_catala_file_cached(f, file_path=file_path)
 
     # fetch articles' reference text
     # compute diff
     # display diff
-    back = get_backend("legifrance")
-    ref_articles = await back.articles([article.id.upper() for article in articles])
+    ref_articles = await fetch_reference_articles(articles)
+    diffcnt = _print_changes(articles, ref_articles, color=color).diffs
+    if diffcnt > 0:
+        sys.stdout.flush()
+        print(
+            f"Found {diffcnt} articles with diffs (out of {len(articles)} articles)",
+            file=sys.stderr,
+        )
+    # (ci mode : error code != 0 if any diff?)
+    return 1 if ref_articles.errors else 0
+
+
+async def find_changes_in_files(
+    paths: Sequence[Path], *, color: bool = True, full: bool = False
+) -> int:
+    """
+    Show differences in several Catala files. Files are parsed first, then
+    all the articles they reference are retrieved at once.
+
+    Articles whose text and reference version are the same as in the
+    previous run (see `catleg.diff_state`) are not diffed again, unless
+    `full` is set.
+
+    Returns 1 if some articles could not be retrieved because of an error,
+    0 otherwise.
+    """
+    try:
+        return await _find_changes_in_files(
+            paths, color=color, full=full, state=get_diff_state()
+        )
+    finally:
+        await aclose_backends()
+
+
+async def watch_changes(
+    paths: Sequence[Path],
+    *,
+    color: bool = True,
+    full: bool = False,
+    interval: float | None = None,
+):
+    """
+    Show differences in several Catala files, then watch them: when a file
+    is modified, it is parsed again and the articles whose text changed are
+    diffed again.
+
+    Backends (and thus their connections, authentication token and article
+    cache) are kept open between runs, until the task is cancelled.
+    """
+    # without a persistent diff state, remember diffs in memory
+    state = get_diff_state() or DiffState(Path(":memory:"))
+    try:
+        await _find_changes_in_files(paths, color=color, full=full, state=state)
+        print(
+            f"Watching {len(paths)} files for changes (press Ctrl-C to stop)",
+            file=sys.stderr,
+        )
+        async for modified in watch_files(paths, interval=interval):
+            files_articles = parse_catala_files(modified)
+            ref_articles = await fetch_reference_articles(
+                [article for articles in files_articles for article in articles]
+            )
+            for path, articles in zip(modified, files_articles):
+                counts = _print_changes(
+                    articles, ref_articles, color=color, state=state
+                )
+                sys.stdout.flush()
+                print(
+                    f"{path}: {counts.diffed} changed articles, "
+                    f"{counts.diffs} with diffs",
+                    file=sys.stderr,
+                )
+    finally:
+        await aclose_backends()
+
+
+async def _find_changes_in_files(
+    paths: Sequence[Path], *, color: bool, full: bool, state: DiffState | None
+) -> int:
+    files_articles = parse_catala_files(paths)
+    ref_articles = await fetch_reference_articles(
+        [article for articles in files_articles for article in articles]
+    )
+    total = unchanged = unchanged_diffs = 0
+    for path, articles in zip(paths, files_articles):
+        counts = _print_changes(
+            articles, ref_articles, color=color, state=state, full=full
+        )
+        diffcnt = counts.diffs
+        unchanged += counts.unchanged
+        unchanged_diffs += counts.unchanged_diffs
+        if diffcnt > 0:
+            sys.stdout.flush()
+            print(
+                f"{path}: found {diffcnt} articles with diffs "
+                f"(out of {len(articles)} articles)",
+                file=sys.stderr,
+            )
+        total += diffcnt
+    if total > 0 and len(paths) > 1:
+        print(
+            f"Found {total} articles with diffs in {len(paths)} files", file=sys.stderr
+        )
+    if unchanged > 0:
+        sys.stdout.flush()
+        print(
+            f"{unchanged} unchanged articles were not diffed again "
+            f"({unchanged_diffs} of them had diffs), use --full to diff them",
+            file=sys.stderr,
+        )
+    return 1 if ref_articles.errors else 0
+
+
+class ReferenceArticles(dict[str, LegifranceArticle | None]):
+    """
+    Reference versions of articles, indexed by (uppercase) article ID.
+    Articles that do not exist are None, as are articles that could not be
+    retrieved because of an error: `errors` holds the IDs of the latter.
+    """
+
+    def __init__(self, articles=(), errors: Iterable[str] = ()):
+        super().__init__(articles)
+        self.errors = set(errors)
+
+    def warn_missing(self, article_id: str):
+        """
+        Warn that the reference version of an article could not be retrieved.
+        """
+        if article_id.upper() in self.errors:
+            warnings.warn(f"Could not retrieve article '{article_id}' (error)")
+        else:
+            warnings.warn(f"Could not retrieve article '{article_id}'")
+
+
+async def fetch_reference_articles(
+    articles: Iterable[CatalaFileArticle],
+) -> ReferenceArticles:
+    """
+    Retrieve the reference versions of articles, each distinct article
+    being retrieved once.
+    """
+    ids = list(dict.fromkeys(article.id.upper() for article in articles))
+    back = get_backend()
+    results = await back.articles(ids)
+    return ReferenceArticles(zip(ids, results), getattr(results, "errors", ()))
+
+
+@dataclass
+class _DiffCounts:
+    # articles that were diffed, and how many of them had (new or changed)
+    # diffs
+    diffed: int = 0
+    diffs: int = 0
+    # articles skipped as unchanged since the previous run, and how many of
+    # them had diffs
+    unchanged: int = 0
+    unchanged_diffs: int = 0
+
 
-    diffcnt = 0
-    for article, ref_article in zip(articles, ref_articles):
+def _print_changes(
+    articles: Sequence[CatalaFileArticle],
+    ref_articles: ReferenceArticles,
+    *,
+    color: bool = True,
+    state: DiffState | None = None,
+    full: bool = False,
+) -> _DiffCounts:
+    """
+    Print the diffs of articles from a Catala file against their reference
+    versions.
+
+    With a diff `state`, articles that are unchanged since the previous run
+    are skipped (unless `full` is set), and the state is updated.
+    """
+    counts = _DiffCounts()
+    for article in articles:
+        ref_article = ref_articles[article.id.upper()]
         if ref_article is None:
-            warnings.warn(f"Could not retrieve article '{article.id}'")
+            ref_articles.warn_missing(article.id)
             continue
 
         if article.is_archive:
             continue
 
+        local_text = _reformat(article.text)
+        ref_text = _reformat(_escape_ref_text(ref_article.text_and_nota()))
+        if state is not None:
+            hashes = text_hash(local_text), text_hash(ref_text)
+            previous = state.get(article.file_path, article.id)
+            if not full and previous is not None and previous[:2] == hashes:
+                counts.unchanged += 1
+                counts.unchanged_diffs += previous[2]
+                continue
+
         diff, retcode = wdiff(
-            _reformat(article.text),
-            _reformat(_escape_ref_text(ref_article.text_and_nota())),
+            local_text,
+            ref_text,
             return_exit_code=True,
             line_offset=article.start_line,
+            color=color,
         )
+        counts.diffed += 1
         if retcode != 0:
             print(article.id, flush=True)
             print(
@@ -41,14 +236,10 @@ async def find_changes(f: TextIO, *, file_path: Path | None = None):
                 flush=True,
             )
             sys.stdout.buffer.write(diff)
-            diffcnt += 1
-    if diffcnt > 0:
-        sys.stdout.flush()
-        print(
-            f"Found {diffcnt} articles with diffs (out of {len(articles)} articles)",
-            file=sys.stderr,
-        )
-    # (ci mode : error code != 0 if any diff?)
+            counts.diffs += 1
+        if state is not None:
+            state.put(article.file_path, article.id, *hashes, retcode != 0)
+    return counts
 
 
 def _reformat(paragraph: str):
@@ -0,0 +1,94 @@
+"""
+Cache of formatted (Markdown) articles.
+
+The HTML of an article version never changes, and neither does its
+rendering: formatted articles are keyed by a hash of their HTML text and
+nota, the formatting options and the versions of the converters
+(`catleg.legi_markdown` and the conversion libraries).
+They are kept in memory (least recently used entries are evicted first),
+and optionally stored in a SQLite database to be reused across runs.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+
+from catleg import legi_markdown
+from catleg.lru import LRUCache
+from catleg.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS formatted (
+    key TEXT PRIMARY KEY,
+    markdown TEXT NOT NULL
+);
+"""
+
+
+def _library_version(name: str) -> str:
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return "unknown"
+
+
+# renderings depend on the versions of the converters
+_RENDERER_VERSIONS = [legi_markdown.VERSION] + [
+    _library_version(lib) for lib in ("markdownify", "mdformat")
+]
+
+
+def format_key(text_html: str, nota_html: str, options: dict) -> str:
+    """
+    Cache key for the rendering of an article with formatting `options`.
+    """
+    payload = json.dumps(
+        [text_html, nota_html, options, _RENDERER_VERSIONS], sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class FormatCache:
+    """
+    Formatted article cache: at most `maxsize` entries in memory, and all
+    entries in the SQLite database at `path`, if given.
+    """
+
+    def __init__(self, maxsize: int, path: Path | None = None):
+        self._memory: LRUCache[str, str] = LRUCache(maxsize)
+        self._db: sqlite3.Connection | None = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._db.executescript(_SCHEMA)
+
+    def get(self, key: str) -> str | None:
+        markdown = self._memory.get(key)
+        if markdown is None and self._db is not None:
+            row = self._db.execute(
+                "SELECT markdown FROM formatted WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                markdown = row[0]
+                self._memory[key] = markdown
+        CACHE_LOOKUPS.inc(cache="format", result="miss" if markdown is None else "hit")
+        return markdown
+
+    def put(self, key: str, markdown: str):
+        self._memory[key] = markdown
+        if self._db is not None:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO formatted (key, markdown) VALUES (?, ?)",
+                    (key, markdown),
+                )
+
+    def close(self):
+        self._memory.clear()
+        if self._db is not None:
+            self._db.close()
@@ -1,14 +1,18 @@
 """
 Interface to git's word-level diff (git diff --color-word).
 Requires a system install of git.
+
+`catleg.word_diff` computes the same diffs without git, and is used by
+default.
 """
 import tempfile
 from subprocess import run
 
 
-def wdiff(st1: str, st2: str, *, return_exit_code=False, line_offset=0):
+def wdiff(st1: str, st2: str, *, return_exit_code=False, line_offset=0, color=True):
     """
-    Interface to git's word-level diff.
+    Interface to git's word-level diff (colored, or in git's plain format
+    without `color`).
     """
     with tempfile.NamedTemporaryFile(mode="w") as sf1, tempfile.NamedTemporaryFile(
         mode="w"
@@ -27,7 +31,7 @@ def wdiff(st1: str, st2: str, *, return_exit_code=False, line_offset=0):
                 "--ignore-space-at-eol",
                 "--no-index",
                 "--exit-code",
-                "--color-words",
+                "--color-words" if color else "--word-diff=plain",
                 sf1.name,
                 sf2.name,
             ],
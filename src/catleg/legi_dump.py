@@ -0,0 +1,482 @@
+"""
+Offline backend serving law texts from a local copy of the DILA
+LEGI (and JORF) open data dumps.
+
+The bulk XML archives (https://echanges.dila.gouv.fr/OPENDATA/LEGI/) are
+ingested into a SQLite database. Articles are stored in the same JSON
+format as Legifrance API replies, so that the rest of catleg processes
+them exactly like articles retrieved from Legifrance.
+
+Caveats: the plain text of articles is derived from their HTML content;
+decisions (CETATEXT) are not supported.
+"""
+
+import html
+import json
+import logging
+import re
+import sqlite3
+import tarfile
+import xml.etree.ElementTree as ET
+from collections.abc import Iterable
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+from catleg.law_text_fr import Article, parse_article_id
+from catleg.query import (
+    _article_from_legifrance_reply,
+    Backend,
+    END_OF_TIME_MS,
+    missing_article_reply,
+)
+
+logger = logging.getLogger(__name__)
+
+# DILA dumps use 2999-01-01 to mark a non-expired or non-expiring text
+END_OF_TIME_DATE = "2999-01-01"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id TEXT PRIMARY KEY,
+    cid TEXT,
+    text_id TEXT,
+    num TEXT,
+    etat TEXT,
+    date_debut TEXT,
+    date_fin TEXT,
+    reply TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS articles_cid ON articles(cid);
+CREATE INDEX IF NOT EXISTS articles_text_id ON articles(text_id);
+CREATE INDEX IF NOT EXISTS articles_validity ON articles(date_debut, date_fin);
+CREATE TABLE IF NOT EXISTS sections (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    text_id TEXT,
+    links TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS texts (
+    id TEXT PRIMARY KEY,
+    cid TEXT,
+    nature TEXT,
+    title TEXT,
+    etat TEXT,
+    date_debut TEXT,
+    date_fin TEXT,
+    links TEXT
+);
+CREATE INDEX IF NOT EXISTS texts_cid ON texts(cid);
+"""
+
+# rows are written in batches of this size during ingestion
+_BATCH_SIZE = 1000
+
+
+class LegiDump:
+    """
+    SQLite store for the contents of LEGI/JORF dumps.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def ingest(self, archive: Path) -> int:
+        """
+        Ingest a (full or incremental) dump archive.
+        Returns the number of XML documents processed.
+        """
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = OFF")
+        articles, sections, text_versions, text_structs = [], [], [], []
+        count = 0
+        with tarfile.open(archive, "r|*") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                f = tar.extractfile(member)
+                if f is None:
+                    continue
+                if member.name.endswith(".dat") and "suppression" in member.name:
+                    self._delete(f.read().decode("utf-8").splitlines())
+                    continue
+                if not member.name.endswith(".xml"):
+                    continue
+                root = ET.fromstring(f.read())
+                count += 1
+                match root.tag:
+                    case "ARTICLE":
+                        articles.append(_article_row(root))
+                    case "SECTION_TA":
+                        sections.append(_section_row(root))
+                    case "TEXTE_VERSION":
+                        text_versions.append(_text_version_row(root))
+                    case "TEXTELR":
+                        text_structs.append(_text_struct_row(root))
+                if count % _BATCH_SIZE == 0:
+                    self._write(articles, sections, text_versions, text_structs)
+                    logger.info("Ingested %d documents from %s", count, archive)
+        self._write(articles, sections, text_versions, text_structs)
+        return count
+
+    def _write(self, articles, sections, text_versions, text_structs):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO articles "
+                "(id, cid, text_id, num, etat, date_debut, date_fin, reply) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                articles,
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO sections (id, title, text_id, links) "
+                "VALUES (?, ?, ?, ?)",
+                sections,
+            )
+            # text versions and structures are separate documents
+            # describing the same text
+            self.db.executemany(
+                "INSERT INTO texts (id, cid, nature, title, etat, date_debut, date_fin)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET "
+                "cid = excluded.cid, nature = excluded.nature, "
+                "title = excluded.title, etat = excluded.etat, "
+                "date_debut = excluded.date_debut, date_fin = excluded.date_fin",
+                text_versions,
+            )
+            self.db.executemany(
+                "INSERT INTO texts (id, cid, nature, links) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET "
+                "cid = excluded.cid, nature = excluded.nature, links = excluded.links",
+                text_structs,
+            )
+        for rows in (articles, sections, text_versions, text_structs):
+            rows.clear()
+
+    def _delete(self, lines: Iterable[str]):
+        """
+        Process a deletion list from an incremental dump
+        (one document path per line).
+        """
+        with self.db:
+            for line in lines:
+                doc_id = line.strip().rsplit("/", 1)[-1].removesuffix(".xml")
+                for table in ("articles", "sections", "texts"):
+                    self.db.execute(f"DELETE FROM {table} WHERE id = ?", (doc_id,))
+
+    def store_reply(self, reply: dict):
+        """
+        Store an article reply in the Legifrance API format.
+        """
+        article = reply["article"]
+        texts = article.get("context", {}).get("titreTxt") or [{}]
+        self._write(
+            [
+                (
+                    article["id"],
+                    article.get("cid") or article["id"],
+                    texts[-1].get("id"),
+                    article.get("num"),
+                    article.get("etat"),
+                    _ms_to_date(article.get("dateDebut")),
+                    _ms_to_date(article.get("dateFin")),
+                    json.dumps(reply, ensure_ascii=False),
+                )
+            ],
+            [],
+            [],
+            [],
+        )
+
+    def reply(self, article_id: str) -> dict | None:
+        row = self.db.execute(
+            "SELECT reply FROM articles WHERE id = ?", (article_id.upper(),)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def text(self, text_id: str):
+        return self.db.execute(
+            "SELECT id, cid, title, links FROM texts WHERE id = ?", (text_id.upper(),)
+        ).fetchone()
+
+    def section_links(self, section_id: str) -> list[dict]:
+        row = self.db.execute(
+            "SELECT links FROM sections WHERE id = ?", (section_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else []
+
+    def codes(self) -> list[dict]:
+        rows = self.db.execute(
+            "SELECT id, cid, title, etat FROM texts "
+            "WHERE nature = 'CODE' AND etat = 'VIGUEUR' ORDER BY title"
+        )
+        return [
+            {"id": id, "cid": cid, "titre": title, "etat": etat}
+            for id, cid, title, etat in rows
+        ]
+
+
+class LocalLegiBackend(Backend):
+    """
+    Backend serving articles and code structures from a `LegiDump`.
+    """
+
+    def __init__(self, path: Path):
+        self.dump = LegiDump(path)
+
+    async def aclose(self):
+        self.dump.close()
+
+    async def article(self, id_or_url: str) -> Article | None:
+        return _article_from_legifrance_reply(await self.query_article_legi(id_or_url))
+
+    async def articles(self, ids: Iterable[str]) -> Iterable[Article | None]:
+        return [await self.article(id) for id in ids]
+
+    async def query_article_legi(self, id: str):
+        """
+        Return an article in the Legifrance API reply format
+        (with a null article if the dump does not contain it).
+        """
+        typ, id = parse_article_id(id)
+        reply = self.dump.reply(id)
+        return reply if reply is not None else missing_article_reply(typ)
+
+    def store_reply(self, id: str, reply):
+        """
+        Store an article retrieved from another backend. It will be
+        overwritten by the next dump containing this article.
+        """
+        if reply.get("article") is not None:
+            self.dump.store_reply(reply)
+
+    async def list_codes(self):
+        return self.dump.codes()
+
+    async def code_toc(self, id: str, at: date | None = None):
+        """
+        Build a table of contents in the Legifrance API format,
+        with the sections and articles in force at date `at` (default: today).
+        """
+        text = self.dump.text(id)
+        if text is None or text[3] is None:
+            raise ValueError(f"Could not retrieve TOC for text {id}")
+        text_id, cid, title, links = text
+        at_str = str(at or date.today())
+        toc = {"id": text_id, "cid": cid, "title": title}
+        toc.update(self._toc_children(json.loads(links), at_str))
+        return toc
+
+    def _toc_children(self, links: list[dict], at: str) -> dict:
+        articles, sections = [], []
+        for link in links:
+            if not (link["debut"] <= at < link["fin"]):
+                continue
+            if link["type"] == "article":
+                articles.append(
+                    {"id": link["id"], "num": link["num"], "etat": link["etat"]}
+                )
+            else:
+                section = {"id": link["id"], "cid": link["cid"], "title": link["title"]}
+                section.update(
+                    self._toc_children(self.dump.section_links(link["id"]), at)
+                )
+                sections.append(section)
+        return {"articles": articles, "sections": sections}
+
+
+def _text(elem: ET.Element, path: str) -> str | None:
+    found = elem.find(path)
+    if found is None or found.text is None:
+        return None
+    return found.text.strip()
+
+
+def _inner_html(elem: ET.Element | None) -> str:
+    """Serialized contents (HTML) of an XML element"""
+    if elem is None:
+        return ""
+    parts = [html.escape(elem.text or "", quote=False)]
+    parts += [ET.tostring(child, encoding="unicode") for child in elem]
+    return "".join(parts).strip()
+
+
+def _html_to_text(html_text: str) -> str:
+    """
+    Plain text version of article HTML, the way Legifrance derives the
+    `texte` field from `texteHtml`: tags are replaced with spaces and
+    whitespace is collapsed.
+    """
+    text = html.unescape(re.sub(r"<[^>]+>", " ", html_text))
+    return " ".join(text.split())
+
+
+def _date_to_ms(day: str | None) -> int:
+    if not day:
+        return END_OF_TIME_MS
+    dt = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def _ms_to_date(ms: int | str | None) -> str:
+    if ms is None:
+        return END_OF_TIME_DATE
+    return str(datetime.fromtimestamp(int(ms) / 1000, timezone.utc).date())
+
+
+def _etat(debut: str | None, fin: str | None) -> str:
+    today = str(date.today())
+    if (debut or "") <= today < (fin or END_OF_TIME_DATE):
+        return "VIGUEUR"
+    return "ABROGE" if (fin or END_OF_TIME_DATE) <= today else ""
+
+
+def _links(struct: ET.Element | None) -> list[dict]:
+    """
+    Children (article and section links) of a text or section structure,
+    in document order.
+    """
+    links: list[dict] = []
+    if struct is None:
+        return links
+    for link in struct:
+        common = {
+            "id": link.get("id"),
+            "debut": link.get("debut") or "",
+            "fin": link.get("fin") or END_OF_TIME_DATE,
+            "etat": link.get("etat") or "",
+        }
+        if link.tag == "LIEN_ART":
+            links.append({"type": "article", "num": link.get("num"), **common})
+        elif link.tag == "LIEN_SECTION_TA":
+            title = (link.text or "").strip()
+            links.append(
+                {"type": "section", "cid": link.get("cid"), "title": title, **common}
+            )
+    return links
+
+
+def _article_row(root: ET.Element):
+    article_id = _text(root, "META/META_COMMUN/ID")
+    meta = root.find("META/META_SPEC/META_ARTICLE")
+    assert article_id is not None and meta is not None
+    num = _text(meta, "NUM")
+    etat = _text(meta, "ETAT")
+    date_debut = _text(meta, "DATE_DEBUT")
+    date_fin = _text(meta, "DATE_FIN") or END_OF_TIME_DATE
+
+    versions: list[dict] = [
+        {
+            "id": lien.get("id"),
+            "etat": lien.get("etat") or "",
+            "dateDebut": _date_to_ms(lien.get("debut")),
+            "dateFin": _date_to_ms(lien.get("fin")),
+            "origine": lien.get("origine"),
+        }
+        for lien in root.iterfind("VERSIONS/VERSION/LIEN_ART")
+    ] or [
+        {
+            "id": article_id,
+            "etat": etat,
+            "dateDebut": _date_to_ms(date_debut),
+            "dateFin": _date_to_ms(date_fin),
+        }
+    ]
+    # the common identifier of all versions of an article is the identifier
+    # of its original (JORF or first LEGI) version
+    jorf_versions = [v for v in versions if v.get("origine") == "JORF"]
+    cid = (jorf_versions or sorted(versions, key=lambda v: v["dateDebut"]))[0]["id"]
+
+    context = root.find("CONTEXTE/TEXTE")
+    titre_txt, titres_tm = [], []
+    if context is not None:
+        titre_txt = [
+            {
+                "id": t.get("id_txt"),
+                "cid": context.get("cid"),
+                "titre": (t.text or "").strip(),
+                "debut": t.get("debut"),
+                "fin": t.get("fin"),
+                "etat": _etat(t.get("debut"), t.get("fin")),
+            }
+            for t in context.iterfind("TITRE_TXT")
+        ]
+        tm = context.find("TM")
+        while tm is not None:
+            titles = tm.findall("TITRE_TM")
+            if titles:
+                # pick the title in force, or the latest one
+                current = [
+                    t
+                    for t in titles
+                    if _etat(t.get("debut"), t.get("fin")) == "VIGUEUR"
+                ]
+                t = (current or titles)[-1]
+                titres_tm.append({"id": t.get("id"), "titre": (t.text or "").strip()})
+            tm = tm.find("TM")
+
+    text_html = _inner_html(root.find("BLOC_TEXTUEL/CONTENU"))
+    nota_html = _inner_html(root.find("NOTA/CONTENU"))
+    reply = {
+        "article": {
+            "id": article_id,
+            "cid": cid,
+            "num": num,
+            "etat": etat,
+            "dateDebut": _date_to_ms(date_debut),
+            "dateFin": _date_to_ms(date_fin),
+            "texte": _html_to_text(text_html),
+            "texteHtml": text_html,
+            "nota": _html_to_text(nota_html),
+            "notaHtml": nota_html,
+            "articleVersions": versions,
+            "context": {"titreTxt": titre_txt, "titresTM": titres_tm},
+        }
+    }
+    text_id = titre_txt[-1]["id"] if titre_txt else None
+    return (
+        article_id,
+        cid,
+        text_id,
+        num,
+        etat,
+        date_debut,
+        date_fin,
+        json.dumps(reply, ensure_ascii=False),
+    )
+
+
+def _section_row(root: ET.Element):
+    text = root.find("CONTEXTE/TEXTE/TITRE_TXT")
+    return (
+        _text(root, "ID"),
+        _text(root, "TITRE_TA"),
+        text.get("id_txt") if text is not None else None,
+        json.dumps(_links(root.find("STRUCTURE_TA")), ensure_ascii=False),
+    )
+
+
+def _text_version_row(root: ET.Element):
+    meta = root.find("META/META_SPEC/META_TEXTE_VERSION")
+    assert meta is not None
+    return (
+        _text(root, "META/META_COMMUN/ID"),
+        _text(root, "META/META_SPEC/META_TEXTE_CHRONICLE/CID"),
+        _text(root, "META/META_COMMUN/NATURE"),
+        _text(meta, "TITRE") or _text(meta, "TITREFULL"),
+        _text(meta, "ETAT"),
+        _text(meta, "DATE_DEBUT"),
+        _text(meta, "DATE_FIN"),
+    )
+
+
+def _text_struct_row(root: ET.Element):
+    return (
+        _text(root, "META/META_COMMUN/ID"),
+        _text(root, "META/META_SPEC/META_TEXTE_CHRONICLE/CID"),
+        _text(root, "META/META_COMMUN/NATURE"),
+        json.dumps(_links(root.find("STRUCT")), ensure_ascii=False),
+    )
@@ -0,0 +1,605 @@
+"""
+Fast conversion of Legifrance article HTML to formatted Markdown.
+
+Legifrance articles only use a small subset of HTML (paragraphs, line
+breaks, links, lists, tables, superscripts). For that subset,
+`convert_html` produces the same Markdown as markdownify (with links
+stripped) without building a BeautifulSoup tree, and `format_markdown`
+produces the same output as mdformat for plain paragraphs and simple lists,
+without a full parse and render round-trip (done twice by mdformat when
+wrapping lines).
+
+Both give up on anything else: `convert_html` raises `UnsupportedMarkup`
+and `format_markdown` returns None, callers then fall back to the
+general-purpose libraries.
+"""
+
+import re
+import textwrap
+from functools import lru_cache
+from html.entities import name2codepoint
+from html.parser import HTMLParser
+
+# bump when the output of the conversion changes (renderings are cached,
+# see `catleg.format_cache`)
+VERSION = 1
+
+# block elements (see markdownify's should_remove_whitespace_inside)
+_BLOCK_TAGS = frozenset(
+    [
+        "p",
+        "div",
+        "article",
+        "section",
+        "ol",
+        "ul",
+        "li",
+        "table",
+        "thead",
+        "tbody",
+        "tfoot",
+        "tr",
+        "td",
+        "th",
+    ]
+)
+
+# elements markdownify renders specifically, which are not supported here
+# (other unknown elements are rendered as their contents)
+_UNSUPPORTED_TAGS = frozenset(
+    [
+        "blockquote",
+        "caption",
+        "code",
+        "dd",
+        "del",
+        "dl",
+        "dt",
+        "figcaption",
+        "kbd",
+        "list",
+        "pre",
+        "q",
+        "s",
+        "samp",
+        "script",
+        "style",
+        "textarea",
+        "video",
+        # parsed differently by BeautifulSoup
+        "rp",
+        "rt",
+        "template",
+        # void elements, other than <br>
+        "area",
+        "base",
+        "basefont",
+        "bgsound",
+        "col",
+        "command",
+        "embed",
+        "frame",
+        "hr",
+        "image",
+        "img",
+        "input",
+        "isindex",
+        "keygen",
+        "link",
+        "menuitem",
+        "meta",
+        "nextid",
+        "param",
+        "source",
+        "spacer",
+        "track",
+        "wbr",
+    ]
+)
+
+_HEADING_REGEX = re.compile(r"h(\d+)")
+_NEWLINE_WHITESPACE_REGEX = re.compile(r"[\t \r\n]*[\r\n][\t \r\n]*")
+_WHITESPACE_REGEX = re.compile(r"[\t ]+")
+_EXTRACT_NEWLINES_REGEX = re.compile(r"^(\n*)((?:.*[^\n])?)(\n*)$", flags=re.DOTALL)
+_LINE_WITH_CONTENT_REGEX = re.compile(r"^(.*)", flags=re.MULTILINE)
+_ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+
+class UnsupportedMarkup(Exception):
+    """The HTML uses markup outside of the supported subset."""
+
+
+class _Node:
+    """A node of the HTML tree: an element, or a text node (without name)."""
+
+    __slots__ = ("name", "attrs", "text", "parent", "children", "prev", "next")
+
+    def __init__(self, name: str | None, attrs: dict | None = None, text: str = ""):
+        self.name = name
+        self.attrs = attrs or {}
+        self.text = text
+        self.parent: _Node | None = None
+        self.children: list[_Node] = []
+        self.prev: _Node | None = None
+        self.next: _Node | None = None
+
+    def append(self, node: "_Node"):
+        node.parent = self
+        if self.children:
+            node.prev = self.children[-1]
+            self.children[-1].next = node
+        self.children.append(node)
+
+    def find_all(self, names) -> list["_Node"]:
+        found = []
+        for child in self.children:
+            if child.name in names:
+                found.append(child)
+            found.extend(child.find_all(names))
+        return found
+
+    def previous_element_sibling(self) -> "_Node | None":
+        node = self.prev
+        while node is not None and node.name is None:
+            node = node.prev
+        return node
+
+
+class _TreeBuilder(HTMLParser):
+    """
+    Build the same tree as BeautifulSoup with the html.parser builder
+    (elements are closed explicitly, stray end tags are ignored).
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.root = _Node("[document]")
+        self._stack = [self.root]
+        self._data: list[str] = []
+
+    def _end_data(self):
+        if self._data:
+            text = "".join(self._data)
+            self._data = []
+            if all(c in _ASCII_SPACES for c in text):
+                text = "\n" if "\n" in text else " "
+            self._stack[-1].append(_Node(None, text=text))
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _UNSUPPORTED_TAGS or _HEADING_REGEX.match(tag):
+            raise UnsupportedMarkup(tag)
+        self._end_data()
+        node = _Node(tag, {k: v if v is not None else "" for k, v in attrs})
+        self._stack[-1].append(node)
+        if tag != "br":
+            self._stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag != "br":
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag == "br":
+            raise UnsupportedMarkup(tag)
+        self._end_data()
+        for i in range(len(self._stack) - 1, 0, -1):
+            if self._stack[i].name == tag:
+                del self._stack[i:]
+                break
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_entityref(self, name):
+        if name not in name2codepoint:
+            raise UnsupportedMarkup(f"&{name}")
+        self._data.append(chr(name2codepoint[name]))
+
+    def handle_charref(self, name):
+        try:
+            codepoint = int(name[1:], 16) if name[0] in "xX" else int(name)
+        except ValueError:
+            raise UnsupportedMarkup(f"&#{name}")
+        # BeautifulSoup replaces some code points
+        if not (32 <= codepoint < 127 or 160 <= codepoint < 0xD800):
+            raise UnsupportedMarkup(f"&#{name}")
+        self._data.append(chr(codepoint))
+
+    def handle_comment(self, data):
+        raise UnsupportedMarkup("comment")
+
+    def handle_decl(self, decl):
+        raise UnsupportedMarkup("declaration")
+
+    def handle_pi(self, data):
+        raise UnsupportedMarkup("processing instruction")
+
+    def unknown_decl(self, data):
+        raise UnsupportedMarkup("declaration")
+
+
+def convert_html(html: str) -> str:
+    """
+    Convert HTML to Markdown, like `markdownify(html, strip=["a"])`.
+
+    Raises `UnsupportedMarkup` if the HTML uses elements which are not
+    supported.
+    """
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    builder._end_data()
+    return _process_tag(builder.root, set())
+
+
+def _remove_whitespace_inside(node: _Node | None) -> bool:
+    return node is not None and node.name in _BLOCK_TAGS
+
+
+def _is_block_content(node: _Node | None) -> bool:
+    if node is None:
+        return False
+    return node.name is not None or node.text.strip() != ""
+
+
+def _next_block_content_sibling(node: _Node) -> _Node | None:
+    sibling = node.next
+    while sibling is not None and not _is_block_content(sibling):
+        sibling = sibling.next
+    return sibling
+
+
+def _process_tag(node: _Node, parent_tags: set[str]) -> str:
+    remove_inside = _remove_whitespace_inside(node)
+
+    def can_ignore(child: _Node) -> bool:
+        if child.name is not None or child.text.strip() != "":
+            return False
+        if remove_inside and (child.prev is None or child.next is None):
+            return True
+        return _remove_whitespace_inside(child.prev) or _remove_whitespace_inside(
+            child.next
+        )
+
+    children_tags = set(parent_tags)
+    children_tags.add(node.name or "")
+    if node.name in ("td", "th"):
+        children_tags.add("_inline")
+
+    child_strings = [
+        _process_tag(child, children_tags)
+        if child.name is not None
+        else _process_text(child)
+        for child in node.children
+        if not can_ignore(child)
+    ]
+
+    # collapse newlines at child element boundaries
+    collapsed = [""]
+    for child_string in child_strings:
+        if not child_string:
+            continue
+        match = _EXTRACT_NEWLINES_REGEX.match(child_string)
+        assert match is not None
+        leading_nl, content, trailing_nl = match.groups()
+        if collapsed[-1] and leading_nl:
+            previous_nl = collapsed.pop()
+            leading_nl = "\n" * min(2, max(len(previous_nl), len(leading_nl)))
+        collapsed.extend([leading_nl, content, trailing_nl])
+    text = "".join(collapsed)
+
+    convert = _CONVERTERS.get(node.name or "")
+    if convert is not None:
+        text = convert(node, text, parent_tags)
+    return text
+
+
+def _process_text(node: _Node) -> str:
+    text = _NEWLINE_WHITESPACE_REGEX.sub("\n", node.text)
+    text = _WHITESPACE_REGEX.sub(" ", text)
+    text = text.replace("*", r"\*").replace("_", r"\_")
+    if _remove_whitespace_inside(node.prev) or (
+        node.prev is None and _remove_whitespace_inside(node.parent)
+    ):
+        text = text.lstrip(" \t\r\n")
+    if _remove_whitespace_inside(node.next) or (
+        node.next is None and _remove_whitespace_inside(node.parent)
+    ):
+        text = text.rstrip()
+    return text
+
+
+def _inline(markup: str):
+    def convert(node: _Node, text: str, parent_tags: set[str]) -> str:
+        prefix = " " if text and text[0] == " " else ""
+        suffix = " " if text and text[-1] == " " else ""
+        text = text.strip()
+        if not text:
+            return ""
+        return f"{prefix}{markup}{text}{markup}{suffix}"
+
+    return convert
+
+
+def _convert_document(node: _Node, text: str, parent_tags: set[str]) -> str:
+    return text.strip("\n")
+
+
+def _convert_br(node: _Node, text: str, parent_tags: set[str]) -> str:
+    if "_inline" in parent_tags:
+        return text + " " if text else " "
+    return "  \n" + text
+
+
+def _convert_p(node: _Node, text: str, parent_tags: set[str]) -> str:
+    if "_inline" in parent_tags:
+        return " " + text.strip(" \t\r\n") + " "
+    text = text.strip(" \t\r\n")
+    return f"\n\n{text}\n\n" if text else ""
+
+
+def _convert_div(node: _Node, text: str, parent_tags: set[str]) -> str:
+    if "_inline" in parent_tags:
+        return " " + text.strip() + " "
+    text = text.strip()
+    return f"\n\n{text}\n\n" if text else ""
+
+
+def _convert_list(node: _Node, text: str, parent_tags: set[str]) -> str:
+    next_sibling = _next_block_content_sibling(node)
+    before_paragraph = next_sibling is not None and next_sibling.name not in (
+        "ul",
+        "ol",
+    )
+    if "li" in parent_tags:
+        return "\n" + text.rstrip()
+    return "\n\n" + text + ("\n" if before_paragraph else "")
+
+
+def _convert_li(node: _Node, text: str, parent_tags: set[str]) -> str:
+    text = text.strip()
+    if not text:
+        return "\n"
+    parent = node.parent
+    if parent is not None and parent.name == "ol":
+        start_attr = parent.attrs.get("start")
+        start = int(start_attr) if start_attr and start_attr.isnumeric() else 1
+        previous = 0
+        sibling = node.prev
+        while sibling is not None:
+            previous += sibling.name == "li"
+            sibling = sibling.prev
+        bullet = f"{start + previous}."
+    else:
+        depth = -1
+        ancestor: _Node | None = node
+        while ancestor is not None:
+            depth += ancestor.name == "ul"
+            ancestor = ancestor.parent
+        bullet = "*+-"[depth % 3]
+    bullet += " "
+    indent = " " * len(bullet)
+    text = _LINE_WITH_CONTENT_REGEX.sub(
+        lambda match: indent + match.group(1) if match.group(1) else "", text
+    )
+    return bullet + text[len(bullet) :] + "\n"
+
+
+def _convert_table(node: _Node, text: str, parent_tags: set[str]) -> str:
+    return "\n\n" + text.strip() + "\n\n"
+
+
+def _colspan(cell: _Node) -> int:
+    colspan = cell.attrs.get("colspan", "")
+    return max(1, min(1000, int(colspan))) if colspan.isdigit() else 1
+
+
+def _convert_cell(node: _Node, text: str, parent_tags: set[str]) -> str:
+    return " " + text.strip().replace("\n", " ") + " |" * _colspan(node)
+
+
+def _convert_tr(node: _Node, text: str, parent_tags: set[str]) -> str:
+    parent = node.parent
+    assert parent is not None
+    cells = node.find_all(("td", "th"))
+    is_first_row = node.previous_element_sibling() is None
+    is_headrow = all(cell.name == "th" for cell in cells) or (
+        parent.name == "thead" and len(parent.find_all(("tr",))) == 1
+    )
+    is_head_row_missing = is_first_row and (
+        parent.name != "tbody"
+        or parent.parent is None
+        or len(parent.parent.find_all(("thead",))) < 1
+    )
+    columns = sum(_colspan(cell) for cell in cells)
+    overline = underline = ""
+    if is_headrow and is_first_row:
+        underline = "| " + " | ".join(["---"] * columns) + " |\n"
+    elif is_head_row_missing or (
+        is_first_row
+        and (
+            parent.name == "table"
+            or (parent.name == "tbody" and parent.previous_element_sibling() is None)
+        )
+    ):
+        overline = "| " + " | ".join([""] * columns) + " |\n"
+        overline += "| " + " | ".join(["---"] * columns) + " |\n"
+    return overline + "|" + text + "\n" + underline
+
+
+_CONVERTERS = {
+    "[document]": _convert_document,
+    "p": _convert_p,
+    "div": _convert_div,
+    "article": _convert_div,
+    "section": _convert_div,
+    "br": _convert_br,
+    "b": _inline("**"),
+    "strong": _inline("**"),
+    "i": _inline("*"),
+    "em": _inline("*"),
+    "sub": _inline(""),
+    "sup": _inline(""),
+    "ul": _convert_list,
+    "ol": _convert_list,
+    "li": _convert_li,
+    "table": _convert_table,
+    "tr": _convert_tr,
+    "td": _convert_cell,
+    "th": _convert_cell,
+}
+
+# characters which may be Markdown syntax wherever they are
+_SPECIAL_CHARS_REGEX = re.compile(r"[\\*_\[\]<`&~\x00-\x09\x0b-\x1f\x7f]")
+# whitespace (other than spaces) around which mdformat and markdown-it differ
+_EDGE_WHITESPACE_REGEX = re.compile(r"(?:^|[ \n])[^\S \n]|[^\S \n](?:[ \n]|$)")
+# lines which can start (or interrupt) another block than a paragraph
+_BLOCK_START_REGEX = re.compile(
+    r" {4}| *(?:>|#{1,6}(?: |$)|[-+](?: |$)|\d{1,9}[.)](?: |$)|[-= ]+$)"
+)
+# list items consisting of a paragraph
+_LIST_ITEM_REGEX = re.compile(r"(?:-|(\d{1,9})([.)])) (?=\S)")
+
+
+def format_markdown(text: str, width: int) -> str | None:
+    """
+    Format Markdown consisting of plain text paragraphs (possibly with hard
+    line breaks) and lists of such paragraphs separated by blank lines, like
+    `mdformat.text(text, options={"wrap": width, "number": True})`.
+
+    Returns None if `text` may contain other Markdown syntax.
+    """
+    if _SPECIAL_CHARS_REGEX.search(text) or _EDGE_WHITESPACE_REGEX.search(text):
+        return None
+    blocks: list[list[str]] = [[]]
+    for line in text.split("\n"):
+        if not line.strip(" "):
+            if blocks[-1]:
+                blocks.append([])
+        elif blocks[-1] and _BLOCK_START_REGEX.match(line):
+            return None
+        else:
+            blocks[-1].append(line)
+    if not blocks[-1]:
+        blocks.pop()
+    if not blocks:
+        return None
+
+    rendered: list[str] = []
+    # current list: kind ("-", "." or ")"), start number and item paragraphs
+    list_kind: str | None = None
+    list_start = 1
+    items: list[list[str]] = []
+    # consecutive ordered lists get alternate markers
+    ordered_lists = 0
+
+    def end_list():
+        nonlocal list_kind, ordered_lists
+        if list_kind is None:
+            return
+        if list_kind == "-":
+            rendered.append(_format_bullet_list(items, width))
+            ordered_lists = 0
+        else:
+            ordered_lists += 1
+            marker = "." if ordered_lists % 2 else ")"
+            rendered.append(_format_ordered_list(items, list_start, marker, width))
+        list_kind = None
+        items.clear()
+
+    for lines in blocks:
+        item = _LIST_ITEM_REGEX.match(lines[0])
+        if item is None:
+            if _BLOCK_START_REGEX.match(lines[0]):
+                return None
+            # (indented paragraphs would belong to the previous list item)
+            if list_kind is not None and lines[0].startswith(" "):
+                return None
+            end_list()
+            ordered_lists = 0
+            rendered.append(_format_paragraph(lines, width))
+            continue
+        content = lines[0][item.end() :]
+        if _BLOCK_START_REGEX.match(content):
+            return None
+        kind = item.group(2) or "-"
+        if kind != list_kind:
+            end_list()
+            list_kind = kind
+            list_start = int(item.group(1) or 1)
+        items.append([content] + lines[1:])
+    end_list()
+    return "\n\n".join(rendered) + "\n"
+
+
+def _format_bullet_list(items: list[list[str]], width: int) -> str:
+    return "\n\n".join(_format_list_item("- ", "  ", lines, width) for lines in items)
+
+
+def _format_ordered_list(
+    items: list[list[str]], start: int, marker: str, width: int
+) -> str:
+    last = start + len(items) - 1
+    indent = " " * len(f"{last}{marker} ")
+    return "\n\n".join(
+        _format_list_item(
+            f"{str(start + i).rjust(len(str(last)), '0')}{marker} ",
+            indent,
+            lines,
+            width,
+        )
+        for i, lines in enumerate(items)
+    )
+
+
+def _format_list_item(bullet: str, indent: str, lines: list[str], width: int) -> str:
+    paragraph = _format_paragraph(lines, max(1, width - len(indent)))
+    return bullet + paragraph.replace("\n", "\n" + indent)
+
+
+def _format_paragraph(lines: list[str], width: int) -> str:
+    # soft line breaks become spaces, hard line breaks are kept
+    sections: list[list[str]] = [[]]
+    for i, line in enumerate(lines):
+        sections[-1].extend(word for word in line.split(" ") if word)
+        if i < len(lines) - 1 and line.endswith("  "):
+            sections[-1][-1] += "\\"
+            sections.append([])
+    wrapper = _text_wrapper(width)
+    wrapped = "\n".join(wrapper.fill(" ".join(words)) for words in sections)
+    return "\n".join(_escape_line_start(line.strip()) for line in wrapped.split("\n"))
+
+
+@lru_cache
+def _text_wrapper(width: int) -> textwrap.TextWrapper:
+    return textwrap.TextWrapper(
+        width=width,
+        break_long_words=False,
+        break_on_hyphens=False,
+        expand_tabs=False,
+        replace_whitespace=False,
+    )
+
+
+def _escape_line_start(line: str) -> str:
+    """
+    Escape the start of a wrapped line which would otherwise be parsed as
+    another block (see mdformat's paragraph renderer).
+    """
+    if re.match(r"#{1,6}( |$)", line) or line.startswith(">"):
+        line = "\\" + line
+    if re.match(r"[-+]( |$)", line):
+        line = "\\" + line
+    if re.match(r"[0-9]+\)( |$)", line):
+        line = line.replace(")", "\\)", 1)
+    if re.match(r"[0-9]+\.( |$)", line):
+        line = line.replace(".", "\\.", 1)
+    without_spaces = line.replace(" ", "")
+    if len(without_spaces) >= 3 and all(c == "-" for c in without_spaces):
+        line = line.replace("-", "\\-", 1)
+    if all(c == "-" for c in line):
+        line = line.replace("-", "\\-", 1)
+    elif all(c == "=" for c in line):
+        line = line.replace("=", "\\=", 1)
+    return line
@@ -0,0 +1,159 @@
+"""
+Minimal process-wide metrics (counters and histograms), which can be
+exposed in the Prometheus text format, e.g. by a web service.
+"""
+
+import contextlib
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Sequence
+
+_registry: list["_Metric"] = []
+
+# latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class _Metric(ABC):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if labels.keys() != set(self.labelnames):
+            raise ValueError(f"Expected labels {self.labelnames} for {self.name}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple[str, ...], **extra: str) -> str:
+        pairs = list(zip(self.labelnames, key)) + list(extra.items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    @abstractmethod
+    def _samples(self) -> list[str]:
+        """Sample lines, in the Prometheus text format."""
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        return "\n".join(lines + self._samples())
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{self._labels(key)} {value}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label values: count of observations in each bucket
+        # (the last one being +Inf), sum of observations
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self._sums[key] = self._sums.get(key, 0) + value
+
+    @contextlib.contextmanager
+    def time(self, **labels: str):
+        """Observe the duration of a block of code, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def _samples(self) -> list[str]:
+        samples = []
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else str(bound)
+                samples.append(
+                    f"{self.name}_bucket{self._labels(key, le=le)} {cumulative}"
+                )
+            samples.append(f"{self.name}_sum{self._labels(key)} {self._sums[key]}")
+            samples.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return samples
+
+
+def render() -> str:
+    """
+    Return all metrics in the Prometheus text exposition format.
+    """
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Metrics of the catleg library
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "catleg_upstream_request_seconds",
+    "Latency of Legifrance API requests",
+    ["endpoint"],
+)
+UPSTREAM_RESPONSES = Counter(
+    "catleg_upstream_responses_total",
+    "Legifrance API responses, by status code ('error' for network errors)",
+    ["endpoint", "status"],
+)
+TOKEN_REFRESHES = Counter(
+    "catleg_token_refreshes_total", "Legifrance auth token requests"
+)
+CACHE_LOOKUPS = Counter(
+    "catleg_cache_lookups_total",
+    "Cache lookups, by cache and result (hit, stale or miss)",
+    ["cache", "result"],
+)
+RENDER_SECONDS = Histogram(
+    "catleg_render_seconds",
+    "Time spent rendering articles, by step (html_to_markdown, mdformat)",
+    ["step"],
+)
@@ -0,0 +1,297 @@
+"""
+Persistent cache of parsed Catala files.
+
+Parsing a large Catala file (markdown parsing and rendering of every article)
+takes a while, and successive `catleg` commands usually parse the same,
+unchanged files. The articles of each file are stored in a SQLite database,
+keyed by file path along with the hash of the file contents. When the
+modification time and size of a file have not changed, cached articles are
+returned without even reading the file.
+
+When several large files are not cached, they are parsed in parallel, in a
+pool of worker processes.
+"""
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import zlib
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from importlib.metadata import PackageNotFoundError, version
+from io import StringIO
+from pathlib import Path
+from typing import TextIO
+
+from catleg.config import cache_dir, settings
+from catleg.law_text_fr import ArticleType, CatalaFileArticle
+from catleg.metrics import CACHE_LOOKUPS
+from catleg.parse_catala_markdown import parse_catala_file
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS parsed (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    parser TEXT NOT NULL,
+    articles BLOB NOT NULL
+);
+"""
+
+# below this many characters to parse, starting worker processes takes
+# longer than parsing in process
+_PARALLEL_SIZE = 500_000
+
+# bump when parsing changes in a way that affects extracted articles
+_FORMAT_VERSION = 1
+
+
+def _library_version(name: str) -> str:
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return "unknown"
+
+
+# parsed articles depend on the markdown parser and renderer
+_PARSER = json.dumps(
+    [_FORMAT_VERSION]
+    + [_library_version(lib) for lib in ("markdown-it-py", "mdformat")]
+)
+
+
+class ParseCache:
+    """
+    Cache of the articles of Catala files, stored in a SQLite database at
+    `path` (created if needed).
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def get(
+        self, file_path: Path, contents: str | None = None
+    ) -> list[CatalaFileArticle] | None:
+        """
+        Return the cached articles of Catala file `file_path`, or None.
+        Without `contents`, only files whose modification time and size have
+        not changed are found; with `contents`, files with the same contents
+        are found as well.
+        """
+        key = str(file_path.resolve())
+        stat = os.stat(file_path)
+        row = self._db.execute(
+            "SELECT mtime_ns, size, content_hash, articles FROM parsed "
+            "WHERE path = ? AND parser = ?",
+            (key, _PARSER),
+        ).fetchone()
+        if row is not None and row[:2] == (stat.st_mtime_ns, stat.st_size):
+            CACHE_LOOKUPS.inc(cache="parse", result="hit")
+            return _load_articles(row[3], file_path)
+        if row is not None and contents is not None and row[2] == _hash(contents):
+            # touched, but unchanged
+            CACHE_LOOKUPS.inc(cache="parse", result="hit")
+            with self._db:
+                self._db.execute(
+                    "UPDATE parsed SET mtime_ns = ?, size = ? WHERE path = ?",
+                    (stat.st_mtime_ns, stat.st_size, key),
+                )
+            return _load_articles(row[3], file_path)
+        if contents is not None:
+            CACHE_LOOKUPS.inc(cache="parse", result="miss")
+        return None
+
+    def put(self, file_path: Path, contents: str, articles: bytes):
+        """
+        Store the articles of Catala file `file_path` (as returned by
+        `_dump_articles`), parsed from `contents`.
+        """
+        stat = os.stat(file_path)
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO parsed "
+                "(path, mtime_ns, size, content_hash, parser, articles) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    str(file_path.resolve()),
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                    _hash(contents),
+                    _PARSER,
+                    articles,
+                ),
+            )
+
+    def clear(self):
+        with self._db:
+            self._db.execute("DELETE FROM parsed")
+
+    def close(self):
+        self._db.close()
+
+
+def _hash(contents: str) -> str:
+    return hashlib.sha256(contents.encode("utf-8")).hexdigest()
+
+
+def _dump_articles(articles: list[CatalaFileArticle]) -> bytes:
+    payload = [
+        [
+            article.type.name,
+            article.id,
+            article.start_line,
+            article.is_archive,
+            article.text,
+        ]
+        for article in articles
+    ]
+    return zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+
+def _load_articles(blob: bytes, file_path: Path) -> list[CatalaFileArticle]:
+    return [
+        CatalaFileArticle(
+            type=ArticleType[typ],
+            id=id,
+            text=text,
+            file_path=file_path,
+            start_line=start_line,
+            is_archive=is_archive,
+        )
+        for typ, id, start_line, is_archive, text in json.loads(
+            zlib.decompress(blob).decode("utf-8")
+        )
+    ]
+
+
+_parse_cache: ParseCache | None = None
+
+
+def get_parse_cache() -> ParseCache | None:
+    """
+    Return the parse cache configured in settings (`parse_cache`, default
+    true, and `parse_cache_path`), or None if it is disabled.
+    """
+    global _parse_cache
+    if not settings.get("parse_cache", True):
+        return None
+    path = Path(settings.get("parse_cache_path") or cache_dir() / "parsed.sqlite")
+    if _parse_cache is None or _parse_cache.path != path:
+        _parse_cache = ParseCache(path)
+    return _parse_cache
+
+
+def parse_catala_file_cached(
+    f: TextIO, *, file_path: Path | None = None
+) -> list[CatalaFileArticle]:
+    """
+    Like `parse_catala_file`, using the parse cache when `f` reads the file
+    at `file_path`.
+    """
+    if file_path is None:
+        return parse_catala_file(f)
+    cache = get_parse_cache()
+    if cache is None:
+        return parse_catala_file(f, file_path=file_path)
+    articles = _cache_get(cache, file_path)
+    if articles is None:
+        contents = f.read()
+        articles = _cache_get(cache, file_path, contents)
+        if articles is None:
+            blob = _parse_contents(contents, file_path)
+            _cache_put(cache, file_path, contents, blob)
+            articles = _load_articles(blob, file_path)
+    return articles
+
+
+def parse_catala_files(paths: Sequence[Path]) -> list[list[CatalaFileArticle]]:
+    """
+    Parse several Catala files, using the parse cache. Files that are not
+    cached are parsed in a pool of worker processes when there is enough
+    to parse (see the `parse_processes` setting).
+    """
+    cache = get_parse_cache()
+    results: list[list[CatalaFileArticle]] = []
+    missing: list[tuple[int, str]] = []
+    for i, path in enumerate(paths):
+        articles = _cache_get(cache, path)
+        if articles is None:
+            with open(path) as f:
+                contents = f.read()
+            articles = _cache_get(cache, path, contents)
+            if articles is None:
+                missing.append((i, contents))
+        results.append(articles or [])
+
+    blobs = _parse_all([(contents, paths[i]) for i, contents in missing])
+    for (i, contents), blob in zip(missing, blobs):
+        _cache_put(cache, paths[i], contents, blob)
+        results[i] = _load_articles(blob, paths[i])
+    return results
+
+
+def _cache_get(
+    cache: ParseCache | None, file_path: Path, contents: str | None = None
+) -> list[CatalaFileArticle] | None:
+    if cache is None:
+        return None
+    try:
+        return cache.get(file_path, contents)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning("Parse cache unavailable (%s), parsing %s", e, file_path)
+        return None
+
+
+def _cache_put(cache: ParseCache | None, file_path: Path, contents: str, blob: bytes):
+    if cache is None:
+        return
+    try:
+        cache.put(file_path, contents, blob)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning("Could not cache parsed file %s (%s)", file_path, e)
+
+
+def _parse_contents(contents: str, file_path: Path) -> bytes:
+    return _dump_articles(parse_catala_file(StringIO(contents), file_path=file_path))
+
+
+def _parse_all(files: Sequence[tuple[str, Path]]) -> list[bytes]:
+    """
+    Parse files given as (contents, path) pairs, in worker processes when
+    there are several large enough files.
+    """
+    processes = min(
+        int(settings.get("parse_processes") or os.cpu_count() or 1), len(files)
+    )
+    if processes <= 1 or sum(len(contents) for contents, _ in files) < _PARALLEL_SIZE:
+        return [_parse_contents(contents, path) for contents, path in files]
+    contents, paths = zip(*files)
+    try:
+        # do not fork a process running an event loop (and threads)
+        with ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            return list(pool.map(_parse_contents, contents, paths))
+    except BrokenProcessPool:
+        logger.warning("Parse process pool is broken, parsing in process")
+        return [_parse_contents(contents, path) for contents, path in files]
+
+
+def clear_parse_cache():
+    """
+    Close the parse cache (it is set up again from settings when needed).
+    """
+    global _parse_cache
+    if _parse_cache is not None:
+        _parse_cache.close()
+        _parse_cache = None
@@ -1,12 +1,15 @@
+from collections.abc import Sequence
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import cast, TextIO
 
 from markdown_it import MarkdownIt
+from markdown_it.token import Token
 from markdown_it.tree import SyntaxTreeNode
 from mdformat.renderer import MDRenderer
 from more_itertools import sliding_window
 
-from catleg.law_text_fr import CatalaFileArticle, find_id_in_string
+from catleg.law_text_fr import ArticleType, CatalaFileArticle, find_id_in_string
 from catleg.markdown_it.heading_extension import replace_heading_rule
 
 
@@ -18,9 +21,7 @@ def parse_catala_file(
     """
     md = _make_markdown_parser()
     tokens = md.parse(f.read())
-    tree = SyntaxTreeNode(tokens)
-    articles = _parse_catala_doc(tree, file_path=file_path)
-    return articles
+    return _parse_catala_tokens(tokens, file_path=file_path)
 
 
 def _make_markdown_parser() -> MarkdownIt:
@@ -32,9 +33,100 @@ def _make_markdown_parser() -> MarkdownIt:
     return replace_heading_rule(MarkdownIt("commonmark"))
 
 
+@dataclass
+class _PendingArticle:
+    type: ArticleType
+    id: str
+    start_line: int
+    is_archive: bool
+    # (start, end) token indices of the blocks following the heading
+    blocks: list[tuple[int, int]] = field(default_factory=list)
+    # start of the block being read, if it is not finished yet
+    block_start: int | None = None
+
+
+def _parse_catala_tokens(
+    tokens: Sequence[Token], file_path: Path | None = None
+) -> list[CatalaFileArticle]:
+    """
+    Extract articles from the token stream of a Catala file, in a single pass.
+
+    An article is a heading containing an article id, followed by the blocks
+    at the same nesting level up to the next heading (or the end of the
+    enclosing block). This gives the same result as `_parse_catala_doc`
+    without building a syntax tree.
+    """
+    pending: list[_PendingArticle] = []
+    # articles being read, by nesting level of their heading
+    current: dict[int, _PendingArticle] = {}
+
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        level = token.level
+        if token.nesting == -1:
+            article = current.get(level)
+            if article is not None and article.block_start is not None:
+                article.blocks.append((article.block_start, i))
+                article.block_start = None
+            # articles inside a closed block end with it
+            for deeper in [lvl for lvl in current if lvl > level]:
+                del current[deeper]
+        elif token.type == "heading_open":
+            current.pop(level, None)
+            inline = tokens[i + 1]
+            children = inline.children or []
+            if children and children[0].type == "text":
+                if type_id := find_id_in_string(children[0].content):
+                    typ, id = type_id
+                    assert inline.map is not None
+                    article = _PendingArticle(
+                        type=typ,
+                        id=id,
+                        start_line=inline.map[0],
+                        is_archive="[archive]" in children[0].content,
+                    )
+                    pending.append(article)
+                    current[level] = article
+            # skip the heading contents and closing token
+            i += 3
+            continue
+        elif (article := current.get(level)) is not None:
+            if token.nesting == 1:
+                article.block_start = i
+            # skip code blocks, retain all other elements
+            elif token.type != "fence":
+                article.blocks.append((i, i))
+        i += 1
+
+    renderer = MDRenderer()
+    return [
+        CatalaFileArticle(
+            type=article.type,
+            id=article.id,
+            text=" ".join(
+                renderer.render(
+                    tokens[start : end + 1],
+                    options={"mdformat": {"number": True}},
+                    env={},
+                )
+                for start, end in article.blocks
+            ),
+            start_line=article.start_line,
+            file_path=file_path,
+            is_archive=article.is_archive,
+        )
+        for article in pending
+    ]
+
+
 def _parse_catala_doc(
     tree: SyntaxTreeNode, file_path: Path | None = None
 ) -> list[CatalaFileArticle]:
+    """
+    Extract articles from the syntax tree of a Catala file (reference
+    implementation of `_parse_catala_tokens`).
+    """
     articles: list[CatalaFileArticle] = []
     windowed_tree = sliding_window(tree.walk(), 3)
     renderer = MDRenderer()
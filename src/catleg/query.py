@@ -5,21 +5,31 @@ Utilities for querying various data sources for law texts:
   - legistix database (auto-api via datasette)
 """
 
+import asyncio
+import contextlib
 import functools
 import logging
 import re
+import time
+import weakref
 from collections.abc import Iterable
 from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
 from typing import Protocol
 
-import aiometer
 import httpx
 from markdownify import markdownify as md  # type: ignore
 from typing_extensions import assert_never
 
-from catleg.config import settings
+from catleg.article_cache import ArticleCache
+from catleg.config import cache_dir, settings
 
 from catleg.law_text_fr import Article, ArticleType, parse_article_id
+from catleg.legi_markdown import convert_html, UnsupportedMarkup
+from catleg.metrics import TOKEN_REFRESHES, UPSTREAM_REQUEST_SECONDS, UPSTREAM_RESPONSES
+from catleg.rate_limit import AdaptiveLimiter, parse_retry_after
+from catleg.retry import is_transient_error, RetryPolicy
+from catleg.token_cache import TokenCache
 
 
 logger = logging.getLogger(__name__)
@@ -33,12 +43,19 @@ def _lf_timestamp_to_datetime(ts):
 END_OF_TIME_MS = 32472144000000
 END_OF_TIME = _lf_timestamp_to_datetime(END_OF_TIME_MS)
 
+# Status codes Legifrance (PISTE) uses to throttle clients
+THROTTLE_STATUS_CODES = (429, 503)
+
 LF_TOKEN_REGEX = re.compile(
     r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
 )
 
 
-class Backend(Protocol):
+class ArticleBackend(Protocol):
+    """
+    Backend only serving articles (e.g. a tier of a `ChainBackend`).
+    """
+
     async def article(self, id_or_url: str) -> Article | None:
         """
         Retrieve a law article.
@@ -48,16 +65,24 @@ class Backend(Protocol):
     async def articles(self, ids: Iterable[str]) -> Iterable[Article | None]:
         ...
 
+    async def aclose(self):
+        """
+        Release resources held by the backend (connections, files...).
+        """
+        ...
+
+
+class Backend(ArticleBackend, Protocol):
     async def list_codes(self):
         """
         List available codes.
         """
         ...
 
-    async def code_toc(self, id: str):
+    async def code_toc(self, id: str, at: date | None = None):
         """
         Retrieve the structure of a law code (i.e sections,
-        subsections... up to articles).
+        subsections... up to articles) at a given date (default: today).
         Does not include article text.
         """
         ...
@@ -66,11 +91,44 @@ class Backend(Protocol):
 class LegifranceBackend(Backend):
     API_BASE_URL = "https://api.piste.gouv.fr/dila/legifrance/lf-engine-app"
 
-    def __init__(self, client_id, client_secret):
-        headers = {"Accept": "application/json"}
-        self.client = httpx.AsyncClient(
-            auth=LegifranceAuth(client_id, client_secret), headers=headers
+    # article reply cache (see catleg.article_cache), disabled if None
+    cache: ArticleCache | None = None
+    # if True, always query Legifrance and overwrite cached replies
+    refresh_cache: bool = False
+    # adaptive request concurrency limiter, no limit if None
+    limiter: AdaptiveLimiter | None = None
+    # retry policy for transient failures
+    retry_policy: RetryPolicy = RetryPolicy()
+
+    def __init__(
+        self,
+        client_id,
+        client_secret,
+        *,
+        cache: ArticleCache | None = None,
+        refresh_cache: bool = False,
+    ):
+        self.client = _make_http_client(
+            LegifranceAuth(
+                client_id,
+                client_secret,
+                token_cache=_get_token_cache(client_id),
+                refresh_margin=float(settings.get("lf_token_refresh_margin", 60)),
+                timeout=float(settings.get("lf_timeout", 5)),
+            )
         )
+        self.cache = cache
+        self.refresh_cache = refresh_cache
+        self.limiter = _make_limiter()
+        self.retry_policy = _make_retry_policy()
+
+    async def aclose(self):
+        """
+        Close the underlying HTTP connection pool and article cache.
+        """
+        await self.client.aclose()
+        if self.cache is not None:
+            self.cache.close()
 
     async def article(self, id_or_url: str) -> Article | None:
         reply = await self.query_article_legi(id_or_url)
@@ -82,9 +140,20 @@ class LegifranceBackend(Backend):
         return article
 
     async def articles(self, ids: Iterable[str]) -> Iterable[Article | None]:
-        jobs = [functools.partial(self.query_article_legi, id) for id in ids]
-        replies = await aiometer.run_all(jobs, max_at_once=10, max_per_second=15)
-        return [_article_from_legifrance_reply(reply) for reply in replies]
+        """
+        Retrieve several articles concurrently, in the order of `ids`.
+
+        Each article is only fetched once, even if it appears several times
+        in `ids`. Articles that could not be retrieved because of transient
+        errors (even after retrying) are reported and returned as None
+        (see `ArticleBatch`), unless all of them failed.
+        """
+        articles = await _query_articles(self.query_article_legi, ids)
+        if self.cache is not None:
+            logger.info(
+                "Article cache: %d hits, %d misses", self.cache.hits, self.cache.misses
+            )
+        return articles
 
     async def list_codes(self):
         res = await self._list_codes()
@@ -92,33 +161,56 @@ class LegifranceBackend(Backend):
 
     async def _list_codes(self, page_size=20):
         params = {"pageSize": page_size, "pageNumber": 1, "states": ["VIGUEUR"]}
-        reply = await self.client.post(f"{self.API_BASE_URL}/list/code", json=params)
-        reply.raise_for_status()
+        reply = await self._post(f"{self.API_BASE_URL}/list/code", params)
         reply_json = reply.json()
         nb_results = reply_json["totalResultNumber"]
         results = reply_json["results"]
         while len(results) < nb_results:
             params["pageNumber"] += 1
-            reply = await self.client.post(
-                f"{self.API_BASE_URL}/list/code", json=params
-            )
-            reply.raise_for_status()
+            reply = await self._post(f"{self.API_BASE_URL}/list/code", params)
             reply_json = reply.json()
             results += reply_json["results"]
         return results, nb_results
 
-    async def code_toc(self, id: str):
-        params = {"textId": id, "date": str(date.today())}
-        reply = await self.client.post(
-            f"{self.API_BASE_URL}/consult/legi/tableMatieres", json=params
+    async def code_toc(self, id: str, at: date | None = None):
+        params = {"textId": id, "date": str(at or date.today())}
+        reply = await self._post(
+            f"{self.API_BASE_URL}/consult/legi/tableMatieres", params
         )
-        reply.raise_for_status()
         if "sections" not in reply.json():
             raise ValueError(f"Could not retrieve TOC for text {id}")
         return reply.json()
 
     async def query_article_legi(self, id: str):
         typ, id = parse_article_id(id)
+        id = id.upper()
+        if self.cache is not None and not self.refresh_cache:
+            cached = self.cache.get(id)
+            if cached is not None:
+                return cached
+
+        # Coalesce concurrent queries for the same article into a single
+        # request. The request is shielded so that a caller giving up does
+        # not cancel it for the others.
+        inflight = self._inflight.get(id)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._fetch_article(typ, id))
+            self._inflight[id] = inflight
+            inflight.add_done_callback(functools.partial(self._fetch_done, id))
+        return await asyncio.shield(inflight)
+
+    @functools.cached_property
+    def _inflight(self) -> dict[str, asyncio.Future]:
+        """Pending article requests, by article identifier"""
+        return {}
+
+    def _fetch_done(self, id: str, fut: asyncio.Future):
+        del self._inflight[id]
+        if not fut.cancelled():
+            # mark the exception as retrieved, even if all callers gave up
+            fut.exception()
+
+    async def _fetch_article(self, typ: ArticleType, id: str):
         match typ:
             case ArticleType.LEGIARTI | ArticleType.JORFARTI:
                 url = f"{self.API_BASE_URL}/consult/getArticle"
@@ -132,34 +224,503 @@ class LegifranceBackend(Backend):
         # A POST request to fetch an article?
         # And no way of using a simple query string?
         # Really, Legifrance?
-        reply = await self.client.post(url, json=params)
-        reply.raise_for_status()
-        return reply.json()
+        reply = await self._post(url, params)
+        reply_json = reply.json()
+        self._cache_reply(id, reply_json)
+        return reply_json
+
+    def _cache_reply(self, id: str, reply):
+        if self.cache is not None:
+            _cache_article_reply(self.cache, id, reply)
 
     async def jorf(self, id: str):
         if id[:8].upper() != "JORFTEXT":
             raise ValueError("Expected JORF text identifier")
         params = {"textCid": id}
-        reply = await self.client.post(f"{self.API_BASE_URL}/consult/jorf", json=params)
-        reply.raise_for_status()
+        reply = await self._post(f"{self.API_BASE_URL}/consult/jorf", params)
         return reply.json()
 
-    async def legiPart(self, id: str, at: date | None = None):
+    async def legiPart(
+        self, id: str, at: date | None = None, section_id: str | None = None
+    ):
+        """
+        Retrieve the contents of a LEGI text (including article contents).
+        If `section_id` is given, the request targets that section.
+        """
         if id[:8].upper() != "LEGITEXT":
             raise ValueError("Expected LEGI text identifier")
         params = {"textId": id, "date": str(at or date.today())}
-        reply = await self.client.post(
-            f"{self.API_BASE_URL}/consult/legiPart", json=params
-        )
-        reply.raise_for_status()
+        if section_id is not None:
+            params["searchedElementId"] = section_id
+        reply = await self._post(f"{self.API_BASE_URL}/consult/legiPart", params)
         return reply.json()
 
+    async def _post(
+        self, url: str, params: dict, *, idempotent: bool = True
+    ) -> httpx.Response:
+        """
+        Send a request to the Legifrance API, within the limits set by the
+        request limiter.
+
+        Requests failing with a transient error (throttling, gateway errors,
+        network errors) are retried with exponential backoff, as per the
+        backend retry policy. Note that, though the Legifrance API uses POST
+        requests, all consultation requests are idempotent.
+        """
+        endpoint = url.rsplit("/", 1)[-1]
+        for attempt in range(self.retry_policy.max_retries + 1):
+            if self.limiter is not None:
+                await self.limiter.acquire()
+            start = time.monotonic()
+            reply, throttled, retry_after = None, False, None
+            try:
+                reply = await self.client.post(url, json=params)
+                if reply.status_code in THROTTLE_STATUS_CODES:
+                    throttled = True
+                    retry_after = parse_retry_after(reply.headers.get("Retry-After"))
+            except httpx.TransportError as e:
+                if attempt == self.retry_policy.max_retries or not (
+                    self.retry_policy.is_retryable_error(e, idempotent=idempotent)
+                ):
+                    raise
+                logger.info("Request to %s failed (%r), retrying", url, e)
+            finally:
+                latency = time.monotonic() - start
+                if self.limiter is not None:
+                    self.limiter.release(
+                        latency, throttled=throttled, retry_after=retry_after
+                    )
+                UPSTREAM_REQUEST_SECONDS.observe(latency, endpoint=endpoint)
+                UPSTREAM_RESPONSES.inc(
+                    endpoint=endpoint,
+                    status=str(reply.status_code) if reply is not None else "error",
+                )
+            if reply is not None:
+                if attempt == self.retry_policy.max_retries or not (
+                    self.retry_policy.is_retryable_status(reply.status_code)
+                ):
+                    break
+                logger.info(
+                    "Request to %s failed with status %d, retrying",
+                    url,
+                    reply.status_code,
+                )
+            await asyncio.sleep(self.retry_policy.delay(attempt, retry_after))
+        assert reply is not None
+        reply.raise_for_status()
+        return reply
+
+
+class ArticleBatch(list):
+    """
+    Articles retrieved by `Backend.articles`, in the requested order.
+    Missing articles are None, as are articles that could not be retrieved
+    because of a transient error: `errors` maps the (uppercase) identifiers
+    of the latter to their error.
+    """
+
+    def __init__(
+        self,
+        articles: Iterable[Article | None] = (),
+        errors: dict[str, BaseException] | None = None,
+    ):
+        super().__init__(articles)
+        self.errors = errors or {}
+
+
+async def _query_articles(query, ids: Iterable[str]) -> ArticleBatch:
+    """
+    Retrieve several article replies concurrently with `query`, in the
+    order of `ids`, and parse them.
+
+    Each article is only fetched once, even if it appears several times
+    in `ids`. Articles that could not be retrieved because of transient
+    errors are reported and returned as None, unless all of them failed.
+    Other errors are raised.
+    """
+    keys = [parse_article_id(id)[1].upper() for id in ids]
+    unique_keys = list(dict.fromkeys(keys))
+    replies = await asyncio.gather(
+        *[query(key) for key in unique_keys], return_exceptions=True
+    )
+    errors = {}
+    for key, reply in zip(unique_keys, replies):
+        if isinstance(reply, BaseException):
+            if not is_transient_error(reply):
+                raise reply
+            errors[key] = reply
+    if errors and len(errors) == len(replies):
+        raise next(iter(errors.values()))
+    articles: dict[str, Article | None] = {}
+    for key, reply in zip(unique_keys, replies):
+        if key in errors:
+            logger.warning("Could not retrieve article %s: %r", key, reply)
+            articles[key] = None
+        else:
+            articles[key] = _article_from_legifrance_reply(reply)
+    return ArticleBatch([articles[key] for key in keys], errors)
+
+
+def _cache_article_reply(cache: ArticleCache, id: str, reply):
+    """
+    Store an article reply in the cache.
+    Article versions that have ended and have a known successor cannot
+    change anymore and are cached permanently; other articles (in force,
+    or abrogated with no replacement yet) expire after the cache TTL.
+    """
+    try:
+        article = _article_from_legifrance_reply(reply)
+    except ValueError:
+        return
+    if article is None:
+        # do not cache lookup failures
+        return
+    assert isinstance(article, LegifranceArticle)
+    superseded = (
+        not article.is_open_ended
+        and article.end_date <= datetime.now(timezone.utc)
+        and article.latest_version_id != article.id
+    )
+    cache.put(id, reply, permanent=superseded)
+
+
+def missing_article_reply(typ: ArticleType) -> dict:
+    """
+    Reply (in the Legifrance API format) for an article that a backend
+    does not have.
+    """
+    return {"text": None} if typ == ArticleType.CETATEXT else {"article": None}
 
-def get_backend(spec: str):
-    # TODO: multiple backends, fallbacks...
-    assert spec == "legifrance"
-    client_id, client_secret = _get_legifrance_credentials(raise_if_missing=True)
-    return LegifranceBackend(client_id, client_secret)
+
+class ArticleCacheBackend(ArticleBackend):
+    """
+    Backend serving article replies from an `ArticleCache`, meant to be
+    the first tier of a `ChainBackend`. Only supports article lookups.
+    """
+
+    def __init__(self, cache: ArticleCache, *, refresh: bool = False):
+        self.cache = cache
+        # if True, only store replies (retrieved from other tiers)
+        self.refresh = refresh
+
+    async def aclose(self):
+        self.cache.close()
+
+    async def article(self, id_or_url: str) -> Article | None:
+        return _article_from_legifrance_reply(await self.query_article_legi(id_or_url))
+
+    async def articles(self, ids: Iterable[str]) -> Iterable[Article | None]:
+        return [await self.article(id) for id in ids]
+
+    async def query_article_legi(self, id: str):
+        typ, id = parse_article_id(id)
+        reply = None if self.refresh else self.cache.get(id.upper())
+        return reply if reply is not None else missing_article_reply(typ)
+
+    def store_reply(self, id: str, reply):
+        _cache_article_reply(self.cache, id.upper(), reply)
+
+
+class ChainBackend(Backend):
+    """
+    Backend trying several backends ("tiers") in turn, from the fastest
+    to the slowest.
+
+    Lookups fall through to the next tier when a tier does not have the
+    requested data, does not support the request or fails. Articles
+    retrieved from a slower tier are written back to the faster tiers
+    that can store them (i.e. that have a `store_reply` method).
+    """
+
+    def __init__(self, tiers: list[tuple[str, ArticleBackend]]):
+        if not tiers:
+            raise ValueError("Expected at least one backend")
+        self.tiers = tiers
+
+    async def aclose(self):
+        for _, tier in self.tiers:
+            await tier.aclose()
+
+    async def article(self, id_or_url: str) -> Article | None:
+        return _article_from_legifrance_reply(await self.query_article_legi(id_or_url))
+
+    async def articles(self, ids: Iterable[str]) -> Iterable[Article | None]:
+        return await _query_articles(self.query_article_legi, ids)
+
+    async def query_article_legi(self, id: str):
+        typ, id = parse_article_id(id)
+        id = id.upper()
+        error: Exception | None = None
+        for i, (name, tier) in enumerate(self.tiers):
+            query = getattr(tier, "query_article_legi", None)
+            if query is None:
+                continue
+            try:
+                reply = await query(id)
+                found = _article_from_legifrance_reply(reply) is not None
+            except Exception as e:
+                logger.warning("Backend %s failed to retrieve %s: %r", name, id, e)
+                error = e
+                continue
+            if found:
+                for faster_name, faster in self.tiers[:i]:
+                    store_reply = getattr(faster, "store_reply", None)
+                    if store_reply is not None:
+                        logger.debug("Storing %s in backend %s", id, faster_name)
+                        store_reply(id, reply)
+                return reply
+        if error is not None:
+            raise error
+        return missing_article_reply(typ)
+
+    async def list_codes(self):
+        return await self._first("list_codes")
+
+    async def code_toc(self, id: str, at: date | None = None):
+        return await self._first("code_toc", id, at=at)
+
+    async def jorf(self, id: str):
+        return await self._first("jorf", id)
+
+    async def legiPart(
+        self, id: str, at: date | None = None, section_id: str | None = None
+    ):
+        return await self._first("legiPart", id, at=at, section_id=section_id)
+
+    async def _first(self, method: str, *args, **kwargs):
+        """
+        Return the result of `method` from the first tier that supports it
+        and succeeds.
+        """
+        error: Exception | None = None
+        for name, tier in self.tiers:
+            fn = getattr(tier, method, None)
+            if fn is None:
+                continue
+            try:
+                return await fn(*args, **kwargs)
+            except NotImplementedError:
+                continue
+            except Exception as e:
+                logger.info("Backend %s failed (%s): %r", name, method, e)
+                error = e
+        if error is not None:
+            raise error
+        raise NotImplementedError(f"No backend supports {method}")
+
+
+class UnsupportedRequest(Exception):
+    """
+    Raised when the configured backend cannot serve a kind of request.
+    """
+
+
+def require_support(back: ArticleBackend, method: str, what: str):
+    """
+    Raise an `UnsupportedRequest` if backend `back` (or none of its tiers,
+    for a `ChainBackend`) does not implement `method`, used to retrieve
+    `what`.
+    """
+    tiers = back.tiers if isinstance(back, ChainBackend) else [("", back)]
+    if not any(getattr(tier, method, None) is not None for _, tier in tiers):
+        raise UnsupportedRequest(
+            f"The configured backend cannot retrieve {what}: "
+            "add the legifrance backend to the `backend` setting "
+            "(e.g. local,legifrance)"
+        )
+
+
+# Backends shared by all callers running within the same event loop
+# (connections in an HTTP pool cannot outlive the loop they were opened in)
+_backends: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[str, ArticleBackend]
+] = weakref.WeakKeyDictionary()
+
+
+def get_backend(spec: str | None = None):
+    """
+    Return a backend for `spec`: a backend name ("cache", "local" or
+    "legifrance"), or a comma-separated list of names to chain backends
+    (e.g. "cache,local,legifrance", see `ChainBackend`). Defaults to the
+    `backend` setting ("legifrance" by default).
+
+    When called from a running event loop, the backend (and its HTTP
+    connection pool and auth token) is shared by all callers in that loop.
+    When called outside of an event loop, a new backend is built on each
+    call: it is meant to be used for a single `asyncio.run` invocation.
+    """
+    if spec is None:
+        spec = settings.get("backend", "legifrance")
+    spec = ",".join(name.strip() for name in spec.split(","))
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _make_backend(spec)
+    backends = _backends.setdefault(loop, {})
+    if spec not in backends:
+        backends[spec] = _make_backend(spec)
+    return backends[spec]
+
+
+async def open_backends(*specs: str | None):
+    """
+    Create the shared backends for `specs` (default: the `backend` setting)
+    in the running event loop.
+    Meant to be called when a long-running application starts up.
+    """
+    for spec in specs or (None,):
+        get_backend(spec)
+
+
+async def aclose_backends():
+    """
+    Close all shared backends of the running event loop.
+    Meant to be called when a long-running application shuts down.
+    """
+    backends = _backends.pop(asyncio.get_running_loop(), {})
+    for back in backends.values():
+        await back.aclose()
+
+
+def _make_backend(spec: str) -> ArticleBackend:
+    names = spec.split(",")
+    if len(names) == 1:
+        back = _make_single_backend(spec, article_cache=True)
+        if back is None:
+            raise ValueError(f"Backend {spec} is disabled")
+        return back
+    tiers = []
+    for name in names:
+        # when the article cache is an explicit tier, do not cache articles
+        # a second time in the Legifrance backend
+        back = _make_single_backend(name, article_cache="cache" not in names)
+        if back is not None:
+            tiers.append((name, back))
+    return ChainBackend(tiers)
+
+
+def _make_single_backend(name: str, *, article_cache: bool) -> ArticleBackend | None:
+    refresh = settings.get("article_cache_refresh", False)
+    match name:
+        case "cache":
+            cache = _get_article_cache()
+            if cache is None:
+                return None
+            return ArticleCacheBackend(cache, refresh=refresh)
+        case "local":
+            from catleg.legi_dump import LocalLegiBackend
+
+            return LocalLegiBackend(local_db_path())
+        case "legifrance":
+            client_id, client_secret = _get_legifrance_credentials(
+                raise_if_missing=True
+            )
+            return LegifranceBackend(
+                client_id,
+                client_secret,
+                cache=_get_article_cache() if article_cache else None,
+                refresh_cache=refresh,
+            )
+        case _:
+            raise ValueError(f"Unknown backend: {name}")
+
+
+def _make_limiter() -> AdaptiveLimiter:
+    """
+    Build a request limiter from settings:
+      - `lf_concurrency_initial` (default 10)
+      - `lf_concurrency_min` (default 1)
+      - `lf_concurrency_max` (default 30)
+      - `lf_max_per_second` (default 15)
+      - `lf_target_latency` in seconds (default 2)
+    """
+    return AdaptiveLimiter(
+        initial=int(settings.get("lf_concurrency_initial", 10)),
+        minimum=int(settings.get("lf_concurrency_min", 1)),
+        maximum=int(settings.get("lf_concurrency_max", 30)),
+        max_per_second=float(settings.get("lf_max_per_second", 15)),
+        target_latency=float(settings.get("lf_target_latency", 2)),
+    )
+
+
+def _make_retry_policy() -> RetryPolicy:
+    """
+    Build the retry policy from settings:
+      - `lf_max_retries` (default 4)
+      - `lf_retry_backoff_base` in seconds (default 0.5)
+      - `lf_retry_backoff_max` in seconds (default 30)
+    """
+    return RetryPolicy(
+        max_retries=int(settings.get("lf_max_retries", 4)),
+        backoff_base=float(settings.get("lf_retry_backoff_base", 0.5)),
+        backoff_max=float(settings.get("lf_retry_backoff_max", 30)),
+    )
+
+
+def _get_token_cache(client_id: str) -> TokenCache | None:
+    """
+    Build the on-disk token cache if enabled (`lf_token_cache` setting,
+    default false). Tokens are stored in the catleg cache directory.
+    """
+    if not settings.get("lf_token_cache", False):
+        return None
+    return TokenCache(cache_dir(), client_id)
+
+
+def local_db_path() -> Path:
+    """
+    Location of the local LEGI/JORF dump database
+    (`local_db_path` setting, default `<cache_dir>/legi.sqlite`).
+    """
+    return Path(settings.get("local_db_path") or cache_dir() / "legi.sqlite")
+
+
+def _make_http_client(auth: httpx.Auth) -> httpx.AsyncClient:
+    """
+    Build a pooled HTTP client for Legifrance API access. Settings:
+      - `lf_max_connections` (default 20)
+      - `lf_max_keepalive_connections` (default 10)
+      - `lf_keepalive_expiry` in seconds (default 30)
+      - `lf_timeout` in seconds (default 5)
+      - `lf_http2` (default false, requires the `h2` package)
+    """
+    limits = httpx.Limits(
+        max_connections=int(settings.get("lf_max_connections", 20)),
+        max_keepalive_connections=int(settings.get("lf_max_keepalive_connections", 10)),
+        keepalive_expiry=float(settings.get("lf_keepalive_expiry", 30)),
+    )
+    http2 = bool(settings.get("lf_http2", False))
+    if http2:
+        try:
+            import h2  # type: ignore  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP/2 requested but the h2 package is not installed")
+            http2 = False
+    return httpx.AsyncClient(
+        auth=auth,
+        headers={"Accept": "application/json"},
+        limits=limits,
+        timeout=float(settings.get("lf_timeout", 5)),
+        http2=http2,
+    )
+
+
+def _get_article_cache() -> ArticleCache | None:
+    """
+    Build the article cache from settings:
+      - `article_cache` (default true) enables the cache
+      - `article_cache_path` (default `<cache_dir>/articles.sqlite`)
+      - `article_cache_ttl` in seconds (default 1 day)
+      - `article_cache_max_size_mb` (default 256)
+    """
+    if not settings.get("article_cache", True):
+        return None
+    path = settings.get("article_cache_path") or cache_dir() / "articles.sqlite"
+    return ArticleCache(
+        Path(path),
+        ttl=float(settings.get("article_cache_ttl", 24 * 3600)),
+        max_size=int(settings.get("article_cache_max_size_mb", 256)) * 1024 * 1024,
+    )
 
 
 class LegifranceArticle(Article):
@@ -227,11 +788,27 @@ class LegifranceArticle(Article):
         return parse_article_id(self.id)[0]
 
     def to_markdown(self) -> str:
-        text_md = md(self.text_html, strip=["a"]).strip()
-        if len(self.nota_html):
-            nota_md = md(self.nota_html, strip=["a"]).strip()
-            text_md += f"\n\nNOTA :\n\n{nota_md}"
-        return text_md
+        return html_to_markdown(self.text_html, self.nota_html)
+
+
+def html_to_markdown(text_html: str, nota_html: str = "") -> str:
+    """
+    Convert the HTML text (and nota) of an article to Markdown.
+    """
+    text_md = _html_fragment_to_markdown(text_html).strip()
+    if len(nota_html):
+        nota_md = _html_fragment_to_markdown(nota_html).strip()
+        text_md += f"\n\nNOTA :\n\n{nota_md}"
+    return text_md
+
+
+def _html_fragment_to_markdown(html: str) -> str:
+    # the fast converter handles the markup used by Legifrance,
+    # markdownify everything else
+    try:
+        return convert_html(html)
+    except UnsupportedMarkup:
+        return md(html, strip=["a"])
 
 
 def _get_legifrance_credentials(
@@ -341,35 +918,116 @@ class LegifranceAuth(httpx.Auth):
     to fetch and refresh an access token and passes it along
     in requests.
 
-    Note that the auth flow is synchronous, this is on purpose
-    (we do not expect frequent token refreshes).
-    See https://github.com/encode/httpx/issues/1176#issuecomment-674381420
+    The token is fetched through the client itself (without blocking the
+    event loop). When several requests find the token expired, exactly
+    one of them refreshes it while the others wait. Tokens are refreshed
+    `refresh_margin` seconds before they expire, and are optionally shared
+    with other processes through a `TokenCache`. Token requests time out
+    after `timeout` seconds (so that a stalled token endpoint does not
+    block the requests waiting for the token forever).
     """
 
-    def __init__(self, client_id: str, client_secret: str):
+    TOKEN_URL = "https://oauth.piste.gouv.fr/api/oauth/token"
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        *,
+        token_cache: TokenCache | None = None,
+        refresh_margin: float = 60,
+        timeout: float = 5,
+    ):
         self.client_id = client_id
         self.client_secret = client_secret
-        self.token = None
+        self.token: str | None = None
         self.token_expires_at: datetime | None = None
+        self.token_cache = token_cache
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self.timeout = httpx.Timeout(timeout)
+        self._refresh_lock = asyncio.Lock()
+        # last token rejected by the API, never to be reused
+        self._rejected_token: str | None = None
 
-    def auth_flow(self, request: httpx.Request):
-        if self.token is None or self.token_expires_at <= datetime.now():
-            logging.info("Requesting auth token")
-            data = {
-                "grant_type": "client_credentials",
-                "scope": "openid",
-                "client_id": self.client_id,
-                "client_secret": self.client_secret,
-            }
-            resp = httpx.post("https://oauth.piste.gouv.fr/api/oauth/token", data=data)
-            if not 200 <= resp.status_code < 300:
-                yield resp
-            resp_json = resp.json()
-            self.token = resp_json["access_token"]
-            expires_in = int(resp_json["expires_in"])
-            self.token_expires_at = datetime.now() + timedelta(seconds=expires_in)
-        else:
-            logging.info("Using existing auth token")
+    async def async_auth_flow(self, request: httpx.Request):
+        for attempt in range(2):
+            if not self._has_fresh_token():
+                async with self._refresh_lock:
+                    # another request may have refreshed the token meanwhile
+                    if not self._has_fresh_token() and not self._load_cached_token():
+                        # ...or another process
+                        async with self._token_cache_lock():
+                            if not self._load_cached_token():
+                                token_response = yield self._token_request()
+                                await token_response.aread()
+                                self._set_token(token_response)
+            else:
+                logger.debug("Using existing auth token")
+
+            token = self.token
+            request.headers["Authorization"] = f"Bearer {token}"
+            response = yield request
+            if response.status_code != 401 or attempt > 0:
+                return
+            # the token was rejected (revoked, or expired early):
+            # get a new one and try again
+            logger.info("Auth token rejected, requesting a new one")
+            self._rejected_token = token
+            if self.token == token:
+                self.token = None
+
+    def _has_fresh_token(self) -> bool:
+        return (
+            self.token is not None
+            and self.token_expires_at is not None
+            and datetime.now(timezone.utc) < self.token_expires_at - self.refresh_margin
+        )
 
-        request.headers["Authorization"] = f"Bearer {self.token}"
-        yield request
+    def _token_cache_lock(self):
+        if self.token_cache is None:
+            return contextlib.nullcontext()
+        return self.token_cache.lock()
+
+    def _load_cached_token(self) -> bool:
+        if self.token_cache is None:
+            return False
+        cached = self.token_cache.load()
+        if cached is None:
+            return False
+        token, expires_at = cached
+        if token == self._rejected_token:
+            return False
+        self.token = token
+        self.token_expires_at = datetime.fromtimestamp(expires_at, timezone.utc)
+        if not self._has_fresh_token():
+            self.token = None
+            return False
+        logger.info("Using cached auth token")
+        return True
+
+    def _token_request(self) -> httpx.Request:
+        logger.info("Requesting auth token")
+        TOKEN_REFRESHES.inc()
+        data = {
+            "grant_type": "client_credentials",
+            "scope": "openid",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+        }
+        return httpx.Request(
+            "POST",
+            self.TOKEN_URL,
+            data=data,
+            extensions={"timeout": self.timeout.as_dict()},
+        )
+
+    def _set_token(self, response: httpx.Response):
+        response.raise_for_status()
+        resp_json = response.json()
+        self.token = resp_json["access_token"]
+        expires_in = int(resp_json["expires_in"])
+        self.token_expires_at = datetime.now(timezone.utc) + timedelta(
+            seconds=expires_in
+        )
+        if self.token_cache is not None:
+            self.token_cache.store(self.token, self.token_expires_at.timestamp())
@@ -0,0 +1,148 @@
+"""
+Adaptive (AIMD) concurrency limiting for upstream API requests.
+
+The number of concurrent requests grows additively while the upstream
+answers quickly, and shrinks multiplicatively when it throttles us
+(HTTP 429 or 503), in which case no new request is started until the
+delay requested by the server (`Retry-After`) has elapsed.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+# default pause after a throttled response without a Retry-After header
+DEFAULT_RETRY_AFTER_SEC = 1.0
+
+
+class AdaptiveLimiter:
+    """
+    Limits the number of concurrent requests, and the rate at which requests
+    are started.
+
+    Parameters
+    ----------
+    initial, minimum, maximum: int
+       Initial, minimum and maximum number of concurrent requests
+    max_per_second: float
+       Maximum number of requests started per second
+    target_latency: float
+       Concurrency only increases while requests complete within this
+       delay (in seconds)
+    backoff_factor: float
+       Concurrency is multiplied by this factor when throttled
+    """
+
+    def __init__(
+        self,
+        *,
+        initial: int = 10,
+        minimum: int = 1,
+        maximum: int = 30,
+        max_per_second: float = 15,
+        target_latency: float = 2.0,
+        backoff_factor: float = 0.5,
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.interval = 1 / max_per_second
+        self.target_latency = target_latency
+        self.backoff_factor = backoff_factor
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._next_start = 0.0
+        self._resume_at = 0.0
+        self._last_backoff = 0.0
+
+    @property
+    def concurrency(self) -> int:
+        return max(self.minimum, int(self.limit))
+
+    async def acquire(self):
+        """
+        Wait for a request slot. Each successful call must be followed
+        by a call to `release`.
+        """
+        while self.in_flight >= self.concurrency:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # we were woken up: let somebody else take the slot
+                    self._wake_up()
+                else:
+                    self._waiters.remove(waiter)
+                raise
+        self.in_flight += 1
+
+        now = time.monotonic()
+        start = max(now, self._next_start, self._resume_at)
+        self._next_start = start + self.interval
+        if start > now:
+            try:
+                await asyncio.sleep(start - now)
+            except asyncio.CancelledError:
+                self.in_flight -= 1
+                self._wake_up()
+                raise
+
+    def release(
+        self,
+        latency: float,
+        *,
+        throttled: bool = False,
+        retry_after: float | None = None,
+    ):
+        """
+        Release a request slot, adapting concurrency to the request outcome.
+        """
+        self.in_flight -= 1
+        now = time.monotonic()
+        if throttled:
+            # only back off once per throttling episode: ignore requests
+            # sent before we last backed off
+            if now - latency >= self._last_backoff:
+                self._last_backoff = now
+                self.limit = max(self.minimum, self.limit * self.backoff_factor)
+                logger.info("Throttled, reducing concurrency to %d", self.concurrency)
+            delay = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER_SEC
+            self._resume_at = max(self._resume_at, now + delay)
+        elif latency <= self.target_latency:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake_up()
+
+    def _wake_up(self):
+        available = self.concurrency - self.in_flight
+        while available > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                available -= 1
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parse a Retry-After header (either a number of seconds or an HTTP date)
+    and return a delay in seconds.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
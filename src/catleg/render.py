@@ -0,0 +1,177 @@
+"""
+Rendering of articles to formatted Markdown.
+
+Converting article HTML to Markdown and formatting it is CPU-bound: when
+the `render_processes` setting is set, batches of articles are rendered
+in a pool of worker processes, so that rendering large texts uses several
+cores and does not block the event loop. Most articles are converted by
+the specialized converter of `catleg.legi_markdown`, others by markdownify
+and mdformat.
+
+Renderings are memoized (see `catleg.format_cache`): articles that have
+already been rendered are not converted again.
+"""
+
+import asyncio
+import logging
+import math
+import multiprocessing
+import time
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import mdformat
+
+from catleg.config import cache_dir, settings
+from catleg.format_cache import format_key, FormatCache
+from catleg.legi_markdown import format_markdown
+from catleg.metrics import RENDER_SECONDS
+from catleg.query import html_to_markdown
+
+logger = logging.getLogger(__name__)
+
+MDFORMAT_OPTIONS = {"wrap": 80, "number": True}
+
+_pool: ProcessPoolExecutor | None = None
+_format_cache: FormatCache | None = None
+
+
+def format_article(text_html: str, nota_html: str = "") -> str:
+    """
+    Render an article (given its HTML text and nota) to formatted Markdown,
+    in the current process.
+    """
+    cache = _get_format_cache()
+    key = format_key(text_html, nota_html, MDFORMAT_OPTIONS)
+    formatted = cache.get(key) if cache is not None else None
+    if formatted is None:
+        formatted = _observe(_format_batch([(text_html, nota_html)]))[0]
+        if cache is not None:
+            cache.put(key, formatted)
+    return formatted
+
+
+async def format_articles(articles: Sequence[tuple[str, str]]) -> list[str]:
+    """
+    Render several articles, given as (HTML text, HTML nota) pairs, to
+    formatted Markdown. Articles are rendered in the worker process pool
+    if there is one, in the current process otherwise.
+    """
+    cache = _get_format_cache()
+    if cache is None:
+        return await _render(articles)
+    keys = [format_key(*article, MDFORMAT_OPTIONS) for article in articles]
+    results = [cache.get(key) for key in keys]
+    missing = [i for i, formatted in enumerate(results) if formatted is None]
+    if not missing:
+        return [formatted for formatted in results if formatted is not None]
+    rendered = await _render([articles[i] for i in missing])
+    for i, formatted in zip(missing, rendered):
+        cache.put(keys[i], formatted)
+        results[i] = formatted
+    return [formatted for formatted in results if formatted is not None]
+
+
+def clear_format_cache():
+    """
+    Drop the formatted article cache (it is set up again from settings
+    when needed).
+    """
+    global _format_cache
+    if _format_cache is not None:
+        _format_cache.close()
+        _format_cache = None
+
+
+def _get_format_cache() -> FormatCache | None:
+    """
+    Build the formatted article cache from settings:
+      - `format_cache` (default true) enables the cache
+      - `format_cache_size`: number of articles kept in memory (default 4096)
+      - `format_cache_persist` (default false) also stores them on disk, in
+        `format_cache_path` (default `<cache_dir>/formatted.sqlite`)
+    """
+    global _format_cache
+    if not settings.get("format_cache", True):
+        return None
+    if _format_cache is None:
+        path = None
+        if settings.get("format_cache_persist", False):
+            path = Path(
+                settings.get("format_cache_path") or cache_dir() / "formatted.sqlite"
+            )
+        _format_cache = FormatCache(int(settings.get("format_cache_size", 4096)), path)
+    return _format_cache
+
+
+async def _render(articles: Sequence[tuple[str, str]]) -> list[str]:
+    processes = int(settings.get("render_processes", 0))
+    if processes <= 0 or not articles:
+        return _observe(_format_batch(articles))
+    pool = _get_pool(processes)
+    # split the batch evenly between workers
+    chunk_size = math.ceil(len(articles) / processes)
+    loop = asyncio.get_running_loop()
+    try:
+        chunks = await asyncio.gather(
+            *[
+                loop.run_in_executor(pool, _format_batch, articles[i : i + chunk_size])
+                for i in range(0, len(articles), chunk_size)
+            ]
+        )
+    except BrokenProcessPool:
+        logger.warning("Render process pool is broken, rendering in process")
+        shutdown_render_pool()
+        return _observe(_format_batch(articles))
+    return _observe([result for chunk in chunks for result in chunk])
+
+
+def shutdown_render_pool():
+    """
+    Shut down the worker process pool, if any (a new one is started when
+    needed).
+    """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _get_pool(processes: int) -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # do not fork a process running an event loop (and threads)
+        _pool = ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def _format_batch(
+    articles: Sequence[tuple[str, str]]
+) -> list[tuple[str, float, float]]:
+    """
+    Render articles, returning the Markdown along with the time spent
+    converting and formatting it. Timings are returned rather than recorded
+    here, since metrics recorded in worker processes would be lost: the
+    caller records them with `_observe`.
+    """
+    results = []
+    for text_html, nota_html in articles:
+        start = time.perf_counter()
+        article_md = html_to_markdown(text_html, nota_html)
+        converted = time.perf_counter()
+        formatted = format_markdown(article_md, MDFORMAT_OPTIONS["wrap"])
+        if formatted is None:
+            formatted = mdformat.text(article_md, options=MDFORMAT_OPTIONS)
+        results.append((formatted, converted - start, time.perf_counter() - converted))
+    return results
+
+
+def _observe(results: list[tuple[str, float, float]]) -> list[str]:
+    for _, conversion_time, mdformat_time in results:
+        RENDER_SECONDS.observe(conversion_time, step="html_to_markdown")
+        RENDER_SECONDS.observe(mdformat_time, step="mdformat")
+    return [formatted for formatted, _, _ in results]
@@ -0,0 +1,72 @@
+"""
+Retry policy for transient upstream failures.
+"""
+
+import random
+from dataclasses import dataclass
+
+import httpx
+
+# Status codes signaling a transient upstream condition
+RETRYABLE_STATUS_CODES = (429, 502, 503, 504)
+
+# Transport errors raised before the request was sent: such requests
+# can be retried even if they are not idempotent
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Bounded exponential backoff with (full) jitter.
+
+    Parameters
+    ----------
+    max_retries: int
+       Maximum number of retries of a single request
+    backoff_base: float
+       Maximum delay (in seconds) before the first retry; doubles with
+       each subsequent retry
+    backoff_max: float
+       Upper bound of the delay between two attempts, in seconds
+    """
+
+    max_retries: int = 4
+    backoff_base: float = 0.5
+    backoff_max: float = 30.0
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """
+        Delay before retrying after the `attempt`-th failed attempt
+        (starting at 0). Never shorter than the delay requested by the
+        server, if any.
+        """
+        backoff = random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2**attempt)
+        )
+        if retry_after is not None:
+            return max(backoff, min(retry_after, self.backoff_max))
+        return backoff
+
+    def is_retryable_status(self, status_code: int) -> bool:
+        return status_code in RETRYABLE_STATUS_CODES
+
+    def is_retryable_error(self, error: Exception, *, idempotent: bool) -> bool:
+        """
+        Tell whether a request that failed with `error` may be retried.
+        Requests that may have reached the server are only retried if they
+        are idempotent.
+        """
+        if isinstance(error, _NOT_SENT_ERRORS):
+            return True
+        return idempotent and isinstance(error, httpx.TransportError)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Tell whether `error` signals a transient upstream condition (network
+    error, throttling or gateway error), that may remain after retrying.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, httpx.TransportError)
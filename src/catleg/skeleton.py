@@ -1,8 +1,43 @@
-from itertools import dropwhile
+import asyncio
+import logging
+from collections import Counter, deque
+from collections.abc import AsyncIterator, Iterator
 
-import mdformat
+import httpx
 
-from catleg.query import _article_from_legifrance_reply, get_backend, LegifranceArticle
+from catleg.config import settings
+from catleg.query import _article_from_legifrance_reply, get_backend, require_support
+from catleg.render import format_articles
+from catleg.toc import code_toc_index, preorder
+
+logger = logging.getLogger(__name__)
+
+
+# articles of a section are fetched (and rendered) in batches of this size
+# while the skeleton is being output, one batch ahead
+_FETCH_BATCH_SIZE = 20
+
+
+async def markdown_skeleton(
+    textid: str, sectionid: str, *, bulk: bool | None = None
+) -> str:
+    """
+    Return a skeleton (markdown-formatted law text section)
+
+    Parameters
+    ----------
+    textid: str
+       Legifrance text identifier (LEGITEXT...)
+    sectionid: str
+       Legifrance section identifier (LEGISCTA...)
+    bulk: bool | None
+       if True, retrieve the contents of the whole section in a single
+       request, and only fetch articles individually if they are missing
+       from the reply. Defaults to the `skeleton_bulk` setting (false).
+    """
+    return "\n\n".join(
+        [part async for part in iter_markdown_skeleton(textid, sectionid, bulk=bulk)]
+    )
 
 
 # TODO rename because this function is specific to code sections?
@@ -10,34 +45,94 @@ from catleg.query import _article_from_legifrance_reply, get_backend, Legifrance
 # Either that, or generalize
 # Note: it seems that for codes, articles are leaves and the preorder
 # traversal works! This seems *not* to be the case for JORF content
-async def markdown_skeleton(textid: str, sectionid: str) -> str:
+async def iter_markdown_skeleton(
+    textid: str, sectionid: str, *, bulk: bool | None = None
+) -> AsyncIterator[str]:
     """
-    Return a skeleton (markdown-formatted law text section)
+    Generate the parts (headings and formatted articles) of a section
+    skeleton, in order, as soon as they are available.
+    See `markdown_skeleton` for parameters; the skeleton is the
+    concatenation of all parts, separated by blank lines.
     """
     if sectionid[:8].upper() != "LEGISCTA":
         raise ValueError("Expected section identifier (should start with 'LEGISCTA')")
+    if bulk is None:
+        bulk = settings.get("skeleton_bulk", False)
+
+    back = get_backend()
+    if bulk:
+        require_support(back, "legiPart", "whole sections (bulk mode)")
+    toc = await code_toc_index(back, textid)
+
+    section = toc.lookup(sectionid)
+    if section is None:
+        raise ValueError(f"Could not find section {sectionid} in text {textid}")
+    root, root_level = section
+    section_nodes = list(preorder(root, root_level))
+
+    article_ids = [node["id"] for node, _ in section_nodes if not _is_section(node)]
+    # formatted articles, dropped once output
+    formatted_articles: dict[str, str] = {}
+    if bulk:
+        contents = await _section_contents(back, textid, sectionid)
+        found_ids = list(dict.fromkeys(id for id in article_ids if id in contents))
+        formatted = await format_articles(
+            [_article_json_html(contents[id]) for id in found_ids]
+        )
+        formatted_articles.update(zip(found_ids, formatted))
+    remaining = Counter(article_ids)
 
-    back = get_backend("legifrance")
-    toc = await back.code_toc(textid)
-
-    nodes = dropwhile(
-        lambda node_level: node_level[0]["cid"] != sectionid, _preorder(toc)
+    # fetch the (remaining) articles of the section concurrently, in batches,
+    # and output them in TOC order
+    missing_ids = list(
+        dict.fromkeys(id for id in article_ids if id not in formatted_articles)
     )
-
-    # some existence checking is needed here
-    root, root_level = next(nodes)
-    parts = []
-
-    for node, level in _preorder(root, root_level):
-        if node["id"][:8] != "LEGISCTA":
+    if bulk and missing_ids:
+        logger.info("Fetching %d articles individually", len(missing_ids))
+    batches = deque(
+        missing_ids[i : i + _FETCH_BATCH_SIZE]
+        for i in range(0, len(missing_ids), _FETCH_BATCH_SIZE)
+    )
+    fetches: deque[tuple[list[str], asyncio.Future]] = deque()
+
+    def prefetch():
+        while batches and len(fetches) < 2:
+            batch = batches.popleft()
+            fetches.append(
+                (batch, asyncio.ensure_future(_fetch_and_format(back, batch)))
+            )
+
+    prefetch()
+    try:
+        for node, level in section_nodes:
+            if _is_section(node):
+                yield f"{'#' * level} {node['title']}"
+                continue
             # If it is not a section, then it is an article
-            parts.append(f"{'#' * (level + 1)} Article {node['num']} | {node['id']}")
-            article = await back.article(node["id"])
-            parts.append(_formatted_article(article))
-        else:
-            parts.append(f"{'#' * level} {node['title']}")
-
-    return "\n\n".join(parts)
+            article_id = node["id"]
+            yield f"{'#' * (level + 1)} Article {node['num']} | {article_id}"
+            while article_id not in formatted_articles:
+                batch, fetch = fetches.popleft()
+                prefetch()
+                formatted_articles.update(zip(batch, await fetch))
+            remaining[article_id] -= 1
+            if remaining[article_id]:
+                yield formatted_articles[article_id]
+            else:
+                yield formatted_articles.pop(article_id)
+    finally:
+        for _, fetch in fetches:
+            fetch.cancel()
+
+
+async def _fetch_and_format(back, article_ids: list[str]) -> list[str]:
+    articles = await back.articles(article_ids)
+    for article_id, article in zip(article_ids, articles):
+        if article is None:
+            raise RuntimeError(f"Could not retrieve article {article_id}")
+    return await format_articles(
+        [(article.text_html, article.nota_html) for article in articles]
+    )
 
 
 async def article_skeleton(articleid: str, breadcrumbs: bool = True) -> str:
@@ -57,10 +152,12 @@ async def article_skeleton(articleid: str, breadcrumbs: bool = True) -> str:
     str
        Markdown-formatted article
     """
-    back = get_backend("legifrance")
+    back = get_backend()
     # This uses the Legifrance API directly, not the backend abstraction
     raw_article_json = await back.query_article_legi(articleid)
-    return _article_skeleton(raw_article_json=raw_article_json, breadcrumbs=breadcrumbs)
+    return await _article_skeleton(
+        raw_article_json=raw_article_json, breadcrumbs=breadcrumbs
+    )
 
 
 async def jorf_markdown_skeleton(jorftextid: str) -> str:
@@ -71,12 +168,22 @@ async def jorf_markdown_skeleton(jorftextid: str) -> str:
     Note: this does not render a full issue of the JORF,
     which contains many such texts.
     """
-    back = get_backend("legifrance")
+    return "\n\n".join([part async for part in iter_jorf_markdown_skeleton(jorftextid)])
+
+
+async def iter_jorf_markdown_skeleton(jorftextid: str) -> AsyncIterator[str]:
+    """
+    Generate the parts (headings and formatted articles) of a JORF text
+    skeleton, in order. See `jorf_markdown_skeleton`.
+    """
+    back = get_backend()
+    require_support(back, "jorf", "JORF texts")
     jorftext_json = await back.jorf(jorftextid)
 
-    parts: list[str] = [f'# {jorftext_json["title"]}']
+    yield f'# {jorftext_json["title"]}'
 
-    def walk(node: dict, level: int):
+    # headings, and article nodes to render
+    def walk(node: dict, level: int) -> Iterator[str | dict]:
         # Merge sections and articles preserving intended order using intOrdre
         merged: list[tuple[int, str, dict]] = []
         for section in node.get("sections", []):
@@ -87,8 +194,8 @@ async def jorf_markdown_skeleton(jorftextid: str) -> str:
         for _, kind, child in sorted(merged, key=lambda t: t[0]):
             if kind == "section":
                 title = child.get("title") or ""
-                parts.append(f'{"#" * level} {title}'.rstrip())
-                walk(child, level + 1)
+                yield f'{"#" * level} {title}'.rstrip()
+                yield from walk(child, level + 1)
             else:
                 num = child.get("num")
                 header = (
@@ -96,17 +203,48 @@ async def jorf_markdown_skeleton(jorftextid: str) -> str:
                     if num
                     else f'{"#" * level} {child["id"]}'
                 )
-                parts.append(header)
-                parts.append(_formatted_jorf_article_from_json(child))
+                yield header
+                yield child
 
     # Start walking children under the root title
-    walk(jorftext_json, level=2)
+    items = list(walk(jorftext_json, level=2))
 
-    return "\n\n".join(parts)
+    # render articles in batches, one batch ahead of the output
+    article_nodes = [item for item in items if isinstance(item, dict)]
+    batches = deque(
+        article_nodes[i : i + _FETCH_BATCH_SIZE]
+        for i in range(0, len(article_nodes), _FETCH_BATCH_SIZE)
+    )
+    renders: deque[asyncio.Future] = deque()
+    formatted_articles: deque[str] = deque()
+
+    def prefetch():
+        while batches and len(renders) < 2:
+            batch = batches.popleft()
+            renders.append(
+                asyncio.ensure_future(
+                    format_articles([_article_json_html(node) for node in batch])
+                )
+            )
+
+    prefetch()
+    try:
+        for item in items:
+            if isinstance(item, str):
+                yield item
+                continue
+            if not formatted_articles:
+                render = renders.popleft()
+                prefetch()
+                formatted_articles.extend(await render)
+            yield formatted_articles.popleft()
+    finally:
+        for render in renders:
+            render.cancel()
 
 
 # separate network calls and processing to ease unit testing
-def _article_skeleton(raw_article_json, breadcrumbs: bool = True):
+async def _article_skeleton(raw_article_json, breadcrumbs: bool = True):
     is_cetatext = "text" in raw_article_json
     article_json = raw_article_json["text" if is_cetatext else "article"]
     article = _article_from_legifrance_reply(raw_article_json)
@@ -114,12 +252,13 @@ def _article_skeleton(raw_article_json, breadcrumbs: bool = True):
         raise RuntimeError(
             "Could not extract article from json reply %s", raw_article_json
         )
+    formatted = await _formatted_article(article)
 
     parts = []
     if is_cetatext:
         # CETATEXT decisions have no code hierarchy; use the decision title.
         parts.append(f"# {article_json.get('titre', article.id)}")
-        parts.append(_formatted_article(article))
+        parts.append(formatted)
     else:
         if breadcrumbs:
             texts = article_json["context"]["titreTxt"]
@@ -135,44 +274,42 @@ def _article_skeleton(raw_article_json, breadcrumbs: bool = True):
         # level: code (1) + length of section hierarchy + article (1)
         level = 1 + len(article_json["context"]["titresTM"]) + 1
         parts.append(f"{'#' * level} Article {article_json['num']} | {article.id}")
-        parts.append(_formatted_article(article))
+        parts.append(formatted)
 
     return "\n\n".join(parts)
 
 
-def _preorder(node, level=1):
-    """Preorder traversal of articles and sections"""
-    yield node, level
-    for article in node["articles"]:
-        yield article, level
-    for section in node["sections"]:
-        yield from _preorder(section, level + 1)
+async def _section_contents(back, textid: str, sectionid: str) -> dict[str, dict]:
+    """
+    Retrieve the contents of a section in a single request.
+    Returns article nodes that include their content, by article identifier.
+    """
+    try:
+        part = await back.legiPart(textid, section_id=sectionid)
+    except httpx.HTTPError as e:
+        logger.warning("Could not retrieve contents of section %s: %r", sectionid, e)
+        return {}
+    return {
+        node["id"]: node
+        for node, _ in preorder(part)
+        if node.get("id", "")[:8] == "LEGIARTI" and node.get("content") is not None
+    }
+
 
+def _is_section(node) -> bool:
+    return node["id"][:8] == "LEGISCTA"
 
-def _formatted_article(article):
-    return mdformat.text(article.to_markdown(), options={"wrap": 80, "number": True})
 
+async def _formatted_article(article):
+    # rendered like article batches, in the worker pool if there is one
+    (formatted,) = await format_articles([(article.text_html, article.nota_html)])
+    return formatted
 
-def _formatted_jorf_article_from_json(article_json):
+
+def _article_json_html(article_json) -> tuple[str, str]:
     """
-    Construct a LegifranceArticle from a JORF article JSON node and
-    reuse the existing HTML->Markdown logic implemented in
-    LegifranceArticle.to_markdown.
+    HTML text and nota of a JORF (or LEGI text part) article JSON node
     """
-    # JORF article nodes provide HTML content in "content" and "nota" fields.
-    # Build a minimal LegifranceArticle with these.
-    art_id = article_json["id"]
-    text_html = article_json.get("content") or ""
-    nota_html = article_json.get("nota") or ""
-    end_date = article_json.get("dateFin")
-
-    legi_article = LegifranceArticle(
-        id=art_id,
-        text="",
-        text_html=text_html,
-        nota="",
-        nota_html=nota_html,
-        end_date=end_date,
-        latest_version_id=art_id,
-    )
-    return _formatted_article(legi_article)
+    # JORF and LEGI text part article nodes provide HTML content
+    # in "content" and "nota" fields.
+    return article_json.get("content") or "", article_json.get("nota") or ""
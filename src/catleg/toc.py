@@ -0,0 +1,104 @@
+"""
+Tables of contents of law texts (codes).
+
+Tables of contents are large (several megabytes for some codes), so they
+are kept in a cache for each backend, keyed by text identifier and date,
+along with an index giving direct access to any section or article node.
+"""
+
+import asyncio
+import functools
+import weakref
+from datetime import date
+
+from catleg.config import settings
+from catleg.lru import LRUCache
+from catleg.metrics import CACHE_LOOKUPS
+
+
+class TocIndex:
+    """
+    A table of contents, indexed by section and article identifiers
+    (both `id` and `cid`).
+    """
+
+    def __init__(self, toc: dict):
+        self.toc = toc
+        self._nodes: dict[str, tuple[dict, int]] = {}
+        for node, level in preorder(toc):
+            for key in (node.get("cid"), node.get("id")):
+                # the first node in preorder wins
+                if key and key.upper() not in self._nodes:
+                    self._nodes[key.upper()] = (node, level)
+
+    def lookup(self, id: str) -> tuple[dict, int] | None:
+        """
+        Return the (node, depth) for a section or article identifier,
+        or None if the text does not contain it.
+        """
+        return self._nodes.get(id.upper())
+
+
+def preorder(node, level=1):
+    """Preorder traversal of articles and sections"""
+    yield node, level
+    for article in node.get("articles", []):
+        yield article, level
+    for section in node.get("sections", []):
+        yield from preorder(section, level + 1)
+
+
+# backend -> its cached tables of contents
+_toc_caches: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_pending: dict[tuple[object, str, date], asyncio.Future] = {}
+
+
+def _get_toc_cache(back) -> LRUCache[tuple[str, date], TocIndex]:
+    """
+    Return the table of contents cache of a backend, set up from settings
+    (`toc_cache_size`, default 8) when needed.
+    """
+    size = int(settings.get("toc_cache_size", 8))
+    cache = _toc_caches.get(back)
+    if cache is None or cache.maxsize != size:
+        cache = _toc_caches[back] = LRUCache(size)
+    return cache
+
+
+async def code_toc_index(back, text_id: str, at: date | None = None) -> TocIndex:
+    """
+    Return the indexed table of contents of a text at a given date
+    (today by default), fetching it from `back` unless it is cached.
+    """
+    key = (text_id.upper(), at or date.today())
+    index = _get_toc_cache(back).get(key)
+    CACHE_LOOKUPS.inc(cache="toc", result="miss" if index is None else "hit")
+    if index is not None:
+        return index
+    # several callers may want the same table of contents at once:
+    # only fetch it once
+    pending_key = (back, *key)
+    pending = _pending.get(pending_key)
+    if pending is None:
+        pending = asyncio.ensure_future(_load_index(back, key))
+        _pending[pending_key] = pending
+        pending.add_done_callback(functools.partial(_load_done, pending_key))
+    return await asyncio.shield(pending)
+
+
+def _load_done(pending_key: tuple[object, str, date], fut: asyncio.Future):
+    del _pending[pending_key]
+    if not fut.cancelled():
+        # mark the exception as retrieved, even if all callers gave up
+        fut.exception()
+
+
+async def _load_index(back, key: tuple[str, date]) -> TocIndex:
+    text_id, at = key
+    index = TocIndex(await back.code_toc(text_id, at=at))
+    _get_toc_cache(back)[key] = index
+    return index
+
+
+def clear_toc_cache():
+    _toc_caches.clear()
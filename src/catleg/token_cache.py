@@ -0,0 +1,81 @@
+"""
+On-disk cache for Legifrance OAuth tokens, so that successive CLI
+invocations and concurrent worker processes share the same token.
+
+Tokens are stored in a JSON file (readable by the current user only),
+one file per client id. Refreshes are serialized across processes using
+a lock file (on platforms that support `fcntl`).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# how long to wait for another process to refresh the token
+LOCK_TIMEOUT_SEC = 10.0
+
+
+class TokenCache:
+    def __init__(self, directory: Path, client_id: str):
+        directory.mkdir(parents=True, exist_ok=True)
+        key = hashlib.sha256(client_id.encode()).hexdigest()[:16]
+        self.path = directory / f"lf_token_{key}.json"
+        self.lock_path = directory / f"lf_token_{key}.lock"
+
+    def load(self) -> tuple[str, float] | None:
+        """
+        Return the cached (token, expiry timestamp), if any.
+        """
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            return data["access_token"], float(data["expires_at"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def store(self, token: str, expires_at: float):
+        # write to a temporary file then rename, so that readers never
+        # see a partially written file
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(fd, "w", encoding="utf-8") as f:
+            json.dump({"access_token": token, "expires_at": expires_at}, f)
+        os.replace(tmp_path, self.path)
+
+    @asynccontextmanager
+    async def lock(self):
+        """
+        Hold an exclusive, inter-process lock while refreshing the token.
+        Waits (without blocking the event loop) for other processes.
+        """
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            deadline = time.monotonic() + LOCK_TIMEOUT_SEC
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        logger.warning("Timed out waiting for token lock, proceeding")
+                        break
+                    await asyncio.sleep(0.05)
+            yield
+        finally:
+            # closing the file descriptor releases the lock
+            os.close(fd)
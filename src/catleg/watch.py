@@ -0,0 +1,44 @@
+"""
+Polling of files for modifications, for the `--watch` modes of
+`catleg diff` and `catleg check-expiry`.
+"""
+
+import asyncio
+import os
+from collections.abc import AsyncIterator, Sequence
+from pathlib import Path
+
+from catleg.config import settings
+
+
+async def watch_files(
+    paths: Sequence[Path], *, interval: float | None = None
+) -> AsyncIterator[list[Path]]:
+    """
+    Yield the files among `paths` that were modified (or recreated), checking
+    their modification time and size every `interval` seconds (default: the
+    `watch_interval` setting, 1 second). Deleted files are ignored until they
+    reappear.
+    """
+    if interval is None:
+        interval = float(settings.get("watch_interval", 1.0))
+    signatures = {path: _signature(path) for path in paths}
+    while True:
+        await asyncio.sleep(interval)
+        modified = []
+        for path in paths:
+            signature = _signature(path)
+            if signature != signatures[path]:
+                signatures[path] = signature
+                if signature is not None:
+                    modified.append(path)
+        if modified:
+            yield modified
+
+
+def _signature(path: Path) -> tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
@@ -0,0 +1,262 @@
+"""
+Word-level diff, in the format of `git diff --color-words`.
+
+Texts are compared line by line (ignoring whitespace at end of lines), and
+changed lines are compared word by word, where words are runs of
+non-whitespace characters. Unlike `catleg.git_diff`, this does not spawn
+a process nor write temporary files for each diff: line numbers are shifted
+by `line_offset` without padding texts.
+
+Changes are found by `catleg.xdiff`, so that diffs are the same as git's.
+"""
+
+import re
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from catleg import git_diff, xdiff
+from catleg.config import settings
+
+# git's default word regex: runs of non-whitespace, where whitespace is
+# git's `isspace` (which does not include "\v" nor "\f")
+_WORD_REGEX = re.compile(r"[^ \t\n\r]+")
+_EOL_WHITESPACE = " \t\n\r"
+# git only splits lines on "\n" (unlike `str.splitlines`)
+_LINE_REGEX = re.compile(r"(?<=\n)(?=.)", re.DOTALL)
+# lines of context around changes
+_CONTEXT = 3
+# git's hunk headers show (the beginning of) the last line before the hunk
+# that starts with a letter, '_' or '$'
+_FUNCNAME_MAX_BYTES = 80
+
+_RESET = b"\x1b[m"
+
+
+@dataclass(frozen=True)
+class _Style:
+    frag: bytes
+    old: bytes
+    new: bytes
+    reset: bytes
+    old_prefix: bytes = b""
+    old_suffix: bytes = b""
+    new_prefix: bytes = b""
+    new_suffix: bytes = b""
+
+
+_COLOR_STYLE = _Style(frag=b"\x1b[36m", old=b"\x1b[31m", new=b"\x1b[32m", reset=_RESET)
+# as `git diff --word-diff=plain`
+_PLAIN_STYLE = _Style(
+    frag=b"",
+    old=b"",
+    new=b"",
+    reset=b"",
+    old_prefix=b"[-",
+    old_suffix=b"-]",
+    new_prefix=b"{+",
+    new_suffix=b"+}",
+)
+
+
+def wdiff(st1: str, st2: str, *, return_exit_code=False, line_offset=0, color=True):
+    """
+    Word-level diff of `st1` and `st2`, as `git diff --color-words` (or
+    `--word-diff=plain` without `color`) of files where these texts start
+    at line `line_offset + 1`.
+
+    Diffs are computed by git instead when the `diff_engine` setting is
+    "git".
+    """
+    if settings.get("diff_engine", "python") == "git":
+        return git_diff.wdiff(
+            st1,
+            st2,
+            return_exit_code=return_exit_code,
+            line_offset=line_offset,
+            color=color,
+        )
+    output = word_diff(st1, st2, line_offset=line_offset, color=color)
+    if return_exit_code:
+        return output, 1 if output else 0
+    return output
+
+
+def word_diff(st1: str, st2: str, *, line_offset: int = 0, color: bool = True) -> bytes:
+    """
+    Word-level diff of `st1` and `st2`, or an empty string if they only
+    differ by whitespace at end of lines.
+    """
+    lines1 = _LINE_REGEX.split(st1) if st1 else []
+    lines2 = _LINE_REGEX.split(st2) if st2 else []
+    opcodes = xdiff.opcodes(
+        [line.rstrip(_EOL_WHITESPACE) for line in lines1],
+        [line.rstrip(_EOL_WHITESPACE) for line in lines2],
+        # as git's diff.indentHeuristic (the default)
+        indent_heuristic=True,
+        # as if texts were preceded by empty lines
+        padding=line_offset,
+    )
+    if all(tag == "equal" for tag, *_ in opcodes):
+        return b""
+    diff = _WordDiff(
+        lines1, lines2, line_offset, _COLOR_STYLE if color else _PLAIN_STYLE
+    )
+    for hunk in _hunks(opcodes):
+        diff.hunk(hunk)
+    return b"\n".join(b"".join(diff.out).splitlines())
+
+
+def _hunks(opcodes):
+    """
+    Group opcodes in hunks, with `_CONTEXT` lines of context (as
+    `difflib.SequenceMatcher.get_grouped_opcodes`).
+    """
+    opcodes = [op for op in opcodes if op[1] != op[2] or op[3] != op[4]]
+    if opcodes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = opcodes[0]
+        opcodes[0] = tag, max(i1, i2 - _CONTEXT), i2, max(j1, j2 - _CONTEXT), j2
+    if opcodes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = opcodes[-1]
+        opcodes[-1] = tag, i1, min(i2, i1 + _CONTEXT), j1, min(j2, j1 + _CONTEXT)
+    group = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal" and i2 - i1 > 2 * _CONTEXT:
+            group.append((tag, i1, i1 + _CONTEXT, j1, j1 + _CONTEXT))
+            yield group
+            group = []
+            i1, j1 = i2 - _CONTEXT, j2 - _CONTEXT
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+
+class _WordDiff:
+    def __init__(
+        self, lines1: list[str], lines2: list[str], line_offset: int, style: _Style
+    ):
+        self.lines1 = lines1
+        self.lines2 = lines2
+        # texts are preceded by `line_offset` empty lines
+        self.line_offset = line_offset
+        self.style = style
+        self.out: list[bytes] = []
+        self.funcname = b""
+        self.last_hunk_start = -1
+
+    def hunk(self, opcodes):
+        i1, j1 = opcodes[0][1], opcodes[0][3]
+        i2, j2 = opcodes[-1][2], opcodes[-1][4]
+        self._header(i1, i2 - i1, j1, j2 - j1)
+        minus: list[str] = []
+        plus: list[str] = []
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == "equal":
+                self._words(minus, plus)
+                minus, plus = [], []
+                for line in self._lines(self.lines2, j1, j2):
+                    # as git, a carriage return at end of line is written
+                    # after the color reset
+                    line = line.removesuffix("\n")
+                    cr = line.endswith("\r")
+                    line = line.removesuffix("\r")
+                    if line:
+                        self.out.append(line.encode() + self.style.reset)
+                    self.out.append(b"\r\n" if cr else b"\n")
+            else:
+                minus.extend(self._lines(self.lines1, i1, i2))
+                plus.extend(self._lines(self.lines2, j1, j2))
+        self._words(minus, plus)
+
+    def _lines(self, lines: list[str], start: int, end: int) -> list[str]:
+        padding = max(0, min(end, self.line_offset) - start)
+        return ["\n"] * padding + lines[
+            max(start - self.line_offset, 0) : max(end - self.line_offset, 0)
+        ]
+
+    def _header(self, start1: int, count1: int, start2: int, count2: int):
+        # git searches the function name backwards, down to the start of the
+        # previous hunk, and keeps the previous one if there is none
+        # (empty lines before the text are not function names)
+        search_start = max(self.last_hunk_start + 1, self.line_offset)
+        for line in reversed(self._lines(self.lines1, search_start, start1)):
+            if line[:1].isascii() and (line[:1].isalpha() or line[:1] in ("_", "$")):
+                funcname = line.encode()[:_FUNCNAME_MAX_BYTES]
+                self.funcname = funcname.rstrip(_EOL_WHITESPACE.encode())
+                break
+        self.last_hunk_start = start1 - 1
+        header = f"@@ -{_range(start1, count1)} +{_range(start2, count2)} @@".encode()
+        self.out.append(self.style.frag + header + self.style.reset)
+        if not self.funcname:
+            self.out.append(b"\n")
+            return
+        # as git, trim "\r" or "\n" from the end of the header line (checking
+        # the last byte, then the one before the new end) and write them
+        # after the reset: a funcname ending with "\r" and a single character
+        # moves that character after the reset
+        func_line = b" " + self.funcname + b"\n"
+        end = len(func_line)
+        for i in (1, 2):
+            if func_line[end - i] in b"\r\n":
+                end -= 1
+        reset = self.style.reset
+        self.out.append(b" " + reset + func_line[1:end] + reset + func_line[end:])
+
+    def _words(self, minus: list[str], plus: list[str]):
+        minus_text, plus_text = "".join(minus), "".join(plus)
+        if not minus_text and not plus_text:
+            return
+        if not plus_text:
+            self._write(minus_text, "old")
+            return
+        minus_words = [m.span() for m in _WORD_REGEX.finditer(minus_text)]
+        plus_words = [m.span() for m in _WORD_REGEX.finditer(plus_text)]
+        current_plus = 0
+        for tag, i1, i2, j1, j2 in xdiff.opcodes(
+            [minus_text[b:e] for b, e in minus_words],
+            [plus_text[b:e] for b, e in plus_words],
+        ):
+            if tag == "equal":
+                continue
+            # removed words are shown after the end of the previous word
+            plus_begin = _word_begin(plus_words, j1, j2)
+            plus_end = plus_words[j2 - 1][1] if j2 > j1 else plus_begin
+            if plus_begin > current_plus:
+                self._write(plus_text[current_plus:plus_begin], "context")
+            if i2 > i1:
+                minus_begin, minus_end = minus_words[i1][0], minus_words[i2 - 1][1]
+                self._write(minus_text[minus_begin:minus_end], "old")
+            if j2 > j1:
+                self._write(plus_text[plus_begin:plus_end], "new")
+            current_plus = plus_end
+        if current_plus < len(plus_text):
+            self._write(plus_text[current_plus:], "context")
+
+    def _write(self, text: str, kind: str):
+        """
+        Write a segment of text ("context", "old" or "new" words), line by
+        line.
+        """
+        style = self.style
+        color, prefix, suffix, reset = {
+            "context": (b"", b"", b"", b""),
+            "old": (style.old, style.old_prefix, style.old_suffix, style.reset),
+            "new": (style.new, style.new_prefix, style.new_suffix, style.reset),
+        }[kind]
+        for i, line in enumerate(text.split("\n")):
+            if i > 0:
+                self.out.append(b"\n")
+            if line:
+                self.out.append(color + prefix + line.encode() + suffix + reset)
+
+
+def _word_begin(words: Sequence[tuple[int, int]], j1: int, j2: int) -> int:
+    if j2 > j1:
+        return words[j1][0]
+    # deletion: after the previous word, or at the start of the text
+    return words[j1 - 1][1] if j1 > 0 else 0
+
+
+def _range(start: int, count: int) -> str:
+    if count == 1:
+        return str(start + 1)
+    return f"{start + 1 if count else start},{count}"
@@ -0,0 +1,531 @@
+"""
+Port of the Myers diff algorithm of git's xdiff library.
+
+Git's word diffs (`git diff --color-words`) depend on the exact changes
+found by xdiff, which differ from `difflib`'s for ambiguous changes (for
+instance a repeated word). This port, including xdiff's heuristics, finds
+the same changes as git does.
+"""
+
+from collections import Counter
+from collections.abc import Sequence
+
+# C's isspace
+_WHITESPACE = " \t\n\v\f\r"
+
+
+def opcodes(
+    a: Sequence[str],
+    b: Sequence[str],
+    *,
+    indent_heuristic: bool = False,
+    padding: int = 0,
+) -> list[tuple[str, int, int, int, int]]:
+    """
+    Opcodes (as `difflib.SequenceMatcher.get_opcodes`) transforming `a` into
+    `b`, as computed by xdiff. With `indent_heuristic`, `a` and `b` are
+    lines (stripped from their end of line), and groups of added or removed
+    lines are slid as git's `diff.indentHeuristic` does.
+
+    `a` and `b` are considered to be preceded by `padding` empty records,
+    which are included in the opcodes.
+    """
+    # a few padding records are enough to compact changes as if they were
+    # all there (which may take long)
+    kept = min(padding, 2 * (len(a) + len(b)) + _MAX_BLANKS + 2)
+    skipped = padding - kept
+    a = [""] * kept + list(a)
+    b = [""] * kept + list(b)
+    changed_a, changed_b = _xdiff(a, b, indent_heuristic, skipped)
+
+    result = []
+    i = j = 1
+    while i <= len(a) or j <= len(b):
+        i1, j1 = i, j
+        while i <= len(a) and j <= len(b) and not changed_a[i] and not changed_b[j]:
+            i, j = i + 1, j + 1
+        if i > i1:
+            result.append(("equal", i1, i, j1, j))
+            i1, j1 = i, j
+        while changed_a[i]:
+            i += 1
+        while changed_b[j]:
+            j += 1
+        if i > i1 or j > j1:
+            tag = "replace" if i > i1 and j > j1 else "delete" if i > i1 else "insert"
+            result.append((tag, i1, i, j1, j))
+    # flags are shifted by one
+    shift = skipped - 1
+    result = [
+        (tag, i1 + shift, i2 + shift, j1 + shift, j2 + shift)
+        for tag, i1, i2, j1, j2 in result
+    ]
+    if skipped:
+        # padding records are unchanged
+        result[0] = ("equal", 0, result[0][2], 0, result[0][4])
+    return result
+
+
+# xdiff's tuning constants
+_MAX_COST_MIN = 256
+_HEUR_MIN_COST = 256
+_SNAKE_CNT = 20
+_K_HEUR = 4
+_MAX_EQLIMIT = 1024
+_SIMSCAN_WINDOW = 100
+_KPDIS_RUN = 4
+
+
+def _xdiff(
+    a: Sequence[str], b: Sequence[str], indent_heuristic: bool, skipped: int
+) -> tuple[list[bool], list[bool]]:
+    """
+    Mark the changed records of `a` and `b` (preceded by `skipped` other
+    empty records) as xdiff's Myers algorithm (`xdl_do_diff` and
+    `xdl_change_compact`) does. Change flags are shifted by one, with
+    unchanged sentinels at both ends.
+    """
+    classes: dict[str, int] = {"": 0}
+    ha = [classes.setdefault(rec, len(classes)) for rec in a]
+    hb = [classes.setdefault(rec, len(classes)) for rec in b]
+    counts_a, counts_b = Counter(ha), Counter(hb)
+    counts_a[0] += skipped
+    counts_b[0] += skipped
+    changed_a = [False] * (len(a) + 2)
+    changed_b = [False] * (len(b) + 2)
+
+    # skip the common prefix and suffix
+    lim = min(len(a), len(b))
+    start = 0
+    while start < lim and ha[start] == hb[start]:
+        start += 1
+    suffix = 0
+    while suffix < lim - start and ha[-1 - suffix] == hb[-1 - suffix]:
+        suffix += 1
+
+    # records without a match in the other file are changed, do not bother
+    # diffing them
+    index_a = _cleanup_records(
+        ha, counts_b, len(a) + skipped, start, len(a) - suffix, changed_a
+    )
+    index_b = _cleanup_records(
+        hb, counts_a, len(b) + skipped, start, len(b) - suffix, changed_b
+    )
+    ha = [ha[i] for i in index_a]
+    hb = [hb[i] for i in index_b]
+    max_cost = max(_bogosqrt(len(ha) + len(hb) + 3), _MAX_COST_MIN)
+
+    stack = [(0, len(ha), 0, len(hb), False)]
+    while stack:
+        off1, lim1, off2, lim2, need_min = stack.pop()
+        while off1 < lim1 and off2 < lim2 and ha[off1] == hb[off2]:
+            off1, off2 = off1 + 1, off2 + 1
+        while off1 < lim1 and off2 < lim2 and ha[lim1 - 1] == hb[lim2 - 1]:
+            lim1, lim2 = lim1 - 1, lim2 - 1
+        if off1 == lim1:
+            for i in range(off2, lim2):
+                changed_b[index_b[i] + 1] = True
+        elif off2 == lim2:
+            for i in range(off1, lim1):
+                changed_a[index_a[i] + 1] = True
+        else:
+            i1, i2, min_lo, min_hi = _split(
+                ha, off1, lim1, hb, off2, lim2, need_min, max_cost
+            )
+            stack.append((i1, lim1, i2, lim2, min_hi))
+            stack.append((off1, i1, off2, i2, min_lo))
+
+    _compact(a, changed_a, changed_b, indent_heuristic)
+    _compact(b, changed_b, changed_a, indent_heuristic)
+    return changed_a, changed_b
+
+
+def _bogosqrt(n: int) -> int:
+    i = 1
+    while n > 0:
+        i, n = i << 1, n >> 2
+    return i
+
+
+def _cleanup_records(
+    ha: list[int],
+    other_counts: Counter,
+    nrec: int,
+    start: int,
+    end: int,
+    changed: list[bool],
+) -> list[int]:
+    """
+    Return the indices of records of `ha[start:end]` worth diffing, and mark
+    the other ones as changed (`xdl_cleanup_records`). `nrec` is the total
+    number of records of the file.
+    """
+    mlim = min(_bogosqrt(nrec), _MAX_EQLIMIT)
+    dis = [0] * len(ha)
+    for i in range(start, end):
+        matches = other_counts[ha[i]]
+        dis[i] = 0 if matches == 0 else 2 if matches >= mlim else 1
+    index = []
+    for i in range(start, end):
+        if dis[i] == 1 or (dis[i] == 2 and not _clean_mmatch(dis, i, start, end - 1)):
+            index.append(i)
+        else:
+            changed[i + 1] = True
+    return index
+
+
+def _clean_mmatch(dis: list[int], i: int, s: int, e: int) -> bool:
+    """
+    Whether a record with many matches should be discarded, being
+    surrounded by records without matches.
+    """
+    s = max(s, i - _SIMSCAN_WINDOW)
+    e = min(e, i + _SIMSCAN_WINDOW)
+    r, rdis0, rpdis0 = 1, 0, 1
+    while i - r >= s:
+        if dis[i - r] == 0:
+            rdis0 += 1
+        elif dis[i - r] == 2:
+            rpdis0 += 1
+        else:
+            break
+        r += 1
+    if rdis0 == 0:
+        return False
+    r, rdis1, rpdis1 = 1, 0, 1
+    while i + r <= e:
+        if dis[i + r] == 0:
+            rdis1 += 1
+        elif dis[i + r] == 2:
+            rpdis1 += 1
+        else:
+            break
+        r += 1
+    if rdis1 == 0:
+        return False
+    rdis1 += rdis0
+    rpdis1 += rpdis0
+    return rpdis1 * _KPDIS_RUN < rpdis1 + rdis1
+
+
+def _split(
+    ha: list[int],
+    off1: int,
+    lim1: int,
+    hb: list[int],
+    off2: int,
+    lim2: int,
+    need_min: bool,
+    max_cost: int,
+) -> tuple[int, int, bool, bool]:
+    """
+    Find the middle snake of the shortest edit script of `ha[off1:lim1]` and
+    `hb[off2:lim2]`, or a good enough split point if it is too expensive
+    (`xdl_split`). Returns the split point, and whether both halves need a
+    minimal diff.
+    """
+    dmin, dmax = off1 - lim2, lim1 - off2
+    fmid, bmid = off1 - off2, lim1 - lim2
+    odd = (fmid - bmid) & 1
+    fmin = fmax = fmid
+    bmin = bmax = bmid
+    kvdf = {fmid: off1}
+    kvdb = {bmid: lim1}
+    line_max = lim1 + lim2 + 1
+
+    ec = 0
+    while True:
+        ec += 1
+        got_snake = False
+
+        if fmin > dmin:
+            fmin -= 1
+            kvdf[fmin - 1] = -1
+        else:
+            fmin += 1
+        if fmax < dmax:
+            fmax += 1
+            kvdf[fmax + 1] = -1
+        else:
+            fmax -= 1
+        for d in range(fmax, fmin - 1, -2):
+            if kvdf[d - 1] >= kvdf[d + 1]:
+                i1 = kvdf[d - 1] + 1
+            else:
+                i1 = kvdf[d + 1]
+            prev1 = i1
+            i2 = i1 - d
+            while i1 < lim1 and i2 < lim2 and ha[i1] == hb[i2]:
+                i1, i2 = i1 + 1, i2 + 1
+            if i1 - prev1 > _SNAKE_CNT:
+                got_snake = True
+            kvdf[d] = i1
+            if odd and bmin <= d <= bmax and kvdb[d] <= i1:
+                return i1, i2, True, True
+
+        if bmin > dmin:
+            bmin -= 1
+            kvdb[bmin - 1] = line_max
+        else:
+            bmin += 1
+        if bmax < dmax:
+            bmax += 1
+            kvdb[bmax + 1] = line_max
+        else:
+            bmax -= 1
+        for d in range(bmax, bmin - 1, -2):
+            if kvdb[d - 1] < kvdb[d + 1]:
+                i1 = kvdb[d - 1]
+            else:
+                i1 = kvdb[d + 1] - 1
+            prev1 = i1
+            i2 = i1 - d
+            while i1 > off1 and i2 > off2 and ha[i1 - 1] == hb[i2 - 1]:
+                i1, i2 = i1 - 1, i2 - 1
+            if prev1 - i1 > _SNAKE_CNT:
+                got_snake = True
+            kvdb[d] = i1
+            if not odd and fmin <= d <= fmax and i1 <= kvdf[d]:
+                return i1, i2, True, True
+
+        if need_min:
+            continue
+
+        # expensive diff: look for a diagonal that has gone far enough,
+        # ending with a long enough snake
+        if got_snake and ec > _HEUR_MIN_COST:
+            best = 0
+            for d in range(fmax, fmin - 1, -2):
+                i1 = kvdf[d]
+                i2 = i1 - d
+                v = (i1 - off1) + (i2 - off2) - abs(d - fmid)
+                if (
+                    v > _K_HEUR * ec
+                    and v > best
+                    and off1 + _SNAKE_CNT <= i1 < lim1
+                    and off2 + _SNAKE_CNT <= i2 < lim2
+                    and all(ha[i1 - k] == hb[i2 - k] for k in range(1, _SNAKE_CNT + 1))
+                ):
+                    best, split = v, (i1, i2)
+            if best > 0:
+                return split[0], split[1], True, False
+
+            best = 0
+            for d in range(bmax, bmin - 1, -2):
+                i1 = kvdb[d]
+                i2 = i1 - d
+                v = (lim1 - i1) + (lim2 - i2) - abs(d - bmid)
+                if (
+                    v > _K_HEUR * ec
+                    and v > best
+                    and off1 < i1 <= lim1 - _SNAKE_CNT
+                    and off2 < i2 <= lim2 - _SNAKE_CNT
+                    and all(ha[i1 + k] == hb[i2 + k] for k in range(_SNAKE_CNT))
+                ):
+                    best, split = v, (i1, i2)
+            if best > 0:
+                return split[0], split[1], False, True
+
+        # too expensive: take the furthest reaching path
+        if ec >= max_cost:
+            fbest = fbest1 = -1
+            for d in range(fmax, fmin - 1, -2):
+                i1 = min(kvdf[d], lim1)
+                i2 = i1 - d
+                if lim2 < i2:
+                    i1, i2 = lim2 + d, lim2
+                if fbest < i1 + i2:
+                    fbest, fbest1 = i1 + i2, i1
+            bbest = bbest1 = line_max * 2
+            for d in range(bmax, bmin - 1, -2):
+                i1 = max(off1, kvdb[d])
+                i2 = i1 - d
+                if i2 < off2:
+                    i1, i2 = off2 + d, off2
+                if i1 + i2 < bbest:
+                    bbest, bbest1 = i1 + i2, i1
+            if (lim1 + lim2) - bbest < fbest - (off1 + off2):
+                return fbest1, fbest - fbest1, True, False
+            return bbest1, bbest - bbest1, False, True
+
+
+def _compact(
+    recs: Sequence[str],
+    changed: list[bool],
+    changed_other: list[bool],
+    indent_heuristic: bool,
+):
+    """
+    Slide groups of changes in `recs` as far down as possible, unless they
+    can be aligned with changes in the other sequence, or (with
+    `indent_heuristic`) a better looking position is found for them (xdiff's
+    `xdl_change_compact`). `changed` and `changed_other` are shifted by one,
+    as in `_xdiff`.
+    """
+    n = len(changed) - 2
+
+    def slide_down(g):
+        start, end = g
+        if end <= n and recs[start - 1] == recs[end - 1]:
+            changed[start], changed[end] = False, True
+            start, end = start + 1, end + 1
+            while changed[end]:
+                end += 1
+            return start, end
+        return None
+
+    def slide_up(g):
+        start, end = g
+        if start > 1 and recs[start - 2] == recs[end - 2]:
+            start, end = start - 1, end - 1
+            changed[start], changed[end] = True, False
+            while changed[start - 1]:
+                start -= 1
+            return start, end
+        return None
+
+    def group_next(changed, g):
+        if g[1] == len(changed) - 1:
+            return None
+        start = end = g[1] + 1
+        while changed[end]:
+            end += 1
+        return start, end
+
+    def group_previous(changed, g):
+        if g[0] == 1:
+            return None
+        start = end = g[0] - 1
+        while changed[start - 1]:
+            start -= 1
+        return start, end
+
+    g = group_next(changed, (0, 0))
+    go = group_next(changed_other, (0, 0))
+    while g is not None and go is not None:
+        if g[1] > g[0]:
+            while True:
+                size = g[1] - g[0]
+                end_matching_other = -1
+                while (moved := slide_up(g)) is not None:
+                    g = moved
+                    go = group_previous(changed_other, go) or go
+                earliest_end = g[1]
+                if go[1] > go[0]:
+                    end_matching_other = g[1]
+                while (moved := slide_down(g)) is not None:
+                    g = moved
+                    go = group_next(changed_other, go) or go
+                    if go[1] > go[0]:
+                        end_matching_other = g[1]
+                if size == g[1] - g[0]:
+                    break
+            if g[1] == earliest_end:
+                pass
+            elif end_matching_other != -1:
+                # line up with the last group of changes of the other file
+                while go[1] == go[0]:
+                    g = slide_up(g) or g
+                    go = group_previous(changed_other, go) or go
+            elif indent_heuristic:
+                best_shift = _best_shift(recs, g[1] - 1, g[1] - g[0], earliest_end - 1)
+                while g[1] - 1 > best_shift:
+                    g = slide_up(g) or g
+                    go = group_previous(changed_other, go) or go
+        g = group_next(changed, g)
+        go = group_next(changed_other, go) if g is not None else None
+
+
+_MAX_INDENT = 200
+_MAX_BLANKS = 20
+_INDENT_HEURISTIC_MAX_SLIDING = 100
+_INDENT_WEIGHT = 60
+
+
+def _best_shift(recs: Sequence[str], end: int, size: int, earliest_end: int) -> int:
+    """
+    Return the end of the best looking position of a group of `size` added
+    or removed lines, that can be slid from `earliest_end` to `end` (xdiff's
+    indent heuristic).
+    """
+    best_shift = -1
+    best_score = (0, 0)
+    start = max(earliest_end, end - size - 1, end - _INDENT_HEURISTIC_MAX_SLIDING)
+    for shift in range(start, end + 1):
+        indent1, penalty1 = _split_score(recs, shift)
+        indent2, penalty2 = _split_score(recs, shift - size)
+        score = (indent1 + indent2, penalty1 + penalty2)
+        cmp_indents = (score[0] > best_score[0]) - (score[0] < best_score[0])
+        if best_shift == -1 or (
+            _INDENT_WEIGHT * cmp_indents + score[1] - best_score[1] <= 0
+        ):
+            best_score = score
+            best_shift = shift
+    return best_shift
+
+
+def _get_indent(line: str) -> int:
+    """
+    Indentation of a line, or -1 for blank lines.
+    """
+    indent = 0
+    for c in line:
+        if c not in _WHITESPACE:
+            return indent
+        if c == " ":
+            indent += 1
+        elif c == "\t":
+            indent += 8 - indent % 8
+        if indent >= _MAX_INDENT:
+            return _MAX_INDENT
+    return -1
+
+
+def _split_score(recs: Sequence[str], split: int) -> tuple[int, int]:
+    """
+    Return the (effective indent, penalty) score of splitting `recs` before
+    line `split`.
+    """
+    end_of_file = split >= len(recs)
+    indent = -1 if end_of_file else _get_indent(recs[split])
+    pre_blank, pre_indent = 0, -1
+    for i in range(split - 1, -1, -1):
+        pre_indent = _get_indent(recs[i])
+        if pre_indent != -1:
+            break
+        pre_blank += 1
+        if pre_blank == _MAX_BLANKS:
+            pre_indent = 0
+            break
+    post_blank, post_indent = 0, -1
+    for i in range(split + 1, len(recs)):
+        post_indent = _get_indent(recs[i])
+        if post_indent != -1:
+            break
+        post_blank += 1
+        if post_blank == _MAX_BLANKS:
+            post_indent = 0
+            break
+
+    penalty = 0
+    if pre_indent == -1 and pre_blank == 0:
+        # start of file
+        penalty += 1
+    if end_of_file:
+        penalty += 21
+    post_blank = 1 + post_blank if indent == -1 else 0
+    total_blank = pre_blank + post_blank
+    penalty += -30 * total_blank + 6 * post_blank
+    if indent == -1:
+        indent = post_indent
+    if indent == -1 or pre_indent == -1 or indent == pre_indent:
+        pass
+    elif indent > pre_indent:
+        penalty += 10 if total_blank else -4
+    elif post_indent != -1 and post_indent > indent:
+        # outdent
+        penalty += 17 if total_blank else 24
+    else:
+        # dedent
+        penalty += 17 if total_blank else 23
+    return indent, penalty
@@ -0,0 +1,30 @@
+import httpx
+import pytest
+from catleg.config import settings
+from catleg.query import LegifranceBackend
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keep the persistent caches of every test away from the user's."""
+    path = tmp_path / "cache"
+    monkeypatch.setattr(settings, "cache_dir", str(path), raising=False)
+    return path
+
+
+@pytest.fixture
+def mock_backend():
+    """
+    Make Legifrance backends whose requests are answered by `handler` (see
+    `httpx.MockTransport`), with no credentials. Other keyword arguments
+    override backend attributes (e.g. `retry_policy`, `limiter`, `cache`).
+    """
+
+    def make(handler, **attributes) -> LegifranceBackend:
+        back = LegifranceBackend.__new__(LegifranceBackend)
+        back.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        for name, value in attributes.items():
+            setattr(back, name, value)
+        return back
+
+    return make
@@ -0,0 +1,93 @@
+import asyncio
+import copy
+import time
+
+import httpx
+import pytest
+from catleg.article_cache import ArticleCache
+
+from .test_legifrance_queries import _json_from_test_file
+
+
+def _make_cache(tmp_path, **kwargs):
+    params = {"ttl": 3600, "max_size": 1024 * 1024} | kwargs
+    return ArticleCache(tmp_path / "articles.sqlite", **params)
+
+
+@pytest.fixture
+def counting_backend(mock_backend):
+    """Make a LegifranceBackend using `cache`, wired to a mock transport that
+    always returns `reply`, along with a list recording upstream requests."""
+
+    def make(cache, reply):
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return httpx.Response(200, json=reply)
+
+        return mock_backend(handler, cache=cache), requests
+
+    return make
+
+
+def test_cache_roundtrip(tmp_path):
+    cache = _make_cache(tmp_path)
+    assert cache.get("LEGIARTI000038814944") is None
+    cache.put("legiarti000038814944", {"article": {"id": "LEGIARTI000038814944"}})
+    assert cache.get("LEGIARTI000038814944") == {
+        "article": {"id": "LEGIARTI000038814944"}
+    }
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_ttl(tmp_path):
+    cache = _make_cache(tmp_path, ttl=-1)
+    cache.put("LEGIARTI000038814944", {"article": None})
+    assert cache.get("LEGIARTI000038814944") is None
+    cache.put("LEGIARTI000038814944", {"article": None}, permanent=True)
+    assert cache.get("LEGIARTI000038814944") == {"article": None}
+
+
+def test_cache_eviction(tmp_path):
+    cache = _make_cache(tmp_path, max_size=100)
+    cache.put("LEGIARTI000000000001", {"data": "x" * 40})
+    time.sleep(0.01)
+    cache.put("LEGIARTI000000000002", {"data": "y" * 40})
+    time.sleep(0.01)
+    # least recently used entry (the first one) is evicted
+    cache.put("LEGIARTI000000000003", {"data": "z" * 40})
+    assert cache.get("LEGIARTI000000000001") is None
+    assert cache.get("LEGIARTI000000000003") is not None
+
+
+def test_backend_uses_cache(counting_backend, tmp_path):
+    reply = _json_from_test_file("LEGIARTI000038814944.json")
+    back, requests = counting_backend(_make_cache(tmp_path), reply)
+    art1 = asyncio.run(back.article("LEGIARTI000038814944"))
+    art2 = asyncio.run(back.article("LEGIARTI000038814944"))
+    assert len(requests) == 1
+    assert art1.text == art2.text
+
+    back.refresh_cache = True
+    asyncio.run(back.article("LEGIARTI000038814944"))
+    assert len(requests) == 2
+
+
+def test_superseded_articles_are_cached_forever(counting_backend, tmp_path):
+    # an in-force article expires after the TTL...
+    in_force = _json_from_test_file("LEGIARTI000038814944.json")
+    back, requests = counting_backend(_make_cache(tmp_path, ttl=-1), in_force)
+    asyncio.run(back.article("LEGIARTI000038814944"))
+    asyncio.run(back.article("LEGIARTI000038814944"))
+    assert len(requests) == 2
+
+    # ... while a version that ended and has a successor does not
+    superseded = copy.deepcopy(_json_from_test_file("JORFARTI000046186676.json"))
+    superseded["article"]["dateFin"] = 1577836800000  # 2020-01-01
+    back, requests = counting_backend(
+        _make_cache(tmp_path / "other", ttl=-1), superseded
+    )
+    asyncio.run(back.article("JORFARTI000046186676"))
+    asyncio.run(back.article("JORFARTI000046186676"))
+    assert len(requests) == 1
@@ -0,0 +1,134 @@
+import asyncio
+
+import httpx
+import pytest
+from catleg.article_cache import ArticleCache
+from catleg.catleg import app
+from catleg.config import settings
+from catleg.legi_dump import LocalLegiBackend
+from catleg.query import (
+    _make_backend,
+    ArticleCacheBackend,
+    ChainBackend,
+    require_support,
+    UnsupportedRequest,
+)
+from typer.testing import CliRunner
+
+from .test_legifrance_queries import _json_from_test_file
+
+_ARTICLE_ID = "LEGIARTI000006302217"
+
+
+class _FakeBackend:
+    """Slowest tier: serves test fixtures and records requests."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.requests = []
+
+    async def query_article_legi(self, id):
+        self.requests.append(id)
+        if self.fail:
+            raise httpx.ConnectError("unreachable")
+        return _json_from_test_file(f"{id}.json")
+
+    async def code_toc(self, id, at=None):
+        self.requests.append(id)
+        return {"id": id, "articles": [], "sections": []}
+
+    async def aclose(self):
+        pass
+
+
+def _make_cache_tier(tmp_path):
+    return ArticleCacheBackend(
+        ArticleCache(tmp_path / "articles.sqlite", ttl=3600, max_size=1024 * 1024)
+    )
+
+
+def test_chain_writes_back_to_faster_tiers(tmp_path):
+    cache = _make_cache_tier(tmp_path)
+    local = LocalLegiBackend(tmp_path / "legi.sqlite")
+    slow = _FakeBackend()
+    back = ChainBackend([("cache", cache), ("local", local), ("slow", slow)])
+
+    article = asyncio.run(back.article(_ARTICLE_ID))
+    assert article is not None and article.id == _ARTICLE_ID
+    assert slow.requests == [_ARTICLE_ID]
+    # the article has been stored in both faster tiers
+    assert cache.cache.get(_ARTICLE_ID) is not None
+    assert local.dump.reply(_ARTICLE_ID) is not None
+
+    (article,) = asyncio.run(back.articles([_ARTICLE_ID.lower()]))
+    assert article is not None and article.id == _ARTICLE_ID
+    assert slow.requests == [_ARTICLE_ID]
+    asyncio.run(back.aclose())
+
+
+def test_chain_falls_back_on_failure(tmp_path):
+    local = LocalLegiBackend(tmp_path / "legi.sqlite")
+    local.store_reply(_ARTICLE_ID, _json_from_test_file(f"{_ARTICLE_ID}.json"))
+    back = ChainBackend([("slow", _FakeBackend(fail=True)), ("local", local)])
+    article = asyncio.run(back.article(_ARTICLE_ID))
+    assert article is not None and article.id == _ARTICLE_ID
+
+    # missing from all tiers, and the only tier having it fails
+    back = ChainBackend([("local", local), ("slow", _FakeBackend(fail=True))])
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(back.article("LEGIARTI000038814944"))
+    asyncio.run(back.aclose())
+
+
+def test_chain_toc_skips_unsupported_tiers(tmp_path):
+    slow = _FakeBackend()
+    back = ChainBackend(
+        [
+            ("cache", _make_cache_tier(tmp_path)),
+            ("local", LocalLegiBackend(tmp_path / "legi.sqlite")),
+            ("slow", slow),
+        ]
+    )
+    toc = asyncio.run(back.code_toc("LEGITEXT000006069577"))
+    assert toc["id"] == "LEGITEXT000006069577"
+    assert slow.requests == ["LEGITEXT000006069577"]
+    asyncio.run(back.aclose())
+
+
+def test_make_chain_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr("catleg.query.local_db_path", lambda: tmp_path / "legi.sqlite")
+    monkeypatch.setattr(
+        "catleg.query._get_article_cache",
+        lambda: ArticleCache(tmp_path / "articles.sqlite", ttl=60, max_size=1024),
+    )
+    back = _make_backend("cache,local")
+    assert isinstance(back, ChainBackend)
+    assert [name for name, _ in back.tiers] == ["cache", "local"]
+    asyncio.run(back.aclose())
+
+    with pytest.raises(ValueError):
+        _make_backend("cache,nowhere")
+
+
+def test_unsupported_requests_are_rejected(tmp_path, monkeypatch):
+    local = LocalLegiBackend(tmp_path / "legi.sqlite")
+    with pytest.raises(UnsupportedRequest):
+        require_support(local, "jorf", "JORF texts")
+    require_support(local, "code_toc", "tables of contents")
+    back = ChainBackend([("local", local), ("slow", _FakeBackend())])
+    require_support(back, "code_toc", "tables of contents")
+    with pytest.raises(UnsupportedRequest):
+        require_support(back, "legiPart", "whole sections")
+    asyncio.run(back.aclose())
+
+    monkeypatch.setattr("catleg.query.local_db_path", lambda: tmp_path / "legi.sqlite")
+    monkeypatch.setattr(settings, "backend", "local", raising=False)
+    runner = CliRunner()
+    result = runner.invoke(app, ["jorf", "JORFTEXT000046186676"])
+    assert result.exit_code == 1
+    assert "cannot retrieve JORF texts" in result.stderr
+    result = runner.invoke(
+        app, ["skeleton", "LEGITEXT000006069577", "LEGISCTA000006191575", "--bulk"]
+    )
+    assert result.exit_code == 1
+    assert "bulk mode" in result.stderr
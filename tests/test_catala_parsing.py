@@ -1,7 +1,13 @@
 from io import StringIO
 
 from catleg.law_text_fr import ArticleType, find_id_in_string, parse_article_id
-from catleg.parse_catala_markdown import _make_markdown_parser, parse_catala_file
+from catleg.parse_catala_markdown import (
+    _make_markdown_parser,
+    _parse_catala_doc,
+    _parse_catala_tokens,
+    parse_catala_file,
+)
+from markdown_it.tree import SyntaxTreeNode
 from mdformat.renderer import MDRenderer
 
 
@@ -100,3 +106,36 @@ def test_emit_markdown():
     # Note that we deviate from the markdown spec as we may
     # emit more than 6 '#' characters for atx headings.
     assert "######## Article L821-2 | LEGIARTI000038814974" in md_result
+
+
+nested_catala_text = """
+# Titre | LEGIARTI000000000001
+
+> ## Article 2 | LEGIARTI000000000002 [archive]
+>
+> Texte cité.
+
+- élément
+
+  ### Article 3 | LEGIARTI000000000003
+
+  1. un
+  2. deux
+
+## Sans identifiant
+
+Ignoré.
+"""
+
+
+def test_token_extraction_matches_tree_extraction():
+    md_parser = _make_markdown_parser()
+    for text in (catala_text, nested_catala_text):
+        tokens = md_parser.parse(text)
+        articles = _parse_catala_tokens(tokens)
+        assert articles == _parse_catala_doc(SyntaxTreeNode(tokens))
+    assert [(article.id, article.is_archive) for article in articles] == [
+        ("LEGIARTI000000000001", False),
+        ("LEGIARTI000000000002", True),
+        ("LEGIARTI000000000003", False),
+    ]
@@ -2,7 +2,13 @@ import asyncio
 from io import StringIO
 from unittest.mock import AsyncMock, MagicMock, patch
 
-from catleg.find_changes import find_changes
+import httpx
+import pytest
+from catleg.check_expiry import check_expiry, check_expiry_in_files
+from catleg.cli_util import catala_files
+from catleg.config import settings
+from catleg.find_changes import find_changes, find_changes_in_files, watch_changes
+from catleg.query import ArticleBatch
 
 
 _CATALA_WITH_ARCHIVE = """
@@ -30,7 +36,12 @@ def _make_article(id, text="some text"):
     return art
 
 
-def test_archive_articles_are_skipped():
+@pytest.fixture
+def no_parse_cache(monkeypatch):
+    monkeypatch.setattr(settings, "parse_cache", False, raising=False)
+
+
+def test_archive_articles_are_skipped(no_parse_cache):
     """find_changes must not diff archived articles."""
     live_art = _make_article("LEGIARTI000038814944")
     archive_art = _make_article("LEGIARTI000038814974")
@@ -38,7 +49,7 @@ def test_archive_articles_are_skipped():
 
     wdiff_calls = []
 
-    def fake_wdiff(a, b, *, return_exit_code, line_offset):
+    def fake_wdiff(a, b, *, return_exit_code, line_offset, color=True):
         wdiff_calls.append((a, b))
         return b"", 0
 
@@ -49,3 +60,137 @@ def test_archive_articles_are_skipped():
     assert (
         len(wdiff_calls) == 1
     ), f"Expected wdiff called once (non-archived article only), got {len(wdiff_calls)}"
+
+
+def test_fetch_errors_are_reported_in_exit_code(no_parse_cache):
+    batch = ArticleBatch(
+        [_make_article("LEGIARTI000038814944"), None],
+        errors={"LEGIARTI000038814974": httpx.ReadError("connection reset")},
+    )
+    mock_back = _make_mock_backend(batch)
+    with patch("catleg.find_changes.get_backend", return_value=mock_back):
+        with pytest.warns(UserWarning, match="LEGIARTI000038814974' \\(error\\)"):
+            assert asyncio.run(find_changes(StringIO(_CATALA_WITH_ARCHIVE))) == 1
+        with pytest.warns(UserWarning):
+            assert asyncio.run(check_expiry(StringIO(_CATALA_WITH_ARCHIVE))) == 1
+        # articles that do not exist are not errors
+        mock_back.articles.return_value = ArticleBatch(batch)
+        with pytest.warns(UserWarning):
+            assert asyncio.run(find_changes(StringIO(_CATALA_WITH_ARCHIVE))) == 0
+
+
+@pytest.fixture
+def diff_state(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        settings, "diff_state_path", str(tmp_path / "diff_state.sqlite"), raising=False
+    )
+
+
+def test_files_are_checked_with_a_single_batch(
+    no_parse_cache, diff_state, tmp_path, capsys
+):
+    """Articles referenced by several files are fetched once, in one batch."""
+    (tmp_path / "sub").mkdir()
+    first = tmp_path / "a.catala_fr"
+    second = tmp_path / "sub" / "b.catala_fr"
+    first.write_text(_CATALA_WITH_ARCHIVE)
+    second.write_text(_CATALA_WITH_ARCHIVE.split("######")[1].join(["######", ""]))
+    (tmp_path / "notes.md").write_text(_CATALA_WITH_ARCHIVE)
+    paths = catala_files([tmp_path, first])
+    assert paths == [first, second]
+
+    mock_back = _make_mock_backend(
+        [_make_article("LEGIARTI000038814944"), _make_article("LEGIARTI000038814974")]
+    )
+    with patch("catleg.find_changes.get_backend", return_value=mock_back):
+        asyncio.run(find_changes_in_files(paths))
+
+    mock_back.articles.assert_awaited_once_with(
+        ["LEGIARTI000038814944", "LEGIARTI000038814974"]
+    )
+    err = capsys.readouterr().err
+    assert f"{first}: found 1 articles" in err and f"{second}: found 1" in err
+    assert "Found 2 articles with diffs in 2 files" in err
+
+
+def test_shared_backends_are_closed(no_parse_cache, diff_state, tmp_path, capsys):
+    path = tmp_path / "a.catala_fr"
+    path.write_text(_CATALA_WITH_ARCHIVE)
+    mock_back = _make_mock_backend(ArticleBatch([None, None]))
+    with patch("catleg.find_changes.get_backend", return_value=mock_back):
+        for module, main in [
+            ("catleg.find_changes", find_changes_in_files),
+            ("catleg.check_expiry", check_expiry_in_files),
+        ]:
+            with patch(f"{module}.aclose_backends") as aclose:
+                with pytest.warns(UserWarning):
+                    asyncio.run(main([path]))
+            aclose.assert_awaited_once()
+
+
+def test_unchanged_articles_are_not_diffed_again(
+    no_parse_cache, diff_state, tmp_path, capsys
+):
+    path = tmp_path / "a.catala_fr"
+    path.write_text(_CATALA_WITH_ARCHIVE)
+    mock_back = _make_mock_backend(
+        [_make_article("LEGIARTI000038814944"), _make_article("LEGIARTI000038814974")]
+    )
+
+    def run(full=False):
+        with patch("catleg.find_changes.get_backend", return_value=mock_back):
+            asyncio.run(find_changes_in_files([path], full=full))
+        return capsys.readouterr()
+
+    assert "LEGIARTI000038814944" in run().out
+    second = run()
+    assert "LEGIARTI000038814944" not in second.out
+    assert "1 unchanged articles were not diffed again (1 of them had diffs)" in (
+        second.err
+    )
+    assert "LEGIARTI000038814944" in run(full=True).out
+
+    # a changed text is diffed again
+    path.write_text(_CATALA_WITH_ARCHIVE.replace("here", "there"))
+    changed = run()
+    assert "LEGIARTI000038814944" in changed.out
+    assert "not diffed again" not in changed.err
+
+
+def test_watch_diffs_changed_articles(no_parse_cache, tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(settings, "diff_state", False, raising=False)
+    path = tmp_path / "a.catala_fr"
+    path.write_text(_CATALA_WITH_ARCHIVE.replace(" [archive]", ""))
+    mock_back = _make_mock_backend(
+        [_make_article("LEGIARTI000038814944"), _make_article("LEGIARTI000038814974")]
+    )
+
+    async def fake_watch_files(paths, *, interval=None):
+        assert paths == [path]
+        yield []
+        path.write_text(
+            _CATALA_WITH_ARCHIVE.replace(" [archive]", "").replace("here", "there")
+        )
+        yield [path]
+
+    with patch("catleg.find_changes.get_backend", return_value=mock_back), patch(
+        "catleg.find_changes.watch_files", fake_watch_files
+    ):
+        asyncio.run(watch_changes([path]))
+
+    out, err = capsys.readouterr()
+    assert f"{path}: found 2 articles with diffs" in err
+    assert out.count("LEGIARTI000038814944") == 2
+    assert out.count("LEGIARTI000038814974") == 1
+    assert f"{path}: 1 changed articles, 1 with diffs" in err
+
+
+def test_catala_files_globs(tmp_path):
+    (tmp_path / "a.catala_fr").write_text("")
+    (tmp_path / "b.catala_fr").write_text("")
+    assert catala_files([tmp_path / "*.catala_fr"]) == [
+        tmp_path / "a.catala_fr",
+        tmp_path / "b.catala_fr",
+    ]
+    with pytest.raises(FileNotFoundError):
+        catala_files([tmp_path / "*.catala_en"])
@@ -0,0 +1,170 @@
+import asyncio
+import io
+import tarfile
+from datetime import date
+
+import pytest
+from catleg.legi_dump import LegiDump, LocalLegiBackend
+from catleg.skeleton import _article_skeleton
+
+_PREFIX = "legi/global/code_et_TNC_en_vigueur/code_en_vigueur/LEGI/TEXT/00/00/00/00/00"
+
+_TEXT_VERSION = """<?xml version="1.0" encoding="UTF-8"?>
+<TEXTE_VERSION>
+<META><META_COMMUN><ID>LEGITEXT000000000001</ID><NATURE>CODE</NATURE></META_COMMUN>
+<META_SPEC><META_TEXTE_CHRONICLE><CID>LEGITEXT000000000001</CID></META_TEXTE_CHRONICLE>
+<META_TEXTE_VERSION><TITRE>Code de test</TITRE><TITREFULL>Code de test.</TITREFULL>
+<ETAT>VIGUEUR</ETAT><DATE_DEBUT>1970-01-01</DATE_DEBUT><DATE_FIN>2999-01-01</DATE_FIN>
+</META_TEXTE_VERSION></META_SPEC></META>
+</TEXTE_VERSION>
+"""
+
+_TEXT_STRUCT = """<?xml version="1.0" encoding="UTF-8"?>
+<TEXTELR>
+<META><META_COMMUN><ID>LEGITEXT000000000001</ID><NATURE>CODE</NATURE></META_COMMUN>
+<META_SPEC><META_TEXTE_CHRONICLE><CID>LEGITEXT000000000001</CID></META_TEXTE_CHRONICLE>
+</META_SPEC></META>
+<STRUCT>
+<LIEN_SECTION_TA cid="LEGISCTA000000000001" debut="1970-01-01" etat="VIGUEUR"
+ fin="2999-01-01" id="LEGISCTA000000000001" niv="1">Partie législative</LIEN_SECTION_TA>
+</STRUCT>
+</TEXTELR>
+"""
+
+_SECTION = """<?xml version="1.0" encoding="UTF-8"?>
+<SECTION_TA>
+<ID>LEGISCTA000000000001</ID><TITRE_TA>Partie législative</TITRE_TA>
+<CONTEXTE><TEXTE cid="LEGITEXT000000000001"><TITRE_TXT debut="1970-01-01"
+ fin="2999-01-01" id_txt="LEGITEXT000000000001">Code de test</TITRE_TXT></TEXTE>
+</CONTEXTE>
+<STRUCTURE_TA>
+<LIEN_ART debut="1970-01-01" etat="MODIFIE" fin="2020-01-01" id="LEGIARTI000000000001"
+ num="L1" origine="LEGI"/>
+<LIEN_ART debut="2020-01-01" etat="VIGUEUR" fin="2999-01-01" id="LEGIARTI000000000002"
+ num="L1" origine="LEGI"/>
+</STRUCTURE_TA>
+</SECTION_TA>
+"""
+
+_ARTICLE = """<?xml version="1.0" encoding="UTF-8"?>
+<ARTICLE>
+<META><META_COMMUN><ID>{id}</ID><ORIGINE>LEGI</ORIGINE><NATURE>Article</NATURE>
+</META_COMMUN><META_SPEC><META_ARTICLE><NUM>L1</NUM><ETAT>{etat}</ETAT>
+<DATE_DEBUT>{debut}</DATE_DEBUT><DATE_FIN>{fin}</DATE_FIN><TYPE>AUTONOME</TYPE>
+</META_ARTICLE></META_SPEC></META>
+<CONTEXTE><TEXTE cid="LEGITEXT000000000001"><TITRE_TXT debut="1970-01-01"
+ fin="2999-01-01" id_txt="LEGITEXT000000000001">Code de test</TITRE_TXT>
+<TM><TITRE_TM debut="1970-01-01" fin="2999-01-01" id="LEGISCTA000000000001">Partie
+ législative</TITRE_TM></TM></TEXTE></CONTEXTE>
+<VERSIONS>
+<VERSION etat="MODIFIE"><LIEN_ART debut="1970-01-01" etat="MODIFIE" fin="2020-01-01"
+ id="LEGIARTI000000000001" num="L1" origine="LEGI"/></VERSION>
+<VERSION etat="VIGUEUR"><LIEN_ART debut="2020-01-01" etat="VIGUEUR" fin="2999-01-01"
+ id="LEGIARTI000000000002" num="L1" origine="LEGI"/></VERSION>
+</VERSIONS>
+<NOTA><CONTENU/></NOTA>
+<BLOC_TEXTUEL><CONTENU>{content}</CONTENU></BLOC_TEXTUEL>
+</ARTICLE>
+"""
+
+
+def _make_archive(path, documents):
+    with tarfile.open(path, "w:gz") as tar:
+        for name, contents in documents.items():
+            data = contents.encode("utf-8")
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+@pytest.fixture
+def local_backend(tmp_path):
+    archive = tmp_path / "LEGI_test.tar.gz"
+    _make_archive(
+        archive,
+        {
+            f"{_PREFIX}/LEGITEXT000000000001/texte/version/LEGITEXT000000000001.xml": (
+                _TEXT_VERSION
+            ),
+            f"{_PREFIX}/LEGITEXT000000000001/texte/struct/LEGITEXT000000000001.xml": (
+                _TEXT_STRUCT
+            ),
+            f"{_PREFIX}/LEGITEXT000000000001/section_ta/LEGISCTA000000000001.xml": (
+                _SECTION
+            ),
+            f"{_PREFIX}/LEGITEXT000000000001/article/LEGIARTI000000000001.xml": (
+                _ARTICLE.format(
+                    id="LEGIARTI000000000001",
+                    etat="MODIFIE",
+                    debut="1970-01-01",
+                    fin="2020-01-01",
+                    content="<p>Ancienne version.</p>",
+                )
+            ),
+            f"{_PREFIX}/LEGITEXT000000000001/article/LEGIARTI000000000002.xml": (
+                _ARTICLE.format(
+                    id="LEGIARTI000000000002",
+                    etat="VIGUEUR",
+                    debut="2020-01-01",
+                    fin="2999-01-01",
+                    content="<p>Nouvelle version<br/>de l'article &amp; fin.</p>",
+                )
+            ),
+        },
+    )
+    dump = LegiDump(tmp_path / "legi.sqlite")
+    assert dump.ingest(archive) == 5
+    dump.close()
+    back = LocalLegiBackend(tmp_path / "legi.sqlite")
+    yield back
+    asyncio.run(back.aclose())
+
+
+def test_local_articles(local_backend):
+    old, new, missing = asyncio.run(
+        local_backend.articles(
+            ["LEGIARTI000000000001", "LEGIARTI000000000002", "LEGIARTI000000000003"]
+        )
+    )
+    assert missing is None
+    assert old.text == "Ancienne version."
+    assert not old.is_open_ended
+    assert old.latest_version_id == "LEGIARTI000000000002"
+    assert new.text == "Nouvelle version de l'article & fin."
+    assert new.is_open_ended
+    assert new.latest_version_id == "LEGIARTI000000000002"
+
+
+def test_local_article_skeleton(local_backend):
+    reply = asyncio.run(local_backend.query_article_legi("LEGIARTI000000000002"))
+    skel = asyncio.run(_article_skeleton(reply))
+    assert "# Code de test" in skel
+    assert "### Article L1 | LEGIARTI000000000002" in skel
+    assert "Nouvelle version" in skel
+
+
+def test_local_code_toc(local_backend):
+    toc = asyncio.run(local_backend.code_toc("LEGITEXT000000000001"))
+    (section,) = toc["sections"]
+    assert section["title"] == "Partie législative"
+    assert [article["id"] for article in section["articles"]] == [
+        "LEGIARTI000000000002"
+    ]
+    old_toc = asyncio.run(
+        local_backend.code_toc("LEGITEXT000000000001", at=date(2010, 1, 1))
+    )
+    assert [article["id"] for article in old_toc["sections"][0]["articles"]] == [
+        "LEGIARTI000000000001"
+    ]
+
+
+def test_local_list_codes(local_backend):
+    codes = asyncio.run(local_backend.list_codes())
+    assert codes == [
+        {
+            "id": "LEGITEXT000000000001",
+            "cid": "LEGITEXT000000000001",
+            "titre": "Code de test",
+            "etat": "VIGUEUR",
+        }
+    ]
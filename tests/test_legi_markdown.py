@@ -0,0 +1,87 @@
+import mdformat
+import pytest
+from catleg.legi_markdown import convert_html, format_markdown, UnsupportedMarkup
+from catleg.query import html_to_markdown
+from catleg.render import MDFORMAT_OPTIONS
+from markdownify import markdownify as md  # type: ignore
+
+from .test_legifrance_queries import _json_from_test_file
+
+_FIXTURES = [
+    ("CETATEXT000035260342.json", "text"),
+    ("JORFARTI000046186676.json", "article"),
+    ("LEGIARTI000006302217.json", "article"),
+    ("LEGIARTI000038814944.json", "article"),
+    ("LEGIARTI000044983201.json", "article"),
+    ("LEGIARTI000046790860.json", "article"),
+]
+
+
+def _mdformat(text):
+    return mdformat.text(text, options=MDFORMAT_OPTIONS)
+
+
+@pytest.mark.parametrize("filename,key", _FIXTURES)
+def test_same_output_as_markdownify_and_mdformat(filename, key):
+    reply = _json_from_test_file(filename)[key]
+    text_html, nota_html = reply["texteHtml"], reply.get("notaHtml") or ""
+    for html in (text_html, nota_html):
+        assert convert_html(html) == md(html, strip=["a"])
+    article_md = html_to_markdown(text_html, nota_html)
+    formatted = format_markdown(article_md, MDFORMAT_OPTIONS["wrap"])
+    assert formatted is None or formatted == _mdformat(article_md)
+
+
+@pytest.mark.parametrize(
+    "html",
+    [
+        "<p>Texte <sup>1</sup> <a href='/x?a=1&b=2'>lien</a>&nbsp;;<br/>suite</p>",
+        "<ul><li>un</li><li>deux<ol start='3'><li>trois</li></ol></li></ul>fin",
+        "<table><tr><th>a</th><th colspan='2'>b</th></tr>"
+        "<tr><td>1<br>2</td><td><p>3</p></td></tr></table>",
+        "<div>\n  <b> gras </b><i>italique</i>_*</div>\n<rech_ecli>x</rech_ecli>",
+        "<p>ouvert <span>sans</p> fermeture",
+    ],
+)
+def test_converter_subset(html):
+    assert convert_html(html) == md(html, strip=["a"])
+
+
+@pytest.mark.parametrize(
+    "html", ["<h1>Titre</h1>", "<pre>code</pre>", "a<!-- commentaire -->b", "a&foo;"]
+)
+def test_converter_unsupported_markup(html):
+    with pytest.raises(UnsupportedMarkup):
+        convert_html(html)
+    # the markdownify fallback is used
+    assert html_to_markdown(html) == md(html, strip=["a"]).strip()
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "I.-Peuvent bénéficier :  \n1° Les personnes ;  \n\n  \nII.-Les autres.",
+        "Un mot " * 10 + "- 2 -\n" + "mot " * 20 + "12. + = # > --- ===",
+        "Avec\xa0espace insécable " + "x" * 90 + " et ligne longue",
+        "Vu :  \n  \n- le code civil ;  \n  \n- le code de la construction " * 3,
+        "1. Un\n\n2. Deux " + "mot " * 30 + "\n\n3) Trois\n\nFin\n\n9. Neuf",
+    ],
+)
+def test_formatter_paragraphs_and_lists(text):
+    assert format_markdown(text, 80) == _mdformat(text)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "texte\n1. liste",
+        "- - liste",
+        "Titre\n---",
+        "*emphase*",
+        "[lien](x)",
+        "    code",
+        "",
+    ],
+)
+def test_formatter_other_markdown(text):
+    assert format_markdown(text, 80) is None
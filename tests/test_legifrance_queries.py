@@ -6,16 +6,18 @@ from json import load
 
 import httpx
 import pytest
-from catleg.catleg import _lf_article, _skeleton
+from catleg.catleg import _lf_article, _section_ids
 from catleg.cli_util import parse_legifrance_url
 from catleg.law_text_fr import find_id_in_string
 from catleg.query import (
     _article_from_legifrance_reply,
     _get_legifrance_credentials,
+    aclose_backends,
     get_backend,
-    LegifranceBackend,
+    LegifranceAuth,
 )
-from catleg.skeleton import _article_skeleton
+from catleg.skeleton import _article_skeleton, markdown_skeleton
+from catleg.token_cache import TokenCache
 
 
 def _json_from_test_file(fname):
@@ -66,10 +68,16 @@ def test_query_article_by_url():
     reason="this test requires legifrance credentials",
 )
 def test_section_skeleton():
-    skel = _skeleton("LEGITEXT000031366350", "LEGISCTA000031367367")
+    skel = asyncio.run(
+        markdown_skeleton(*_section_ids("LEGITEXT000031366350", "LEGISCTA000031367367"))
+    )
     assert "téléservice" in skel
-    skel2 = _skeleton(
-        "https://www.legifrance.gouv.fr/codes/section_lc/LEGITEXT000031366350/LEGISCTA000031367367/"
+    skel2 = asyncio.run(
+        markdown_skeleton(
+            *_section_ids(
+                "https://www.legifrance.gouv.fr/codes/section_lc/LEGITEXT000031366350/LEGISCTA000031367367/"
+            )
+        )
     )
     assert skel == skel2
 
@@ -163,23 +171,22 @@ def test_jorf_provenance_entry_not_mistaken_for_successor_jorfarti():
     assert res.latest_version_id == "LEGIARTI000046873170"
 
 
-def _make_capturing_backend():
-    """Return a LegifranceBackend wired to a mock transport that records the
-    last request body and always returns HTTP 200 with an empty JSON object."""
+@pytest.fixture
+def capturing_backend(mock_backend):
+    """A LegifranceBackend wired to a mock transport that records the last
+    request body and always returns HTTP 200 with an empty JSON object."""
     captured = {}
 
     def handler(request: httpx.Request) -> httpx.Response:
         captured["body"] = json.loads(request.content)
         return httpx.Response(200, json={})
 
-    back = LegifranceBackend.__new__(LegifranceBackend)
-    back.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
-    return back, captured
+    return mock_backend(handler), captured
 
 
-def test_legi_part_explicit_date_is_forwarded():
+def test_legi_part_explicit_date_is_forwarded(capturing_backend):
     """legiPart(at=...) must send the exact date passed by the caller."""
-    back, captured = _make_capturing_backend()
+    back, captured = capturing_backend
     try:
         asyncio.run(back.legiPart("LEGITEXT000006069577", at=date(2025, 1, 15)))
     except Exception:
@@ -187,11 +194,11 @@ def test_legi_part_explicit_date_is_forwarded():
     assert captured.get("body", {}).get("date") == "2025-01-15"
 
 
-def test_legi_part_default_date_is_today():
+def test_legi_part_default_date_is_today(capturing_backend):
     """legiPart() with no date argument must send today's date, not the date
     the module was imported (regression for the mutable-default-argument bug).
     """
-    back, captured = _make_capturing_backend()
+    back, captured = capturing_backend
     try:
         asyncio.run(back.legiPart("LEGITEXT000006069577"))
     except Exception:
@@ -204,7 +211,7 @@ def test_article_skeleton_cetatext():
     not 'article') and render the decision title and content without crashing.
     """
     raw = _json_from_test_file("CETATEXT000035260342.json")
-    result = _article_skeleton(raw, breadcrumbs=False)
+    result = asyncio.run(_article_skeleton(raw, breadcrumbs=False))
     assert "398563" in result  # decision number appears in the titre
     assert "Vu la procédure" in result  # opening words of the decision text
 
@@ -235,3 +242,126 @@ def test_parse_legifrance_urls():
         "https://www.legifrance.gouv.fr/ceta/id/CETATEXT000035260342"
     )
     assert res == ("article", "CETATEXT000035260342")
+
+
+def test_backend_is_shared_within_event_loop(monkeypatch):
+    monkeypatch.setattr(
+        "catleg.query._get_legifrance_credentials",
+        lambda raise_if_missing: ("client_id", "client_secret"),
+    )
+    monkeypatch.setattr("catleg.query._get_article_cache", lambda: None)
+
+    async def get_twice():
+        back1, back2 = get_backend("legifrance"), get_backend("legifrance")
+        await aclose_backends()
+        return back1, back2
+
+    back1, back2 = asyncio.run(get_twice())
+    assert back1 is back2
+    back3, _ = asyncio.run(get_twice())
+    assert back3 is not back1
+    assert get_backend("legifrance") is not get_backend("legifrance")
+
+
+def _make_auth_client(auth, counts, *, reject_tokens=()):
+    """Return a client using `auth`, wired to a mock transport serving both
+    the token endpoint and the API. `counts` records the number of calls."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url == LegifranceAuth.TOKEN_URL:
+            counts["token"] += 1
+            return httpx.Response(
+                200,
+                json={"access_token": f"token{counts['token']}", "expires_in": 3600},
+            )
+        counts["api"] += 1
+        if request.headers["Authorization"] in reject_tokens:
+            return httpx.Response(401)
+        return httpx.Response(200, json={})
+
+    return httpx.AsyncClient(auth=auth, transport=httpx.MockTransport(handler))
+
+
+def test_single_token_refresh_for_concurrent_requests():
+    counts = {"token": 0, "api": 0}
+    client = _make_auth_client(LegifranceAuth("id", "secret"), counts)
+
+    async def query_many():
+        await asyncio.gather(
+            *[client.post("https://example.org/api") for _ in range(10)]
+        )
+
+    asyncio.run(query_many())
+    assert counts == {"token": 1, "api": 10}
+
+
+def test_token_cache_is_shared(tmp_path):
+    counts = {"token": 0, "api": 0}
+    for _ in range(2):
+        auth = LegifranceAuth("id", "secret", token_cache=TokenCache(tmp_path, "id"))
+        client = _make_auth_client(auth, counts)
+        asyncio.run(client.post("https://example.org/api"))
+    assert counts == {"token": 1, "api": 2}
+
+
+def test_rejected_token_is_refreshed():
+    counts = {"token": 0, "api": 0}
+    auth = LegifranceAuth("id", "secret")
+    client = _make_auth_client(auth, counts, reject_tokens=["Bearer token1"])
+    response = asyncio.run(client.post("https://example.org/api"))
+    assert response.status_code == 200
+    assert counts == {"token": 2, "api": 2}
+
+
+def test_token_request_times_out():
+    auth = LegifranceAuth("id", "secret", timeout=2)
+    timeouts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url == LegifranceAuth.TOKEN_URL:
+            timeouts.append(request.extensions["timeout"])
+            raise httpx.ReadTimeout("stalled", request=request)
+        return httpx.Response(200, json={})
+
+    client = httpx.AsyncClient(auth=auth, transport=httpx.MockTransport(handler))
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(client.post("https://example.org/api"))
+    assert timeouts == [httpx.Timeout(2).as_dict()]
+
+
+@pytest.fixture
+def counting_backend(mock_backend):
+    """A LegifranceBackend wired to a mock transport that serves
+    LEGIARTI000038814944 and records the requested article ids."""
+    requested = []
+    reply = _json_from_test_file("LEGIARTI000038814944.json")
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(json.loads(request.content)["id"])
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json=reply)
+
+    return mock_backend(handler), requested
+
+
+def test_articles_are_deduplicated(counting_backend):
+    back, requested = counting_backend
+    ids = ["LEGIARTI000038814944", "legiarti000038814944", "LEGIARTI000038814944"]
+    articles = asyncio.run(back.articles(ids))
+    assert requested == ["LEGIARTI000038814944"]
+    assert len(articles) == 3
+    assert all(article.id == "LEGIARTI000038814944" for article in articles)
+
+
+def test_concurrent_queries_are_coalesced(counting_backend):
+    back, requested = counting_backend
+
+    async def query_concurrently():
+        return await asyncio.gather(
+            back.article("LEGIARTI000038814944"),
+            back.article("article-l822-2-legiarti000038814944"),
+        )
+
+    art1, art2 = asyncio.run(query_concurrently())
+    assert requested == ["LEGIARTI000038814944"]
+    assert art1.text == art2.text
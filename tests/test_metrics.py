@@ -0,0 +1,38 @@
+import asyncio
+
+import httpx
+import pytest
+from catleg import metrics
+from catleg.metrics import Counter, Histogram, UPSTREAM_RESPONSES
+
+from .test_legifrance_queries import _json_from_test_file
+
+
+def test_counter_and_histogram_rendering():
+    requests = Counter("test_requests_total", "Test requests", ["kind"])
+    latency = Histogram("test_latency_seconds", "Test latency", buckets=[0.1, 1])
+    requests.inc(kind="article")
+    requests.inc(2, kind='say "hi"')
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+    with pytest.raises(ValueError):
+        requests.inc()
+
+    text = metrics.render()
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{kind="article"} 1' in text
+    assert 'test_requests_total{kind="say \\"hi\\""} 2' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_latency_seconds_sum 5.55" in text
+    assert "test_latency_seconds_count 3" in text
+
+
+def test_upstream_requests_are_recorded(mock_backend):
+    reply = _json_from_test_file("LEGIARTI000038814944.json")
+    before = UPSTREAM_RESPONSES.value(endpoint="getArticle", status="200")
+    back = mock_backend(lambda request: httpx.Response(200, json=reply))
+    asyncio.run(back.article("LEGIARTI000038814944"))
+    assert UPSTREAM_RESPONSES.value(endpoint="getArticle", status="200") == before + 1
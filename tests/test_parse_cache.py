@@ -0,0 +1,92 @@
+import os
+from io import StringIO
+
+import pytest
+from catleg.config import settings
+from catleg.parse_cache import (
+    clear_parse_cache,
+    parse_catala_file_cached,
+    parse_catala_files,
+)
+from catleg.parse_catala_markdown import parse_catala_file
+
+_CATALA_TEXT = """
+# Code de la sécurité sociale
+
+###### Article L822-2 | LEGIARTI000038814944
+
+Article text here.
+
+```catala
+champ d'application Test:
+  définition x égal à 1
+```
+
+###### Article L821-2 [archive] | LEGIARTI000038814974
+
+Old archived text.
+"""
+
+
+@pytest.fixture
+def parse_cache(tmp_path):
+    settings.set("parse_cache_path", str(tmp_path / "parsed.sqlite"))
+    clear_parse_cache()
+    yield
+    settings.set("parse_cache_path", None)
+    clear_parse_cache()
+
+
+def _parse(path):
+    with open(path) as f:
+        return parse_catala_file_cached(f, file_path=path)
+
+
+def _fail(f, *, file_path=None):
+    raise AssertionError("file should not be parsed again")
+
+
+def test_parsed_articles_are_cached(parse_cache, tmp_path, monkeypatch):
+    path = tmp_path / "test.catala_fr"
+    path.write_text(_CATALA_TEXT)
+    with open(path) as f:
+        expected = parse_catala_file(f, file_path=path)
+    assert _parse(path) == expected
+
+    monkeypatch.setattr("catleg.parse_cache.parse_catala_file", _fail)
+    clear_parse_cache()
+    assert _parse(path) == expected
+    # touched but unchanged files are not parsed again either
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert _parse(path) == expected
+
+
+def test_modified_files_are_parsed_again(parse_cache, tmp_path):
+    path = tmp_path / "test.catala_fr"
+    path.write_text(_CATALA_TEXT)
+    assert _parse(path)[0].text.strip() == "Article text here."
+    path.write_text(_CATALA_TEXT.replace("Article text", "Modified text"))
+    assert _parse(path)[0].text.strip() == "Modified text here."
+
+
+def test_unnamed_files_do_not_open_the_cache(parse_cache, tmp_path):
+    articles = parse_catala_file_cached(StringIO(_CATALA_TEXT))
+    assert articles[0].text.strip() == "Article text here."
+    assert not (tmp_path / "parsed.sqlite").exists()
+
+
+def test_files_are_parsed_in_worker_processes(parse_cache, tmp_path, monkeypatch):
+    paths = [tmp_path / f"{i}.catala_fr" for i in range(3)]
+    for path in paths:
+        path.write_text(_CATALA_TEXT)
+    # the first file is cached, the others are parsed by the pool
+    expected = [article.text for article in _parse(paths[0])]
+    monkeypatch.setattr("catleg.parse_cache._PARALLEL_SIZE", 0)
+    settings.set("parse_processes", 2)
+    try:
+        results = parse_catala_files(paths)
+    finally:
+        settings.set("parse_processes", None)
+    assert [[a.text for a in articles] for articles in results] == [expected] * 3
+    assert [articles[0].file_path for articles in results] == paths
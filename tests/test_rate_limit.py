@@ -0,0 +1,81 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httpx
+from catleg.rate_limit import AdaptiveLimiter, parse_retry_after
+from catleg.retry import RetryPolicy
+
+
+def test_concurrency_is_bounded():
+    limiter = AdaptiveLimiter(initial=2, maximum=2, max_per_second=1000)
+    running = []
+    max_running = 0
+
+    async def job():
+        nonlocal max_running
+        await limiter.acquire()
+        running.append(1)
+        max_running = max(max_running, len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        limiter.release(0.01)
+
+    async def run_all():
+        await asyncio.gather(*[job() for _ in range(8)])
+
+    asyncio.run(run_all())
+    assert max_running == 2
+    assert limiter.in_flight == 0
+
+
+def test_aimd():
+    limiter = AdaptiveLimiter(initial=8, maximum=10, target_latency=1.0)
+
+    async def one_request(latency, **kwargs):
+        await limiter.acquire()
+        limiter.release(latency, **kwargs)
+
+    # slow requests do not increase concurrency
+    asyncio.run(one_request(5.0))
+    assert limiter.concurrency == 8
+    # fast ones do
+    for _ in range(10):
+        asyncio.run(one_request(0.1))
+    assert limiter.concurrency == 9
+    # throttling halves concurrency, once per throttling episode
+    # (requests sent before the first throttled one completed do not count)
+    asyncio.run(one_request(0.1, throttled=True, retry_after=0.05))
+    asyncio.run(one_request(10.0, throttled=True, retry_after=0.05))
+    assert limiter.concurrency == 4
+
+    # no request starts before the delay asked for by the server
+    start = time.monotonic()
+    asyncio.run(one_request(0.1, throttled=True, retry_after=0.2))
+    asyncio.run(one_request(0.1))
+    assert time.monotonic() - start >= 0.2
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("garbage") is None
+    in_a_minute = datetime.now(timezone.utc) + timedelta(seconds=60)
+    assert 50 < parse_retry_after(format_datetime(in_a_minute, usegmt=True)) <= 60
+
+
+def test_throttled_requests_are_retried(mock_backend):
+    statuses = [429, 503, 200]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            statuses.pop(0), headers={"Retry-After": "0"}, json={"article": None}
+        )
+
+    back = mock_backend(
+        handler, limiter=AdaptiveLimiter(), retry_policy=RetryPolicy(backoff_base=0.01)
+    )
+    reply = asyncio.run(back.query_article_legi("LEGIARTI000038814944"))
+    assert reply == {"article": None}
+    assert statuses == []
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from catleg.config import settings
+from catleg.format_cache import format_key, FormatCache
+from catleg.render import (
+    clear_format_cache,
+    format_article,
+    format_articles,
+    MDFORMAT_OPTIONS,
+    shutdown_render_pool,
+)
+
+from .test_legifrance_queries import _json_from_test_file
+from .test_skeleton import _ARTICLE_FIXTURES
+
+
+def _fixture_html(article_id):
+    article = _json_from_test_file(f"{article_id}.json")["article"]
+    return article["texteHtml"], article["notaHtml"] or ""
+
+
+@pytest.fixture
+def render_processes():
+    settings.set("render_processes", 2)
+    # make sure articles are rendered by the pool
+    settings.set("format_cache", False)
+    yield
+    settings.set("render_processes", 0)
+    settings.set("format_cache", True)
+    shutdown_render_pool()
+
+
+@pytest.fixture
+def format_cache(tmp_path):
+    settings.set("format_cache_persist", True)
+    settings.set("format_cache_path", str(tmp_path / "formatted.sqlite"))
+    clear_format_cache()
+    yield
+    settings.set("format_cache_persist", False)
+    clear_format_cache()
+
+
+def test_format_articles_in_process_pool(render_processes):
+    articles = [_fixture_html(article_id) for article_id in _ARTICLE_FIXTURES]
+    expected = [format_article(*article) for article in articles]
+    assert asyncio.run(format_articles(articles)) == expected
+    # the pool is reused by subsequent event loops
+    assert asyncio.run(format_articles(articles[:1])) == expected[:1]
+
+
+def test_formatted_articles_are_memoized(format_cache, monkeypatch):
+    articles = [_fixture_html(article_id) for article_id in _ARTICLE_FIXTURES]
+    expected = asyncio.run(format_articles(articles))
+
+    def fail(articles):
+        raise AssertionError("articles should not be rendered again")
+
+    monkeypatch.setattr("catleg.render._format_batch", fail)
+    assert asyncio.run(format_articles(articles)) == expected
+    assert format_article(*articles[0]) == expected[0]
+    # formatted articles are persisted
+    clear_format_cache()
+    assert asyncio.run(format_articles(articles[::-1])) == expected[::-1]
+
+
+def test_format_key(monkeypatch):
+    key = format_key("<p>text</p>", "", MDFORMAT_OPTIONS)
+    assert key == format_key("<p>text</p>", "", dict(MDFORMAT_OPTIONS))
+    assert key != format_key("<p>text</p>", "<p>nota</p>", MDFORMAT_OPTIONS)
+    assert key != format_key("<p>text</p>", "", {"wrap": 60, "number": True})
+    # renderings by another version of the converter are not reused
+    monkeypatch.setattr("catleg.format_cache._RENDERER_VERSIONS", [0, "1.0", "1.0"])
+    assert key != format_key("<p>text</p>", "", MDFORMAT_OPTIONS)
+
+
+def test_format_cache_evicts_from_memory(tmp_path):
+    cache = FormatCache(1)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") is None and cache.get("b") == "B"
+    persistent = FormatCache(1, tmp_path / "formatted.sqlite")
+    persistent.put("a", "A")
+    persistent.put("b", "B")
+    assert persistent.get("a") == "A"
+    persistent.close()
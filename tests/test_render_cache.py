@@ -0,0 +1,71 @@
+import asyncio
+
+from web.render_cache import RenderCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _make_renderer(results):
+    calls = []
+
+    async def render():
+        calls.append(len(calls))
+        await asyncio.sleep(0)
+        return results[len(calls) - 1]
+
+    return render, calls
+
+
+def test_render_cache_coalesces_and_caches():
+    cache = RenderCache(max_bytes=1024, ttl=60)
+    render, calls = _make_renderer(["# rendered"])
+
+    async def main():
+        return await asyncio.gather(
+            cache.get_or_render("key", render), cache.get_or_render("key", render)
+        )
+
+    assert asyncio.run(main()) == ["# rendered", "# rendered"]
+    assert asyncio.run(cache.get_or_render("key", render)) == "# rendered"
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_render_cache_serves_stale_while_revalidating():
+    clock = _Clock()
+    cache = RenderCache(max_bytes=1024, ttl=60, stale_ttl=60, clock=clock)
+    render, calls = _make_renderer(["v1", "v2", "v3"])
+
+    async def main():
+        assert await cache.get_or_render("key", render) == "v1"
+        clock.now = 90
+        # stale: served, and refreshed in the background
+        assert await cache.get_or_render("key", render) == "v1"
+        await asyncio.sleep(0.01)
+        assert await cache.get_or_render("key", render) == "v2"
+        clock.now = 300
+        # expired
+        assert await cache.get_or_render("key", render) == "v3"
+
+    asyncio.run(main())
+    assert (cache.hits, cache.stale_hits, cache.misses) == (1, 1, 2)
+    assert cache.hit_rate == 0.5
+
+
+def test_render_cache_byte_limit():
+    cache = RenderCache(max_bytes=10, ttl=60)
+    cache.put("a", "é" * 3)
+    cache.put("b", "b" * 4)
+    assert cache.size == 10
+    cache.get("a")
+    cache.put("c", "c")
+    # "b" is the least recently used entry
+    assert cache.get("b") is None and cache.get("a") == "ééé"
+    cache.put("d", "d" * 11)
+    assert cache.get("d") is None and len(cache) == 2
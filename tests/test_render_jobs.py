@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+from web.jobs import DONE, FAILED, RenderJobs, TooManyJobs
+
+from .test_render_cache import _Clock
+
+
+async def _parts(*parts, fail=False):
+    for part in parts:
+        await asyncio.sleep(0)
+        yield part
+    if fail:
+        raise RuntimeError("upstream error")
+
+
+def test_jobs_run_in_background_and_are_shared():
+    done = []
+    jobs = RenderJobs(workers=1, max_jobs=4, retention=60, on_done=done.append)
+
+    async def main():
+        job = jobs.submit("key", lambda: _parts("# Title", "text"))
+        assert jobs.submit("key", lambda: _parts("other")) is job
+        # a follower giving up does not stop the job
+        follower = job.follow()
+        assert await follower.__anext__() == "# Title"
+        await follower.aclose()
+        assert [part async for part in job.follow()] == ["# Title", "text"]
+        return job
+
+    job = asyncio.run(main())
+    assert job.status == DONE and job.markdown == "# Title\n\ntext"
+    assert done == [job]
+    assert jobs.get(job.id) is job
+
+
+def test_failed_jobs_are_reported_and_retried():
+    jobs = RenderJobs(workers=2, max_jobs=4, retention=60)
+
+    async def main():
+        job = jobs.submit("key", lambda: _parts("# Title", fail=True))
+        with pytest.raises(RuntimeError):
+            [part async for part in job.follow()]
+        assert job.status == FAILED and job.error == "upstream error"
+        retry = jobs.submit("key", lambda: _parts("# Title"))
+        assert retry is not job
+        await retry.follow().__anext__()
+
+    asyncio.run(main())
+
+
+def test_job_limits_and_retention():
+    clock = _Clock()
+    jobs = RenderJobs(workers=1, max_jobs=1, retention=60, clock=clock)
+
+    async def main():
+        job = jobs.submit("a", lambda: _parts("a"))
+        with pytest.raises(TooManyJobs):
+            jobs.submit("b", lambda: _parts("b"))
+        [part async for part in job.follow()]
+        jobs.submit("b", lambda: _parts("b"))
+        clock.now = 120
+        return job
+
+    job = asyncio.run(main())
+    assert jobs.get(job.id) is None
+
+
+def test_finished_jobs_are_bounded():
+    clock = _Clock()
+    jobs = RenderJobs(
+        workers=1,
+        max_jobs=4,
+        retention=60,
+        max_finished=2,
+        max_finished_bytes=5,
+        clock=clock,
+    )
+
+    async def main():
+        finished = []
+        for key, text in [("a", "a"), ("b", "b"), ("c", "c"), ("d", "dddd")]:
+            job = jobs.submit(key, lambda text=text: _parts(text))
+            [part async for part in job.follow()]
+            finished.append(job)
+            clock.now += 1
+        return finished
+
+    a, b, c, d = asyncio.run(main())
+    # "a" exceeds the count, "b" the size
+    assert [jobs.get(job.id) for job in (a, b, c, d)] == [None, None, c, d]
+
+
+def test_cancelled_jobs_fail():
+    jobs = RenderJobs(workers=1, max_jobs=4, retention=60)
+
+    async def main():
+        started = asyncio.Event()
+
+        async def render():
+            started.set()
+            await asyncio.sleep(3600)
+            yield "never"
+
+        job = jobs.submit("key", render)
+        await started.wait()
+        for task in list(jobs._tasks):
+            task.cancel()
+        with pytest.raises(RuntimeError, match="cancelled"):
+            [part async for part in job.follow()]
+        return job
+
+    job = asyncio.run(main())
+    assert job.status == FAILED
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+
+import httpx
+import pytest
+from catleg.retry import is_transient_error, RetryPolicy
+
+from .test_legifrance_queries import _json_from_test_file
+
+
+@pytest.fixture
+def flaky_backend(mock_backend):
+    def make(handler):
+        policy = RetryPolicy(max_retries=2, backoff_base=0.01)
+        return mock_backend(handler, retry_policy=policy)
+
+    return make
+
+
+def test_backoff_is_bounded():
+    policy = RetryPolicy(backoff_base=1, backoff_max=5)
+    assert all(0 <= policy.delay(attempt) <= 5 for attempt in range(10))
+    assert policy.delay(0, retry_after=3) >= 3
+    assert policy.delay(0, retry_after=3600) == 5
+
+
+def test_error_classification():
+    policy = RetryPolicy()
+    request = httpx.Request("POST", "https://example.org")
+    assert policy.is_retryable_status(502)
+    assert not policy.is_retryable_status(404)
+    read_error = httpx.ReadError("connection reset", request=request)
+    assert policy.is_retryable_error(read_error, idempotent=True)
+    # the request may have been processed: only retry idempotent requests
+    assert not policy.is_retryable_error(read_error, idempotent=False)
+    connect_error = httpx.ConnectError("connection refused", request=request)
+    assert policy.is_retryable_error(connect_error, idempotent=False)
+    assert is_transient_error(read_error)
+    forbidden = httpx.Response(403, request=request)
+    assert not is_transient_error(
+        httpx.HTTPStatusError("forbidden", request=request, response=forbidden)
+    )
+    assert not is_transient_error(ValueError())
+
+
+def test_transient_failures_are_retried(flaky_backend):
+    outcomes = ["reset", 502]
+    reply = _json_from_test_file("LEGIARTI000038814944.json")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        outcome = outcomes.pop(0) if outcomes else 200
+        if outcome == "reset":
+            raise httpx.ReadError("connection reset", request=request)
+        return httpx.Response(outcome, json=reply)
+
+    back = flaky_backend(handler)
+    article = asyncio.run(back.article("LEGIARTI000038814944"))
+    assert "logement" in article.text
+
+
+def test_permanent_failures_are_not_retried(flaky_backend):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(400, json={})
+
+    back = flaky_backend(handler)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(back.query_article_legi("LEGIARTI000038814944"))
+    assert len(calls) == 1
+
+
+def test_failures_are_reported_per_article(flaky_backend, caplog):
+    reply = _json_from_test_file("LEGIARTI000038814944.json")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if b"LEGIARTI000000000000" in request.content:
+            return httpx.Response(502)
+        return httpx.Response(200, json=reply)
+
+    back = flaky_backend(handler)
+    with caplog.at_level(logging.WARNING):
+        articles = asyncio.run(
+            back.articles(["LEGIARTI000038814944", "LEGIARTI000000000000"])
+        )
+    assert articles[0] is not None and articles[1] is None
+    assert "LEGIARTI000000000000" in caplog.text
+    assert list(articles.errors) == ["LEGIARTI000000000000"]
+
+
+def test_permanent_failures_are_raised(flaky_backend):
+    reply = _json_from_test_file("LEGIARTI000038814944.json")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if b"LEGIARTI000000000000" in request.content:
+            return httpx.Response(403)
+        return httpx.Response(200, json=reply)
+
+    back = flaky_backend(handler)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(back.articles(["LEGIARTI000038814944", "LEGIARTI000000000000"]))
@@ -1,10 +1,19 @@
+import asyncio
 from io import StringIO
 
 import pytest
 
+from catleg.config import settings
 from catleg.parse_catala_markdown import parse_catala_file
 from catleg.query import _article_from_legifrance_reply
-from catleg.skeleton import _article_skeleton, _formatted_article
+from catleg.render import shutdown_render_pool
+from catleg.skeleton import (
+    _article_skeleton,
+    _formatted_article,
+    iter_markdown_skeleton,
+    markdown_skeleton,
+)
+from catleg.toc import clear_toc_cache, code_toc_index, TocIndex
 
 from .test_legifrance_queries import _json_from_test_file
 
@@ -13,7 +22,7 @@ from .test_legifrance_queries import _json_from_test_file
 def test_no_article_renumbering():
     article_json = _json_from_test_file("LEGIARTI000044983201.json")
     article = _article_from_legifrance_reply(article_json)
-    formatted_article_md = _formatted_article(article)
+    formatted_article_md = asyncio.run(_formatted_article(article))
     assert "1. Le bénéfice ou revenu imposable est constitué" in formatted_article_md
     assert "2. Le revenu global net annuel" in formatted_article_md
     assert (
@@ -92,7 +101,208 @@ les conditions prévues pour cette dernière.
 @pytest.mark.parametrize("breadcrumbs", [False, True])
 def test_article_skeleton(breadcrumbs: bool):
     article_json = _json_from_test_file("LEGIARTI000044983201.json")
-    askel = _article_skeleton(article_json)
+    askel = asyncio.run(_article_skeleton(article_json))
     assert "excédent du produit brut" in askel
     if breadcrumbs:
         assert "## Première Partie : Impôts d'État" in askel
+
+
+_ARTICLE_FIXTURES = [
+    "LEGIARTI000038814944",
+    "LEGIARTI000046790860",
+    "LEGIARTI000044983201",
+]
+
+_TOC = {
+    "id": "LEGITEXT000000000001",
+    "cid": "LEGITEXT000000000001",
+    "title": "Code de test",
+    "articles": [],
+    "sections": [
+        {
+            "id": "LEGISCTA000000000001",
+            "cid": "LEGISCTA000000000001",
+            "title": "Chapitre Ier",
+            "articles": [
+                {"id": "LEGIARTI000038814944", "num": "L822-2"},
+                {"id": "LEGIARTI000046790860", "num": "L822-3"},
+            ],
+            "sections": [
+                {
+                    "id": "LEGISCTA000000000002",
+                    "cid": "LEGISCTA000000000002",
+                    "title": "Section 1",
+                    "articles": [{"id": "LEGIARTI000044983201", "num": "13"}],
+                    "sections": [],
+                }
+            ],
+        }
+    ],
+}
+
+
+class _FakeBackend:
+    """Backend serving _TOC and the article test fixtures"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def code_toc(self, id, at=None):
+        self.calls.append(("code_toc", id))
+        return _TOC
+
+    async def legiPart(self, id, at=None, section_id=None):
+        self.calls.append(("legiPart", id, section_id))
+        # only include the contents of the first two articles
+        return {
+            "id": id,
+            "sections": [
+                {
+                    "id": "LEGISCTA000000000001",
+                    "articles": [
+                        {
+                            "id": article_id,
+                            "content": _json_from_test_file(f"{article_id}.json")[
+                                "article"
+                            ]["texteHtml"],
+                            "nota": None,
+                        }
+                        for article_id in _ARTICLE_FIXTURES[:2]
+                    ],
+                }
+            ],
+        }
+
+    async def articles(self, ids):
+        ids = list(ids)
+        self.calls.append(("articles", ids))
+        return [
+            _article_from_legifrance_reply(_json_from_test_file(f"{id}.json"))
+            for id in ids
+        ]
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    back = _FakeBackend()
+    monkeypatch.setattr("catleg.skeleton.get_backend", lambda spec=None: back)
+    clear_toc_cache()
+    yield back
+    clear_toc_cache()
+
+
+def test_section_skeleton_fetches_articles_in_one_batch(fake_backend):
+    back = fake_backend
+    skel = asyncio.run(
+        markdown_skeleton("LEGITEXT000000000001", "LEGISCTA000000000001")
+    )
+    assert back.calls == [
+        ("code_toc", "LEGITEXT000000000001"),
+        ("articles", _ARTICLE_FIXTURES),
+    ]
+    # articles are output in TOC order, under their section headings
+    positions = [
+        skel.index(heading)
+        for heading in [
+            "## Chapitre Ier",
+            "### Article L822-2 | LEGIARTI000038814944",
+            "### Article L822-3 | LEGIARTI000046790860",
+            "### Section 1",
+            "#### Article 13 | LEGIARTI000044983201",
+        ]
+    ]
+    assert positions == sorted(positions)
+    assert "excédent du produit brut" in skel
+
+
+def test_toc_index():
+    index = TocIndex(_TOC)
+    section, level = index.lookup("LEGISCTA000000000002")
+    assert section["title"] == "Section 1" and level == 3
+    article, level = index.lookup("legiarti000046790860")
+    assert article["num"] == "L822-3" and level == 2
+    assert index.lookup("LEGISCTA000000000003") is None
+
+
+def test_toc_is_cached(fake_backend):
+    for section_id in ["LEGISCTA000000000001", "LEGISCTA000000000002"]:
+        asyncio.run(markdown_skeleton("LEGITEXT000000000001", section_id))
+    toc_calls = [call for call in fake_backend.calls if call[0] == "code_toc"]
+    assert len(toc_calls) == 1
+
+
+def test_toc_cache_is_per_backend(monkeypatch):
+    first, second = _FakeBackend(), _FakeBackend()
+    clear_toc_cache()
+    asyncio.run(code_toc_index(first, "LEGITEXT000000000001"))
+    asyncio.run(code_toc_index(second, "LEGITEXT000000000001"))
+    asyncio.run(code_toc_index(first, "LEGITEXT000000000001"))
+    assert len(first.calls) == len(second.calls) == 1
+    # the cache size is read from settings when the cache is used
+    monkeypatch.setattr(settings, "toc_cache_size", 0, raising=False)
+    asyncio.run(code_toc_index(first, "LEGITEXT000000000001"))
+    assert len(first.calls) == 2
+    clear_toc_cache()
+
+
+def test_missing_section(fake_backend):
+    with pytest.raises(ValueError):
+        asyncio.run(markdown_skeleton("LEGITEXT000000000001", "LEGISCTA000000000003"))
+
+
+def test_bulk_section_skeleton(fake_backend):
+    skel = asyncio.run(
+        markdown_skeleton("LEGITEXT000000000001", "LEGISCTA000000000001", bulk=True)
+    )
+    assert fake_backend.calls == [
+        ("code_toc", "LEGITEXT000000000001"),
+        ("legiPart", "LEGITEXT000000000001", "LEGISCTA000000000001"),
+        # only articles missing from the legiPart reply are fetched
+        ("articles", _ARTICLE_FIXTURES[2:]),
+    ]
+    assert "Peuvent bénéficier d'une aide personnelle au logement" in skel
+    assert "excédent du produit brut" in skel
+
+
+def test_streamed_section_skeleton(fake_backend, monkeypatch):
+    skel = asyncio.run(
+        markdown_skeleton("LEGITEXT000000000001", "LEGISCTA000000000001")
+    )
+    monkeypatch.setattr("catleg.skeleton._FETCH_BATCH_SIZE", 2)
+    fake_backend.calls.clear()
+
+    async def collect():
+        return [
+            part
+            async for part in iter_markdown_skeleton(
+                "LEGITEXT000000000001", "LEGISCTA000000000001"
+            )
+        ]
+
+    parts = asyncio.run(collect())
+    assert parts[0] == "## Chapitre Ier"
+    assert "\n\n".join(parts) == skel
+    # articles are fetched in batches, in TOC order
+    assert fake_backend.calls == [
+        ("articles", _ARTICLE_FIXTURES[:2]),
+        ("articles", _ARTICLE_FIXTURES[2:]),
+    ]
+
+
+def test_section_skeleton_rendered_in_process_pool(fake_backend):
+    skel = asyncio.run(
+        markdown_skeleton("LEGITEXT000000000001", "LEGISCTA000000000001")
+    )
+    settings.set("render_processes", 2)
+    settings.set("format_cache", False)
+    try:
+        assert (
+            asyncio.run(
+                markdown_skeleton("LEGITEXT000000000001", "LEGISCTA000000000001")
+            )
+            == skel
+        )
+    finally:
+        settings.set("render_processes", 0)
+        settings.set("format_cache", True)
+        shutdown_render_pool()
@@ -0,0 +1,34 @@
+import asyncio
+import os
+
+from catleg.watch import watch_files
+
+
+def test_modified_files_are_reported(tmp_path):
+    first = tmp_path / "a.catala_fr"
+    second = tmp_path / "b.catala_fr"
+    first.write_text("a")
+    second.write_text("b")
+
+    async def main():
+        changes = watch_files([first, second], interval=0.01)
+
+        async def next_change(modify):
+            change = asyncio.ensure_future(anext(changes))
+            await asyncio.sleep(0.05)
+            modify()
+            return await change
+
+        def touch_second():
+            # same size, later modification time
+            os.utime(second, ns=(0, os.stat(second).st_mtime_ns + 1_000_000_000))
+
+        def recreate_first():
+            first.unlink()
+            first.write_text("new a")
+
+        assert await next_change(touch_second) == [second]
+        assert await next_change(recreate_first) == [first]
+        await changes.aclose()
+
+    asyncio.run(asyncio.wait_for(main(), timeout=10))
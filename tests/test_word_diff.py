@@ -0,0 +1,80 @@
+import shutil
+
+import pytest
+from catleg import git_diff
+from catleg.config import settings
+from catleg.word_diff import wdiff, word_diff
+from catleg.xdiff import opcodes
+
+_DIFFS = [
+    ("Le chat mange la souris.", "Le chien mange la souris verte.", 10),
+    ("a b c", "a c", 0),
+    ("a c", "a b c", 0),
+    ("a b c", "b c", 2),
+    ("a b", "a b c", 0),
+    ("a  b", "a b", 0),
+    ("", "x y", 3),
+    ("x y", "", 0),
+    ("code  _y a a le _y la", "code  _y a le _y la civil;", 2),
+    (" article « ", "«  le article ", 40),
+    ("un\ndeux\ntrois\nquatre\ncinq\nsix\nsept\nhuit", "un\ndeux\nquatre\nCINQ", 10),
+    ("Article 1\n\n  a\n\nb\n" * 3, "Article 1\n\n  a\n\n\nb\n" * 2 + "\xa0: 1°", 100),
+    # git only splits lines on "\n"
+    ("le texte de l'article est ici", "le texte\r\nde l'article est ici", 10),
+    ("un\rdeux trois", "un\rdeux\rtrois", 5),
+    ("un\u2028deux\x85trois\x0cquatre", "un\u2028deux\x1ctrois quatre", 3),
+    ("_y\ra\r\n1\n2\n3\n4\n", "_y\ra\r\n1\n2\n3\n4\nb\n", 1),
+    ("x\r\ny\x0bz\n", "x\r\ny z\x0c\n", 0),
+]
+
+
+@pytest.mark.parametrize("st1,st2,line_offset", _DIFFS)
+@pytest.mark.parametrize("color", [True, False])
+@pytest.mark.skipif(shutil.which("git") is None, reason="this test requires git")
+def test_same_output_as_git(st1, st2, line_offset, color):
+    assert wdiff(
+        st1, st2, return_exit_code=True, line_offset=line_offset, color=color
+    ) == git_diff.wdiff(
+        st1, st2, return_exit_code=True, line_offset=line_offset, color=color
+    )
+
+
+def test_word_diff():
+    assert word_diff("a b c", "a c", line_offset=3, color=False) == (
+        b"@@ -1,4 +1,4 @@\n\n\n\na[-b-] c"
+    )
+    assert word_diff("Le chat", "Le chien", line_offset=100) == (
+        b"\x1b[36m@@ -98,4 +98,4 @@\x1b[m\n\n\n\n"
+        b"Le \x1b[31mchat\x1b[m\x1b[32mchien\x1b[m"
+    )
+    # whitespace at end of lines is ignored
+    assert word_diff("a b", "a b \n") == b""
+    assert wdiff("a b", "a b \n", return_exit_code=True) == (b"", 0)
+
+
+def test_repeated_words_are_slid_as_git_does():
+    assert opcodes(["a", "b", "a", "c"], ["a", "c"]) == [
+        ("equal", 0, 1, 0, 1),
+        ("delete", 1, 3, 1, 1),
+        ("equal", 3, 4, 1, 2),
+    ]
+    assert opcodes(["x"], ["x", "x"], padding=2) == [
+        ("equal", 0, 3, 0, 3),
+        ("insert", 3, 3, 3, 4),
+    ]
+
+
+@pytest.fixture
+def git_diff_engine():
+    settings.set("diff_engine", "git")
+    yield
+    settings.set("diff_engine", "python")
+
+
+def test_git_diff_engine(git_diff_engine, monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        git_diff, "wdiff", lambda *args, **kwargs: calls.append(args) or (b"", 0)
+    )
+    assert wdiff("a", "b", return_exit_code=True) == (b"", 0)
+    assert calls == [("a", "b")]
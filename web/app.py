@@ -1,22 +1,95 @@
 import asyncio
+import logging
 import os
 import re
+import time
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
 from pathlib import Path
-from urllib.parse import urlparse
+from urllib.parse import urlencode, urlparse
 
+from catleg import metrics
 from catleg.law_text_fr import ArticleType, find_id_in_string
-from catleg.skeleton import article_skeleton, jorf_markdown_skeleton, markdown_skeleton
+from catleg.metrics import Counter, Histogram
+from catleg.query import aclose_backends, open_backends
+from catleg.render import shutdown_render_pool
+from catleg.skeleton import (
+    article_skeleton,
+    iter_jorf_markdown_skeleton,
+    iter_markdown_skeleton,
+)
 
 from fastapi import FastAPI, Request
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
-app = FastAPI(title="catleg markdown viewer", version="0.1.0")
+from web.jobs import RenderJobs, TooManyJobs
+from web.render_cache import RenderCache
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Share one backend (Legifrance connection pool and auth token,
+    # local database...) across all requests
+    try:
+        await open_backends()
+    except ValueError as e:
+        logger.warning("Could not open backend: %s", e)
+    yield
+    await aclose_backends()
+    shutdown_render_pool()
+
+
+app = FastAPI(title="catleg markdown viewer", version="0.1.0", lifespan=lifespan)
 
 templates = Jinja2Templates(directory=str(Path(__file__).parent / "templates"))
 
 SKELETON_TIMEOUT_SEC = float(os.getenv("CATLEG_SKELETON_TIMEOUT_SECONDS", "5"))
 
+# Rendered markdown is cached in memory: renderings are fresh for
+# CATLEG_RENDER_CACHE_TTL_SECONDS, then served while being refreshed in the
+# background for CATLEG_RENDER_CACHE_STALE_SECONDS
+RENDER_CACHE = RenderCache(
+    max_bytes=int(os.getenv("CATLEG_RENDER_CACHE_MAX_MB", "64")) * 1024 * 1024,
+    ttl=float(os.getenv("CATLEG_RENDER_CACHE_TTL_SECONDS", "3600")),
+    stale_ttl=float(os.getenv("CATLEG_RENDER_CACHE_STALE_SECONDS", "86400")),
+)
+
+# Renderings of texts and code sections run as background jobs, at most
+# CATLEG_RENDER_WORKERS at once
+RENDER_JOBS = RenderJobs(
+    workers=int(os.getenv("CATLEG_RENDER_WORKERS", "4")),
+    max_jobs=int(os.getenv("CATLEG_RENDER_MAX_JOBS", "32")),
+    retention=float(os.getenv("CATLEG_RENDER_JOB_RETENTION_SECONDS", "3600")),
+    max_finished=int(os.getenv("CATLEG_RENDER_MAX_FINISHED_JOBS", "256")),
+    max_finished_bytes=int(os.getenv("CATLEG_RENDER_FINISHED_JOBS_MAX_MB", "64"))
+    * 1024
+    * 1024,
+    on_done=lambda job: RENDER_CACHE.put(job.key, job.markdown),
+)
+
+WEB_REQUESTS = Counter(
+    "catleg_web_requests_total",
+    "Web viewer requests, by endpoint and query kind",
+    ["endpoint", "kind"],
+)
+WEB_REQUEST_SECONDS = Histogram(
+    "catleg_web_request_seconds",
+    "Web viewer request latency (until the end of streamed responses), "
+    "by endpoint and query kind",
+    ["endpoint", "kind"],
+)
+
+NO_ID_FOUND_ERROR = "Aucun identifiant pris en charge n'a été trouvé dans votre saisie."
+TIMEOUT_ERROR = "La génération du texte a dépassé le délai autorisé."
+BACKGROUND_MESSAGE = (
+    "Ce texte est long : sa génération se poursuit en arrière-plan. "
+    "Il s'affichera ici une fois terminé."
+)
+BUSY_ERROR = "Le service est surchargé, veuillez réessayer dans quelques instants."
+
 
 def _classify(query: str):
     """
@@ -88,46 +161,208 @@ def _classify(query: str):
     return None
 
 
+def _record_request(endpoint: str, cls: dict | None, start: float):
+    kind = cls.get("kind", "unknown") if cls else "invalid"
+    WEB_REQUESTS.inc(endpoint=endpoint, kind=kind)
+    WEB_REQUEST_SECONDS.observe(
+        time.perf_counter() - start, endpoint=endpoint, kind=kind
+    )
+
+
+def _cache_key(cls: dict) -> tuple | None:
+    """
+    Normalized render cache key for a classified query
+    """
+    kind = cls.get("kind")
+    if kind in ("article", "jorftext") and cls.get("id"):
+        return (kind, cls["id"].upper())
+    if kind == "code_section" and cls.get("text_id") and cls.get("section_id"):
+        return (kind, cls["text_id"].upper(), cls["section_id"].upper())
+    return None
+
+
+def _parts(cls: dict) -> AsyncGenerator[str, None]:
+    parts = _skeleton_parts(cls)
+    assert parts is not None
+    return parts
+
+
+async def _render(cls: dict) -> str:
+    return "\n\n".join([part async for part in _parts(cls)])
+
+
+def _skeleton_parts(cls: dict) -> AsyncGenerator[str, None] | None:
+    """
+    Return an async iterator over the parts of the skeleton for a classified
+    query, or None if the query is not supported.
+    """
+    kind = cls.get("kind")
+    id_ = cls.get("id")
+    if kind == "article" and id_:
+        return _single_part(article_skeleton(id_))
+    if kind == "jorftext" and id_:
+        return iter_jorf_markdown_skeleton(id_)
+    if kind == "code_section":
+        text_id = cls.get("text_id")
+        section_id = cls.get("section_id")
+        if text_id and section_id:
+            return iter_markdown_skeleton(text_id, section_id)
+    return None
+
+
+async def _single_part(skeleton) -> AsyncGenerator[str, None]:
+    yield await skeleton
+
+
+async def _with_idle_timeout(
+    parts: AsyncGenerator[str, None], timeout: float
+) -> AsyncGenerator[str, None]:
+    """
+    Generate `parts`, failing with a timeout if the next part takes more
+    than `timeout` seconds to be generated.
+    """
+    try:
+        while True:
+            try:
+                part = await asyncio.wait_for(anext(parts), timeout=timeout)
+            except StopAsyncIteration:
+                return
+            yield part
+    finally:
+        await parts.aclose()
+
+
 @app.get("/")
 async def home(request: Request, query: str = ""):
+    start = time.perf_counter()
     md = None
     error = None
+    stream_url = None
     if query:
         cls = _classify(query)
         if not cls:
-            error = "Aucun identifiant pris en charge n'a été trouvé dans votre saisie."
+            error = NO_ID_FOUND_ERROR
         else:
             kind = cls.get("kind")
             id_ = cls.get("id")
-            try:
-                if kind == "article" and id_:
-                    md = await asyncio.wait_for(
-                        article_skeleton(id_), timeout=SKELETON_TIMEOUT_SEC
-                    )
-                elif kind == "jorftext" and id_:
+            if kind == "article" and id_:
+                try:
                     md = await asyncio.wait_for(
-                        jorf_markdown_skeleton(id_), timeout=SKELETON_TIMEOUT_SEC
+                        RENDER_CACHE.get_or_render(
+                            _cache_key(cls), lambda: article_skeleton(id_)
+                        ),
+                        timeout=SKELETON_TIMEOUT_SEC,
                     )
-                elif kind == "code_section":
-                    text_id = cls.get("text_id")
-                    section_id = cls.get("section_id")
-                    if text_id and section_id:
-                        md = await asyncio.wait_for(
-                            markdown_skeleton(text_id, section_id),
-                            timeout=SKELETON_TIMEOUT_SEC,
-                        )
-                    else:
-                        error = "URL de section de code invalide."
-                else:
-                    error = "Aucun identifiant pris en charge n'a été"
-                    " trouvé dans votre saisie."
-            except asyncio.TimeoutError:
-                error = "La génération du texte a dépassé le délai autorisé."
-            except Exception as e:
-                error = str(e)
+                except asyncio.TimeoutError:
+                    error = TIMEOUT_ERROR
+                except Exception as e:
+                    error = str(e)
+            elif kind == "code_section" and not (
+                cls.get("text_id") and cls.get("section_id")
+            ):
+                error = "URL de section de code invalide."
+            elif kind in ("jorftext", "code_section"):
+                # texts and code sections can be large: the page fetches them
+                # from the streaming endpoint and displays them progressively
+                stream_url = "/stream?" + urlencode({"query": query})
+            else:
+                error = NO_ID_FOUND_ERROR
+        _record_request("home", cls, start)
     return templates.TemplateResponse(
+        request,
         "home.html",
-        {"request": request, "query": query, "md": md, "error": error},
+        {
+            "query": query,
+            "md": md,
+            "error": error,
+            "stream_url": stream_url,
+        },
+    )
+
+
+@app.get("/stream")
+async def stream(query: str):
+    """
+    Stream the Markdown rendering of a query, fragment by fragment
+    (headings and articles, separated by blank lines), as soon as they
+    are produced.
+
+    The rendering runs as a background job (whose identifier is sent in
+    the `X-Catleg-Job` header). If a fragment takes longer than the
+    skeleton timeout, the response ends but the job goes on: its result
+    can be retrieved from `/jobs/{job_id}`, and later requests for the
+    same query are served from it. Errors occurring once the response has
+    started are reported at the end of the document.
+    """
+    start = time.perf_counter()
+    cls = _classify(query)
+    key = _cache_key(cls) if cls else None
+    if cls is None or key is None:
+        _record_request("stream", cls, start)
+        return PlainTextResponse(NO_ID_FOUND_ERROR, status_code=400)
+    cached = RENDER_CACHE.get(key, lambda: _render(cls))
+    if cached is not None:
+        _record_request("stream", cls, start)
+        return PlainTextResponse(cached, media_type="text/markdown; charset=utf-8")
+    try:
+        job = RENDER_JOBS.submit(key, lambda: _parts(cls))
+    except TooManyJobs:
+        _record_request("stream", cls, start)
+        return PlainTextResponse(BUSY_ERROR, status_code=503)
+
+    async def fragments() -> AsyncGenerator[str, None]:
+        separator = ""
+        try:
+            async for part in _with_idle_timeout(job.follow(), SKELETON_TIMEOUT_SEC):
+                yield separator + part
+                separator = "\n\n"
+        except asyncio.TimeoutError:
+            yield f"{separator}> {BACKGROUND_MESSAGE}\n"
+        except Exception as e:
+            yield f"{separator}> Erreur : {e}\n"
+        finally:
+            _record_request("stream", cls, start)
+
+    return StreamingResponse(
+        fragments(),
+        media_type="text/markdown; charset=utf-8",
+        # disable buffering by reverse proxies
+        headers={
+            "X-Accel-Buffering": "no",
+            "Cache-Control": "no-cache",
+            "X-Catleg-Job": job.id,
+        },
+    )
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """
+    Status of a rendering job, including the rendered Markdown once done.
+    Finished jobs are kept for CATLEG_RENDER_JOB_RETENTION_SECONDS.
+    """
+    job = RENDER_JOBS.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "unknown job"}, status_code=404)
+    return job.to_json()
+
+
+@app.get("/cache")
+async def cache_stats():
+    """
+    Render cache statistics (size, hit rate...)
+    """
+    return RENDER_CACHE.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """
+    Metrics in the Prometheus text format: requests, upstream Legifrance
+    requests, auth token refreshes, caches and rendering time.
+    """
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
     )
 
 
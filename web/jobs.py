@@ -0,0 +1,196 @@
+"""
+Background rendering jobs for the web viewer.
+
+Large texts can take longer to render than a visitor is willing to wait.
+Renderings run as jobs in a bounded pool, independently of the requests
+following them: a request giving up does not cancel the rendering, and
+finished jobs are kept for a while so that their result can be retrieved
+later.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections.abc import AsyncGenerator, AsyncIterator, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class TooManyJobs(Exception):
+    pass
+
+
+class Job:
+    """
+    A rendering job, producing the parts of a Markdown document.
+    """
+
+    def __init__(self, key: Hashable, clock: Callable[[], float]):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = PENDING
+        self.parts: list[str] = []
+        # size of the parts, in bytes
+        self.size = 0
+        self.error: str | None = None
+        self.created_at = clock()
+        self.finished_at: float | None = None
+        self._changed = asyncio.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    @property
+    def markdown(self) -> str:
+        return "\n\n".join(self.parts)
+
+    async def follow(self) -> AsyncGenerator[str, None]:
+        """
+        Generate the parts of the document, including the ones already
+        rendered, until the job is finished.
+        Raises a RuntimeError if the job fails.
+        """
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(
+                    lambda: len(self.parts) > sent or self.finished
+                )
+            while sent < len(self.parts):
+                yield self.parts[sent]
+                sent += 1
+            if self.status == FAILED:
+                raise RuntimeError(self.error)
+            if self.status == DONE:
+                return
+
+    def to_json(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "parts": len(self.parts),
+            "error": self.error,
+            "markdown": self.markdown if self.status == DONE else None,
+        }
+
+    async def _update(self, status: str | None = None, part: str | None = None):
+        async with self._changed:
+            if part is not None:
+                self.parts.append(part)
+                self.size += len(part.encode("utf-8"))
+            if status is not None:
+                self.status = status
+            self._changed.notify_all()
+
+
+class RenderJobs:
+    """
+    Pool of rendering jobs, at most `workers` of them running at once and
+    `max_jobs` of them unfinished. Finished jobs are kept for `retention`
+    seconds, keeping at most `max_finished` of them and `max_finished_bytes`
+    of rendered Markdown (oldest jobs are dropped first). `on_done` is called
+    with each successfully finished job.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: int,
+        max_jobs: int,
+        retention: float,
+        max_finished: int = 256,
+        max_finished_bytes: int = 64 * 1024 * 1024,
+        on_done: Callable[[Job], None] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_jobs = max_jobs
+        self.retention = retention
+        self.max_finished = max_finished
+        self.max_finished_bytes = max_finished_bytes
+        self.on_done = on_done
+        self.clock = clock
+        self._workers = asyncio.Semaphore(workers)
+        self._jobs: dict[str, Job] = {}
+        # latest job for each key
+        self._by_key: dict[Hashable, Job] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def get(self, job_id: str) -> Job | None:
+        self._purge()
+        return self._jobs.get(job_id)
+
+    def submit(self, key: Hashable, render: Callable[[], AsyncIterator[str]]) -> Job:
+        """
+        Start a job generating a document with `render`, unless a job for
+        the same key is already running or has finished successfully.
+        """
+        self._purge()
+        job = self._by_key.get(key)
+        if job is not None and job.status != FAILED:
+            return job
+        if sum(not other.finished for other in self._jobs.values()) >= self.max_jobs:
+            raise TooManyJobs()
+        job = Job(key, self.clock)
+        self._jobs[job.id] = job
+        self._by_key[key] = job
+        task = asyncio.create_task(self._run(job, render))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: Job, render: Callable[[], AsyncIterator[str]]):
+        try:
+            async with self._workers:
+                await job._update(status=RUNNING)
+                async for part in render():
+                    await job._update(part=part)
+        except asyncio.CancelledError:
+            # e.g. at shutdown: do not leave followers waiting
+            logger.warning("Rendering job %s was cancelled", job.key)
+            await self._finish(job, FAILED, error="cancelled")
+            raise
+        except Exception as e:
+            logger.warning("Rendering job %s failed: %r", job.key, e)
+            await self._finish(job, FAILED, error=str(e))
+            return
+        await self._finish(job, DONE)
+        if self.on_done is not None:
+            self.on_done(job)
+
+    async def _finish(self, job: Job, status: str, *, error: str | None = None):
+        job.error = error
+        job.finished_at = self.clock()
+        await job._update(status=status)
+        self._purge()
+
+    def _purge(self):
+        """
+        Drop finished jobs older than the retention delay, then the oldest
+        ones while there are too many of them.
+        """
+        now = self.clock()
+        finished = sorted(
+            (job for job in self._jobs.values() if job.finished_at is not None),
+            key=lambda job: job.finished_at or 0,
+        )
+        count, size = len(finished), sum(job.size for job in finished)
+        for job in finished:
+            assert job.finished_at is not None
+            if (
+                now - job.finished_at <= self.retention
+                and count <= self.max_finished
+                and size <= self.max_finished_bytes
+            ):
+                break
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+            count -= 1
+            size -= job.size
@@ -0,0 +1,153 @@
+"""
+In-memory cache of rendered Markdown for the web viewer.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass
+
+from catleg.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    markdown: str
+    size: int
+    expires_at: float
+
+
+class RenderCache:
+    """
+    LRU cache of rendered Markdown, bounded by the total size (in bytes)
+    of the cached renderings.
+
+    Entries are fresh for `ttl` seconds. For `stale_ttl` more seconds, they
+    are still served (stale-while-revalidate) while a background task
+    renders them again.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_bytes: int,
+        ttl: float,
+        stale_ttl: float = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self.size = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        # pending renderings, by key
+        self._pending: dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        """Ratio of lookups served from the cache (fresh or stale)"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return (self.hits + self.stale_hits) / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
+
+    def get(
+        self, key: Hashable, render: Callable[[], Awaitable[str]] | None = None
+    ) -> str | None:
+        """
+        Return the cached rendering for `key`, or None if it is missing or
+        expired. If the rendering is stale, `render` (if given) is run
+        in the background to refresh it.
+        """
+        entry = self._entries.get(key)
+        now = self.clock()
+        if entry is None or now >= entry.expires_at + self.stale_ttl:
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache="render", result="miss")
+            return None
+        self._entries.move_to_end(key)
+        if now < entry.expires_at:
+            self.hits += 1
+            CACHE_LOOKUPS.inc(cache="render", result="hit")
+        else:
+            self.stale_hits += 1
+            CACHE_LOOKUPS.inc(cache="render", result="stale")
+            if render is not None and key not in self._pending:
+                logger.debug("Refreshing stale rendering of %s", key)
+                self._render(key, render)
+        return entry.markdown
+
+    async def get_or_render(
+        self, key: Hashable, render: Callable[[], Awaitable[str]]
+    ) -> str:
+        """
+        Return the cached rendering for `key`, rendering it with `render`
+        if needed. Concurrent renderings of the same key are coalesced.
+        """
+        markdown = self.get(key, render)
+        if markdown is not None:
+            return markdown
+        pending = self._pending.get(key) or self._render(key, render)
+        return await asyncio.shield(pending)
+
+    def put(self, key: Hashable, markdown: str):
+        """
+        Store a rendering, evicting the least recently used ones if needed.
+        Renderings larger than the cache are not stored.
+        """
+        self._discard(key)
+        size = len(markdown.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._entries[key] = _Entry(markdown, size, self.clock() + self.ttl)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def _discard(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def _render(
+        self, key: Hashable, render: Callable[[], Awaitable[str]]
+    ) -> asyncio.Future:
+        async def render_and_store():
+            markdown = await render()
+            self.put(key, markdown)
+            return markdown
+
+        pending = asyncio.ensure_future(render_and_store())
+        self._pending[key] = pending
+        pending.add_done_callback(lambda fut: self._render_done(key, fut))
+        return pending
+
+    def _render_done(self, key: Hashable, fut: asyncio.Future):
+        del self._pending[key]
+        if not fut.cancelled() and fut.exception() is not None:
+            logger.warning("Could not render %s: %r", key, fut.exception())